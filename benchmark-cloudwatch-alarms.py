@@ -0,0 +1,1022 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the CloudWatch alarm deployment scripts.
+
+AWS is replaced by botocore Stubbers that answer from a synthetic inventory
+after a fixed per-call latency, so runs are repeatable and need no account.
+"""
+
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+import boto3
+import yaml
+from botocore.awsrequest import AWSResponse
+from botocore.hooks import first_non_none_response
+from botocore.stub import Stubber
+
+ACCOUNT_ID = '123456789012'
+REGION = 'us-east-1'
+INLINE_TEMPLATE_LIMIT = 51200
+SNS_TOPIC = f'arn:aws:sns:{REGION}:{ACCOUNT_ID}:benchmark'
+
+
+def load_script(filename: str, module_name: str):
+    """Import one of the hyphenated scripts in this directory as a module"""
+    
+    spec = importlib.util.spec_from_file_location(module_name, filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class SyntheticError(Exception):
+    """Raised by a responder to answer a call with an AWS error"""
+    
+    def __init__(self, code: str, message: str, status: int = 400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+class SyntheticStubber(Stubber):
+    """Stubber that answers every call from a responder after a fixed delay.
+    
+    The stock Stubber replays a FIFO queue, which breaks as soon as calls run
+    concurrently. Here each response is computed from the operation name and
+    parameters, so any number of threads can share one stubbed client. The
+    Stubber answers before botocore's retry loop, so error responses are run
+    through the client's needs-retry handlers here, as the endpoint would.
+    """
+    
+    def __init__(self, client, responder: Callable[[str, dict], dict], latency: float,
+                 throttle_ratio: float = 0.0):
+        super().__init__(client)
+        self.responder = responder
+        self.latency = latency
+        self.throttle_ratio = throttle_ratio
+        self.calls = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+    
+    def _assert_expected_params(self, model, params, context, **kwargs):
+        # before-call only sees the serialized request, so keep the API params
+        context['synthetic_params'] = params
+    
+    def _get_response_handler(self, model, params, context, **kwargs):
+        event = f'needs-retry.{model.service_model.service_id.hyphenize()}.{model.name}'
+        attempts = 1
+        while True:
+            http, parsed = self._respond(model, context)
+            if http.status_code < 300:
+                break
+            delay = first_non_none_response(self.client.meta.events.emit(
+                event, response=(http, parsed), endpoint=None, operation=model, attempts=attempts,
+                caught_exception=None, request_dict={'context': context}))
+            if delay is None or delay is False:
+                break
+            time.sleep(delay)
+            attempts += 1
+        parsed.setdefault('ResponseMetadata', {})['RetryAttempts'] = attempts - 1
+        return http, parsed
+    
+    def _respond(self, model, context):
+        throttle = random.random() < self.throttle_ratio
+        with self._lock:
+            self.calls += 1
+            self.throttled += throttle
+        time.sleep(self.latency)
+        try:
+            if throttle:
+                raise SyntheticError('Throttling', 'Rate exceeded')
+            return AWSResponse(None, 200, {}, None), self.responder(model.name, context['synthetic_params'])
+        except SyntheticError as e:
+            return AWSResponse(None, e.status, {}, None), {
+                'Error': {'Code': e.code, 'Message': e.message},
+                'ResponseMetadata': {'HTTPStatusCode': e.status},
+            }
+
+
+class SyntheticInventory:
+    """N resources per service, a share of them tagged with the filter tag"""
+    
+    def __init__(self, count: int, match_ratio: float, tag_key: str, tag_value: str):
+        self.count = count
+        self.tag_key = tag_key
+        self.tag_value = tag_value
+        matching = int(count * match_ratio)
+        self.tags = {i: ({tag_key: tag_value} if i < matching else {tag_key: 'other'})
+                     for i in range(count)}
+        self.retagged = {}
+    
+    def retag(self, name: str, tags: Dict[str, str]):
+        """Give one resource, e.g. opensearch-7, its own tags"""
+        
+        self.retagged[name] = tags
+    
+    def _tags_for(self, name: str) -> Dict[str, str]:
+        if name in self.retagged:
+            return self.retagged[name]
+        return self.tags[int(name.rsplit('-', 1)[1])]
+    
+    def _tag_list(self, name: str):
+        return [{'Key': k, 'Value': v} for k, v in self._tags_for(name).items()]
+    
+    def arns(self):
+        """Tagging API view of the inventory: (ARN, tags) for every resource"""
+        
+        prefix = f'{REGION}:{ACCOUNT_ID}'
+        for i in range(self.count):
+            yield from (
+                (f'arn:aws:eks:{prefix}:cluster/eks-{i}', self._tags_for(f'eks-{i}')),
+                (f'arn:aws:es:{prefix}:domain/opensearch-{i}', self._tags_for(f'opensearch-{i}')),
+                (f'arn:aws:kafka:{prefix}:cluster/kafka-{i}/5c1e6f0a-{i}', self._tags_for(f'kafka-{i}')),
+                (f'arn:aws:mq:{prefix}:broker:broker-{i}:mq-{i}', self._tags_for(f'mq-{i}')),
+                (f'arn:aws:wafv2:{prefix}:regional/webacl/wafv2-{i}/4b2f', self._tags_for(f'wafv2-{i}')),
+                (f'arn:aws:rds:{prefix}:cluster:docdb-{i}', self._tags_for(f'docdb-{i}')),
+                (f'arn:aws:elasticloadbalancing:{prefix}:loadbalancer/app/elbv2-{i}/0f1e2d3c',
+                 self._tags_for(f'elbv2-{i}')),
+            )
+    
+    def _get_resources(self, params: dict) -> dict:
+        wanted = {(f['Key'], v) for f in params.get('TagFilters', []) for v in f['Values']}
+        types = [t.split(':')[0] for t in params.get('ResourceTypeFilters', [])]
+        matches = [{'ResourceARN': arn, 'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]}
+                   for arn, tags in self.arns()
+                   if wanted <= set(tags.items()) and (not types or arn.split(':')[2] in types)]
+        page, token = self._page(matches, params.get('PaginationToken'), params.get('ResourcesPerPage'))
+        return {'ResourceTagMappingList': page, 'PaginationToken': token or ''}
+    
+    @staticmethod
+    def _page(items: list, token, size: int):
+        """Slice one page of a listing; returns (page, next token or None)"""
+        
+        start = int(token or 0)
+        end = start + (size or 100)
+        return items[start:end], (str(end) if end < len(items) else None)
+    
+    def respond(self, service: str, operation: str, params: dict) -> dict:
+        names = [f'{service}-{i}' for i in range(self.count)]
+        
+        if operation == 'GetCallerIdentity':
+            return {'Account': ACCOUNT_ID}
+        if operation == 'GetResources':
+            return self._get_resources(params)
+        if service == 'eks':
+            if operation == 'ListClusters':
+                page, token = self._page(names, params.get('nextToken'), params.get('maxResults'))
+                return {'clusters': page, **({'nextToken': token} if token else {})}
+            return {'cluster': {'name': params['name'], 'tags': self._tags_for(params['name'])}}
+        if service == 'opensearch':
+            if operation == 'ListDomainNames':
+                return {'DomainNames': [{'DomainName': n} for n in names]}
+            return {'TagList': self._tag_list(params['ARN'].rsplit('/', 1)[1])}
+        if service == 'kafka':
+            page, token = self._page(names, params.get('NextToken'), params.get('MaxResults'))
+            return {'ClusterInfoList': [{'ClusterName': n, 'Tags': self._tags_for(n)} for n in page],
+                    **({'NextToken': token} if token else {})}
+        if service == 'mq':
+            if operation == 'ListBrokers':
+                page, token = self._page(names, params.get('NextToken'), params.get('MaxResults'))
+                return {'BrokerSummaries': [{'BrokerId': n} for n in page], **({'NextToken': token} if token else {})}
+            return {'Tags': self._tags_for(params['BrokerId'])}
+        if service == 'wafv2':
+            if operation == 'ListWebACLs':
+                page, token = self._page(names, params.get('NextMarker'), params.get('Limit'))
+                return {'WebACLs': [{'Name': n, 'ARN': f'arn:aws:wafv2:{REGION}:{ACCOUNT_ID}:regional/webacl/{n}'}
+                                    for n in page],
+                        **({'NextMarker': token} if token else {})}
+            return {'TagInfoForResource': {'TagList': self._tag_list(params['ResourceARN'].rsplit('/', 1)[1])}}
+        if service == 'docdb':
+            if operation == 'DescribeDBClusters':
+                page, token = self._page(names, params.get('Marker'), params.get('MaxRecords'))
+                return {'DBClusters': [{'DBClusterIdentifier': n,
+                                        'DBClusterArn': f'arn:aws:rds:{REGION}:{ACCOUNT_ID}:cluster:{n}'}
+                                       for n in page],
+                        **({'Marker': token} if token else {})}
+            return {'TagList': self._tag_list(params['ResourceName'].rsplit(':', 1)[1])}
+        if service == 'elbv2':
+            if operation == 'DescribeLoadBalancers':
+                page, token = self._page(names, params.get('Marker'), params.get('PageSize'))
+                return {'LoadBalancers': [
+                    {'LoadBalancerName': n, 'Type': 'application',
+                     'LoadBalancerArn': f'arn:aws:elasticloadbalancing:{REGION}:{ACCOUNT_ID}:loadbalancer/app/{n}/0f1e2d3c'}
+                    for n in page],
+                    **({'NextMarker': token} if token else {})}
+            arn = params['ResourceArns'][0]
+            return {'TagDescriptions': [{'ResourceArn': arn, 'Tags': self._tag_list(arn.split('/')[2])}]}
+        raise NotImplementedError(f'{service}.{operation}')
+
+
+class SyntheticAccount:
+    """A synthetic inventory plus in-memory CloudFormation and S3.
+    
+    Stacks report *_IN_PROGRESS until stack_seconds after they were submitted,
+    then *_COMPLETE. Stack tags, templates and S3 objects persist, so a second
+    deploy of the same fleet sees unchanged stacks and existing template objects.
+    """
+    
+    def __init__(self, inventory: SyntheticInventory, stack_seconds: float):
+        self.inventory = inventory
+        self.stack_seconds = stack_seconds
+        self.stacks = {}
+        self.stack_writes = 0
+        self.reject = set()  # Stack names whose next CreateStack/UpdateStack fails
+        self.objects = {}
+        self.refactors = {}
+        self._lock = threading.Lock()
+    
+    def _stack_view(self, stack: dict) -> dict:
+        settled = time.monotonic() - stack['submitted'] >= self.stack_seconds
+        return {
+            'StackName': stack['StackName'],
+            'StackId': stack['StackId'],
+            'CreationTime': stack['CreationTime'],
+            'StackStatus': f"{stack['operation']}_{'COMPLETE' if settled else 'IN_PROGRESS'}",
+            'Tags': stack['Tags'],
+            'Parameters': stack.get('Parameters', []),
+        }
+    
+    def _cloudformation(self, operation: str, params: dict) -> dict:
+        with self._lock:
+            name = params.get('StackName')
+            stack = self.stacks.get(name)
+            if operation == 'DescribeStacks':
+                if name is None:
+                    return {'Stacks': [self._stack_view(st) for st in self.stacks.values()]}
+                if stack is None:
+                    raise SyntheticError('ValidationError', f'Stack with id {name} does not exist')
+                return {'Stacks': [self._stack_view(stack)]}
+            if operation == 'ListStacks':
+                return {'StackSummaries': [
+                    {key: view[key] for key in ('StackName', 'StackId', 'CreationTime', 'StackStatus')}
+                    for view in map(self._stack_view, self.stacks.values())]}
+            if operation in ('CreateStack', 'UpdateStack'):
+                if name in self.reject:
+                    self.reject.discard(name)
+                    raise SyntheticError('ValidationError', f'Injected failure for {name}')
+                self.stack_writes += 1
+                self.stacks[name] = {
+                    'StackName': name,
+                    'StackId': f'arn:aws:cloudformation:{REGION}:{ACCOUNT_ID}:stack/{name}/{len(self.stacks)}',
+                    'CreationTime': stack['CreationTime'] if stack else datetime.datetime.now(datetime.timezone.utc),
+                    'operation': operation[:6].upper(),
+                    'submitted': time.monotonic(),
+                    'Tags': params.get('Tags', []),
+                    'Parameters': params.get('Parameters', []),
+                    'TemplateBody': params.get('TemplateBody') or self._object(params['TemplateURL']),
+                }
+                return {'StackId': self.stacks[name]['StackId']}
+            if operation == 'GetTemplate':
+                if stack is None:
+                    raise SyntheticError('ValidationError', f'Stack with id {name} does not exist')
+                return {'TemplateBody': stack['TemplateBody']}
+            if operation == 'DeleteStack':
+                self.stacks.pop(name, None)
+                return {}
+            if operation == 'DescribeStackEvents':
+                return {'StackEvents': []}
+            if operation == 'CreateStackRefactor':
+                return {'StackRefactorId': self._create_refactor(params)}
+            if operation == 'DescribeStackRefactor':
+                refactor = self.refactors[params['StackRefactorId']]
+                return {'StackRefactorId': params['StackRefactorId'], 'Status': 'CREATE_COMPLETE',
+                        'ExecutionStatus': 'EXECUTE_COMPLETE' if refactor['executed'] else 'AVAILABLE'}
+            if operation == 'ExecuteStackRefactor':
+                refactor = self.refactors[params['StackRefactorId']]
+                for name, body in refactor['templates'].items():
+                    existing = self.stacks.get(name)
+                    self.stacks[name] = dict(existing or {
+                        'StackName': name,
+                        'StackId': f'arn:aws:cloudformation:{REGION}:{ACCOUNT_ID}:stack/{name}/{len(self.stacks)}',
+                        'CreationTime': datetime.datetime.now(datetime.timezone.utc),
+                        'Tags': [],
+                    }, operation='UPDATE' if existing else 'CREATE', submitted=time.monotonic(), TemplateBody=body)
+                refactor['executed'] = True
+                return {}
+        raise NotImplementedError(f'cloudformation.{operation}')
+    
+    def _create_refactor(self, params: dict) -> str:
+        """Validate a stack refactor's mappings against the stacks as they stand"""
+        
+        templates = {d['StackName']: d.get('TemplateBody') or self._object(d['TemplateURL'])
+                     for d in params['StackDefinitions']}
+        for mapping in params['ResourceMappings']:
+            source, destination = mapping['Source'], mapping['Destination']
+            stack = self.stacks.get(source['StackName'])
+            if stack is None or source['LogicalResourceId'] not in json.loads(stack['TemplateBody'])['Resources']:
+                raise SyntheticError('ValidationError', f"No resource {source['LogicalResourceId']} in "
+                                                        f"{source['StackName']}")
+            if destination['StackName'] not in self.stacks and not params.get('EnableStackCreation'):
+                raise SyntheticError('ValidationError', f"Stack {destination['StackName']} does not exist")
+            if destination['LogicalResourceId'] not in json.loads(templates[destination['StackName']])['Resources']:
+                raise SyntheticError('ValidationError', f"{destination['LogicalResourceId']} missing from the "
+                                                        f"{destination['StackName']} definition")
+        refactor_id = f'refactor-{len(self.refactors)}'
+        self.refactors[refactor_id] = {'templates': templates, 'executed': False}
+        return refactor_id
+    
+    def _s3(self, operation: str, params: dict) -> dict:
+        with self._lock:
+            if operation == 'HeadObject' and (params['Bucket'], params['Key']) not in self.objects:
+                raise SyntheticError('404', 'Not Found', 404)
+            if operation == 'PutObject':
+                body = params['Body']
+                if hasattr(body, 'read'):
+                    body = body.read()
+                if isinstance(body, bytes):
+                    body = body.decode('utf-8')
+                self.objects[(params['Bucket'], params['Key'])] = body
+        return {}
+    
+    def _object(self, url: str) -> str:
+        host, _, key = url.split('://', 1)[1].partition('/')
+        return self.objects[(host.split('.s3.', 1)[0], key)]
+    
+    def respond(self, service: str, operation: str, params: dict) -> dict:
+        if service == 'cloudformation':
+            return self._cloudformation(operation, params)
+        if service == 's3':
+            return self._s3(operation, params)
+        return self.inventory.respond(service, operation, params)
+
+
+def install_stubbed_clients(deployer, inventory, latency: float,
+                            throttle_ratio: float = 0.0, throttle=None) -> Dict[str, SyntheticStubber]:
+    """Route the deployer's client creation to shared stubbed clients.
+    
+    inventory is a SyntheticInventory or SyntheticAccount; throttle_ratio is the share of calls answered with a Throttling error;
+    throttle is an ApiThrottle to instrument the clients with.
+    """
+    
+    stubbers = {}
+    
+    def new_client(service_name, region=None, clients=None):
+        if service_name not in stubbers:
+            client = boto3.client(service_name, region_name=REGION, config=deployer.CLIENT_CONFIG,
+                                  aws_access_key_id='bench', aws_secret_access_key='bench')
+            stubber = SyntheticStubber(
+                client, lambda op, params, svc=service_name: inventory.respond(svc, op, params), latency,
+                throttle_ratio)
+            stubber.activate()
+            if throttle is not None:
+                throttle.instrument(client, 'bench')
+            stubbers[service_name] = stubber
+        return stubbers[service_name].client
+    
+    deployer._new_client = new_client
+    return stubbers
+
+
+def bench_discovery(args):
+    """Time discover_resources per service with serial and concurrent tag lookups"""
+    
+    deployer = load_script('deploy-cloudwatch-alarms.py', 'deploy_cloudwatch_alarms')
+    inventory = SyntheticInventory(args.resources, args.match_ratio, 'Environment', 'Production')
+    install_stubbed_clients(deployer, inventory, args.latency)
+    concurrency = dict(deployer.TAG_LOOKUP_CONCURRENCY)
+    
+    print(f"Discovery: {args.resources} resources/service, {args.latency * 1000:.0f}ms per call")
+    print(f"{'service':<12}{'serial':>10}{'parallel':>10}{'speedup':>9}")
+    for service in ['eks'] + deployer.RESOURCE_BASED_SERVICES:
+        timings = []
+        for limits in ({}, concurrency):
+            deployer.TAG_LOOKUP_CONCURRENCY = limits
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                found = deployer.discover_resources(service, REGION, 'Environment', 'Production')
+            timings.append(time.perf_counter() - start)
+        print(f"{service:<12}{timings[0]:>9.2f}s{timings[1]:>9.2f}s{timings[0] / timings[1]:>8.1f}x"
+              f"  ({len(found)} matched)")
+
+
+def bench_discovery_backends(args):
+    """Compare per-service discovery with one Resource Groups Tagging API pass"""
+    
+    deployer = load_script('deploy-cloudwatch-alarms.py', 'deploy_cloudwatch_alarms')
+    inventory = SyntheticInventory(args.resources, args.match_ratio, 'Environment', 'Production')
+    stubbers = install_stubbed_clients(deployer, inventory, args.latency)
+    services = ['eks'] + deployer.RESOURCE_BASED_SERVICES
+    
+    def api_calls():
+        return sum(stubber.calls for stubber in stubbers.values())
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        start, calls = time.perf_counter(), api_calls()
+        per_service = {s: deployer.discover_resources(s, REGION, 'Environment', 'Production') for s in services}
+        per_service_time, per_service_calls = time.perf_counter() - start, api_calls() - calls
+        
+        start, calls = time.perf_counter(), api_calls()
+        tagging_api = deployer.discover_resources_tagging_api(services, REGION, 'Environment', 'Production')
+        tagging_api_time, tagging_api_calls = time.perf_counter() - start, api_calls() - calls
+    
+    print(f"Discovery backends: {args.resources} resources/service, {args.latency * 1000:.0f}ms per call")
+    print(f"   per-service: {per_service_time:.2f}s, {per_service_calls} API calls")
+    print(f"   tagging-api: {tagging_api_time:.2f}s, {tagging_api_calls} API calls")
+    mismatched = [s for s in services if sorted(per_service[s]) != sorted(tagging_api[s])]
+    print(f"   results: {'identical' if not mismatched else 'differ for ' + ', '.join(mismatched)}")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def bench_suite(args):
+    """Replay a synthetic fleet through every deployment phase and record the timings"""
+    
+    deployer = load_script('deploy-cloudwatch-alarms.py', 'deploy_cloudwatch_alarms')
+    inventory = SyntheticInventory(args.resources, args.match_ratio, 'Environment', 'Production')
+    account = SyntheticAccount(inventory, args.stack_seconds)
+    stubbers = install_stubbed_clients(deployer, account, args.latency)
+    # Poll on the benchmark's time scale rather than CloudFormation's
+    deployer.WAIT_POLL_INITIAL = max(args.stack_seconds / 4, 0.05)
+    deployer.WAIT_POLL_MAX = max(args.stack_seconds, 0.05)
+    services = ['eks'] + deployer.RESOURCE_BASED_SERVICES
+    
+    phases, counts = {}, {}
+    
+    @contextlib.contextmanager
+    def phase(name):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+        phases[name] = round(time.perf_counter() - start, 4)
+    
+    def deploy():
+        scheduler = deployer.StackScheduler(args.max_parallel_stacks)
+        for stack_name, template in tag_based:
+            scheduler.submit(deployer.deploy_tag_based_alarms, stack_name, template, 'Environment', 'Production',
+                             SNS_TOPIC, REGION)
+        for cluster_name in discovered['eks']:
+            scheduler.submit(deployer.deploy_eks_ec2_alarms, cluster_name, SNS_TOPIC, REGION, 'Production')
+        for service, shards in plans.items():
+            for stack_name, shard_ids in shards:
+                scheduler.submit(deployer.deploy_resource_based_alarms, service, shard_ids, SNS_TOPIC, REGION,
+                                 'Production', stack_name)
+        return scheduler.results()
+    
+    with phase('discovery'):
+        discovered = {s: deployer.discover_resources(s, REGION, 'Environment', 'Production') for s in services}
+    with phase('generation'):
+        tag_based = deployer.plan_tag_based_stacks('Environment', 'Production', SNS_TOPIC, REGION)
+        plans = {s: deployer.plan_resource_shards(s, discovered[s], REGION) for s in deployer.RESOURCE_BASED_SERVICES}
+        for service, shards in plans.items():
+            for stack_name, shard_ids in shards:
+                deployer.generate_resource_based_template(service, shard_ids, 'Production')
+    with phase('submission'):
+        results = deploy()
+    with phase('wait'):
+        deployer.wait_for_stacks(results, REGION, timeout=args.stack_seconds * 10 + 60)
+    with phase('redeploy'):
+        redeploy_results = deploy()
+    
+    counts['resources_discovered'] = sum(len(ids) for ids in discovered.values())
+    counts['stacks'] = len(results)
+    counts['alarms'] = sum(r.alarm_count for r in results)
+    counts['failed'] = sum(r.status == 'failed' for r in results)
+    counts['redeploy_unchanged'] = sum(r.status == 'no-change' for r in redeploy_results)
+    counts['api_calls'] = sum(stubber.calls for stubber in stubbers.values())
+    report = {
+        'commit': _git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'parameters': {key: getattr(args, key) for key in
+                       ('resources', 'match_ratio', 'latency', 'stack_seconds', 'max_parallel_stacks')},
+        'phases': phases,
+        'counts': counts,
+    }
+    
+    print(f"Suite: {args.resources} resources/service across {len(services)} services, "
+          f"{args.latency * 1000:.0f}ms per call, stacks settle after {args.stack_seconds:g}s")
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"   compared with {baseline.get('commit', '?')} ({args.compare})")
+    for name, seconds in phases.items():
+        line = f"   {name:<12}{seconds:>9.2f}s"
+        if baseline and name in baseline.get('phases', {}) and baseline['phases'][name] > 0:
+            line += f"{(seconds / baseline['phases'][name] - 1):>+9.0%}"
+        print(line)
+    print("   " + ", ".join(f"{key}={value}" for key, value in counts.items()))
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"   results written to {args.output}")
+
+
+def bench_throttling(args):
+    """Discover every service concurrently while the stub throttles a share of calls"""
+    
+    deployer = load_script('deploy-cloudwatch-alarms.py', 'deploy_cloudwatch_alarms')
+    inventory = SyntheticInventory(args.resources, args.match_ratio, 'Environment', 'Production')
+    services = ['eks'] + deployer.RESOURCE_BASED_SERVICES
+    expected = int(args.resources * args.match_ratio) * len(services)
+    
+    print(f"Throttling: {args.resources} resources/service, {args.throttle_ratio:.0%} of calls throttled, "
+          f"{args.latency * 1000:.0f}ms per call")
+    for label, retries in (('no retry', 0), ('throttle', deployer.THROTTLE_MAX_RETRIES)):
+        throttle = deployer.ApiThrottle(max_retries=retries, backoff_base=args.backoff_base)
+        stubbers = install_stubbed_clients(deployer, inventory, args.latency, args.throttle_ratio, throttle)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=len(services)) as pool:
+            found = sum(len(ids) for ids in pool.map(
+                lambda service: deployer.discover_resources(service, REGION, 'Environment', 'Production'),
+                services))
+        elapsed = time.perf_counter() - start
+        injected = sum(stubber.throttled for stubber in stubbers.values())
+        print(f"\n{label}: {elapsed:.2f}s, {found}/{expected} resources found, {injected} throttling errors injected")
+        for operation, stats in sorted(throttle.stats.items()):
+            print(f"   {operation:<32}{stats['calls']:>6} calls{stats['rate_wait']:>8.2f}s rate-limited"
+                  f"{stats['throttled']:>6} retried{stats['backoff_wait']:>8.2f}s backoff")
+
+
+def bench_generation(args):
+    """Time template generation per service: CLI subprocess vs in-process library"""
+    
+    generator = load_script('generate-resource-alarms.py', 'generate_resource_alarms')
+    resource_ids = [f'resource-{i}' for i in range(args.resources)]
+    
+    print(f"Generation: {args.resources} resources/service, best of {args.repeat}")
+    print(f"{'service':<12}{'subprocess':>12}{'in-process':>12}{'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'template.yaml')
+        for service in generator.SERVICES:
+            # The old deployer path: spawn the CLI, then read its output file back
+            cmd = [sys.executable, 'generate-resource-alarms.py', '--service', service,
+                   '--tag-value', 'Production', '--output', output, '--resources'] + resource_ids
+            subprocess_times, inprocess_times = [], []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                subprocess.run(cmd, capture_output=True, text=True, check=True)
+                with open(output, 'r', encoding='utf-8') as f:
+                    subprocess_body = f.read()
+                subprocess_times.append(time.perf_counter() - start)
+                
+                start = time.perf_counter()
+                inprocess_body = generator.render_template(
+                    generator.build_template(service, resource_ids, 'Production', generator.load_compiled()))
+                inprocess_times.append(time.perf_counter() - start)
+            
+            assert subprocess_body == inprocess_body, f'{service}: outputs differ'
+            best_sub, best_in = min(subprocess_times), min(inprocess_times)
+            print(f"{service:<12}{best_sub * 1000:>10.1f}ms{best_in * 1000:>10.1f}ms{best_sub / best_in:>8.1f}x")
+
+
+def bench_generation_large(args):
+    """Render one very large fleet with each serialization backend"""
+    
+    generator = load_script('generate-resource-alarms.py', 'generate_resource_alarms')
+    config = generator.load_compiled()
+    resource_ids = [f'{args.service}-resource-{i:05d}' for i in range(args.resources)]
+    
+    def pure_python_yaml(f):
+        # The original path: build the dict, then PyYAML's pure-Python dumper
+        template = generator.build_template(args.service, resource_ids, 'Production', config)
+        f.write(yaml.dump(template, default_flow_style=False, allow_unicode=True, sort_keys=False))
+    
+    def in_memory(output_format):
+        def render(f):
+            template = generator.build_template(args.service, resource_ids, 'Production', config)
+            f.write(generator.render_template(template, output_format))
+        return render
+    
+    def streamed(output_format):
+        return lambda f: generator.write_template(f, args.service, resource_ids, 'Production', output_format, config)
+    
+    backends = [
+        ('yaml, pure-Python dumper', pure_python_yaml),
+        (f'yaml, {generator.YAML_DUMPER.__name__}', in_memory('yaml')),
+        ('yaml, streamed', streamed('yaml')),
+        ('json, in memory', in_memory('json')),
+        ('json, streamed', streamed('json')),
+        ('compact json', streamed('compact')),
+    ]
+    if args.skip_pure_python:
+        backends = backends[1:]
+    
+    alarms = args.resources * len(config['services'][args.service]['alarms'])
+    print(f"Large fleet: {args.service}, {args.resources:,} resources, {alarms:,} alarms")
+    print(f"{'backend':<28}{'time':>9}{'peak memory':>13}{'size':>14}")
+    outputs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, render in backends:
+            output = os.path.join(tmp, 'template')
+            start = time.perf_counter()
+            with open(output, 'w', encoding='utf-8') as f:
+                render(f)
+            elapsed = time.perf_counter() - start
+            
+            peak = '-'
+            if args.trace_memory:
+                # Separate pass: tracing allocations would distort the timing
+                tracemalloc.start()
+                with open(os.devnull, 'w', encoding='utf-8') as f:
+                    render(f)
+                peak = f'{tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f}MB'
+                tracemalloc.stop()
+            
+            with open(output, 'r', encoding='utf-8') as f:
+                outputs[name] = f.read()
+            print(f"{name:<28}{elapsed:>8.2f}s{peak:>13}{len(outputs[name].encode('utf-8')):>14,}")
+    
+    yaml_outputs = {outputs[name] for name in outputs if name.startswith('yaml')}
+    json_outputs = {outputs[name] for name in outputs if name.startswith('json')}
+    if len(yaml_outputs) > 1 or len(json_outputs) > 1:
+        sys.exit("Backends of the same format produced different output")
+    print("   output: identical across backends of each format")
+
+
+def bench_template_size(args):
+    """Template bytes as YAML, minified JSON and compacted JSON, with an equivalence check"""
+    
+    generator = load_script('generate-resource-alarms.py', 'generate_resource_alarms')
+    with open('cloudformation-tag-based-alarms.yaml', 'r', encoding='utf-8', errors='ignore') as f:
+        templates = [('tag-based', yaml.safe_load(f))]
+    for service in generator.SERVICES:
+        resource_ids = [f'{service}-resource-{i:03d}' for i in range(args.resources)]
+        templates.append((service, generator.build_template(service, resource_ids, 'Production')))
+    
+    print(f"Template size: tag-based template and {args.resources} resources/service; "
+          f"inline limit {INLINE_TEMPLATE_LIMIT:,} bytes")
+    print(f"{'template':<12}{'yaml':>10}{'minified':>10}{'compact':>10}{'saved':>8}  inline  equivalent")
+    mismatched = []
+    for name, template in templates:
+        yaml_size = len(generator.render_template(template).encode('utf-8'))
+        minified_size = len(json.dumps(template, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        compact = generator.render_compact(template)
+        compact_size = len(compact.encode('utf-8'))
+        equivalent = generator.expand_template(json.loads(compact)) == template
+        if not equivalent:
+            mismatched.append(name)
+        print(f"{name:<12}{yaml_size:>10,}{minified_size:>10,}{compact_size:>10,}"
+              f"{1 - compact_size / yaml_size:>8.0%}  {'yes' if compact_size <= INLINE_TEMPLATE_LIMIT else 'no':<6}  "
+              f"{'yes' if equivalent else 'NO'}")
+    if mismatched:
+        sys.exit(f"Compacted templates differ from the originals: {', '.join(mismatched)}")
+
+
+def bench_consolidation(args):
+    """Alarms and template bytes per service: one alarm per resource vs GROUP BY consolidation"""
+    
+    generator = load_script('generate-resource-alarms.py', 'generate_resource_alarms')
+    config = generator.load_compiled()
+    modes = [None] + generator.CONSOLIDATE_MODES
+    
+    print(f"Consolidation: {args.resources} resources/service; alarms / compact template bytes")
+    print(f"{'service':<12}" + ''.join(f"{mode or 'per-resource':>22}" for mode in modes))
+    uncovered = []
+    for service in generator.SERVICES:
+        resource_ids = [f'{service}-resource-{i:05d}' for i in range(args.resources)]
+        cells = []
+        for mode in modes:
+            template = generator.build_template(service, resource_ids, 'Production', config, mode, 'Environment')
+            alarms = template['Resources'].values()
+            expressions = [alarm['Properties']['Metrics'][0]['Expression'] for alarm in alarms]
+            if max(len(e) for e in expressions) > generator.MAX_EXPRESSION_LENGTH:
+                uncovered.append(f'{service} {mode}: query too long')
+            if mode == 'dimension':
+                # Every resource appears in exactly one group of every metric
+                covered = [rid for e in expressions[::len(config['services'][service]['alarms'])]
+                           for rid in resource_ids if f"'{rid}'" in e]
+                if sorted(covered) != sorted(resource_ids):
+                    uncovered.append(f'{service} {mode}: resources missing or repeated')
+            size = len(generator.render_compact(template).encode('utf-8'))
+            cells.append(f"{len(template['Resources']):>10,} / {size:>9,}")
+        print(f"{service:<12}" + ''.join(f"{cell:>22}" for cell in cells))
+    if uncovered:
+        sys.exit('; '.join(uncovered))
+
+
+def bench_fleet_change(args):
+    """Stack changes when one resource joins the middle of a fleet"""
+    
+    generator = load_script('generate-resource-alarms.py', 'generate_resource_alarms')
+    digest = generator.LOGICAL_ID_DIGEST
+    
+    def counter_ids(template):
+        # The former scheme: the spec's prefix plus a running alarm counter
+        return {f'{name[:-digest]}{i}': alarm for i, (name, alarm) in enumerate(template['Resources'].items())}
+    
+    def changes(before, after):
+        return sum(name not in before or before[name] != alarm for name, alarm in after.items()) + \
+            sum(name not in after for name in before)
+    
+    resource_ids = [f'{args.service}-resource-{i:05d}' for i in range(args.resources)]
+    changed_ids = resource_ids[:args.resources // 2] + ['added-resource'] + resource_ids[args.resources // 2:]
+    before = generator.build_template(args.service, resource_ids, 'Production')
+    after = generator.build_template(args.service, changed_ids, 'Production')
+    added = len(after['Resources']) - len(before['Resources'])
+    
+    print(f"Fleet change: one {args.service} resource added to the middle of {args.resources}")
+    print(f"   alarm resources changed: {changes(counter_ids(before), counter_ids(after)):,} with counter IDs, "
+          f"{changes(before['Resources'], after['Resources']):,} with stable IDs ({added} new alarms)")
+
+
+def bench_lint(args):
+    """Time the offline linter on every template the deployer submits"""
+    
+    generator = load_script('generate-resource-alarms.py', 'generate_resource_alarms')
+    parameters = [{'ParameterKey': 'SNSTopicArn', 'ParameterValue': SNS_TOPIC}]
+    templates = []
+    for filename, extra in (
+            ('cloudformation-tag-based-alarms.yaml', {'TagKey': 'Environment', 'TagValue': 'Production'}),
+            ('cloudformation-eks-ec2-alarms.yaml', {'EKSClusterName': 'bench', 'BusinessTagValue': 'Production'})):
+        with open(filename, 'r', encoding='utf-8', errors='ignore') as f:
+            templates.append((filename.split('-alarms')[0][len('cloudformation-'):], yaml.safe_load(f),
+                              parameters + [{'ParameterKey': k, 'ParameterValue': v} for k, v in extra.items()]))
+    for service in generator.SERVICES:
+        resource_ids = [f'{service}-resource-{i:05d}' for i in range(args.resources)]
+        templates.append((service, generator.build_template(service, resource_ids, 'Production'), parameters))
+    
+    print(f"Lint: {args.resources} resources/service, best of {args.repeat} (resource limit not applied)")
+    print(f"{'template':<12}{'alarms':>8}{'time':>10}{'per alarm':>11}  problems")
+    failed = []
+    for name, template, template_parameters in templates:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            problems = generator.lint_template(template, template_parameters, max_resources=None)
+            timings.append(time.perf_counter() - start)
+        alarms = len(template['Resources'])
+        print(f"{name:<12}{alarms:>8,}{min(timings) * 1000:>8.1f}ms{min(timings) / alarms * 1e6:>9.1f}us  "
+              f"{len(problems)}")
+        if problems:
+            failed.append(f"{name}: {problems[0]}")
+    if failed:
+        sys.exit('; '.join(failed))
+
+
+def bench_tag_split(args):
+    """Redis threshold change: one tag-based stack vs the per-service split (bytes submitted, stacks written)"""
+    
+    deployer = load_script('deploy-cloudwatch-alarms.py', 'deploy_cloudwatch_alarms')
+    generator = deployer._generator()
+    with open('cloudformation-tag-based-alarms.yaml', 'r', encoding='utf-8', errors='ignore') as f:
+        template = yaml.load(f, Loader=generator.YAML_LOADER)
+    
+    def changed(template):
+        redis = next(name for name in template['Resources'] if name.startswith('Redis'))
+        resource = template['Resources'][redis]
+        properties = dict(resource['Properties'], Threshold=resource['Properties']['Threshold'] + 1)
+        return dict(template, Resources=dict(template['Resources'], **{redis: dict(resource, Properties=properties)}))
+    
+    def submitted(before, after):
+        """Bytes of every template whose rendered content changed"""
+        
+        start = time.perf_counter()
+        bodies = [(generator.render_compact(old), generator.render_compact(new)) for old, new in zip(before, after)]
+        elapsed = time.perf_counter() - start
+        written = [new for old, new in bodies if old != new]
+        return len(written), sum(len(body.encode('utf-8')) for body in written), elapsed
+    
+    split = deployer.split_tag_based_template
+    rows = [
+        ('single stack', [template], [changed(template)]),
+        ('per-service', list(split(template).values()), list(split(changed(template)).values())),
+    ]
+    limit = deployer.MAX_TEMPLATE_BODY_BYTES
+    print(f"Tag-based alarms, one Redis threshold changed ({len(template['Resources'])} alarms, "
+          f"inline limit {limit:,} bytes)")
+    print(f"{'':<14}{'stacks':>8}{'written':>9}{'bytes written':>15}{'largest':>10}{'render':>10}")
+    for label, before, after in rows:
+        stacks, size, elapsed = submitted(before, after)
+        largest = max(len(generator.render_compact(t).encode('utf-8')) for t in after)
+        print(f"{label:<14}{len(after):>8}{stacks:>9}{size:>15,}{largest:>10,}{elapsed * 1000:>8.1f}ms")
+
+
+def bench_resume(args):
+    """One resource-based stack fails in a --mode all --wait run: full rerun vs --resume"""
+    
+    deployer = load_script('deploy-cloudwatch-alarms.py', 'deploy_cloudwatch_alarms')
+    deployer.WAIT_POLL_INITIAL = deployer.WAIT_POLL_MAX = args.stack_seconds / 2
+    tmp = tempfile.mkdtemp()
+    deployer.RUN_JOURNAL_FILE = os.path.join(tmp, 'run-journal.json')
+    
+    def run(account, stubbers, *argv):
+        sys.argv = ['deploy-cloudwatch-alarms.py', '--mode', 'all', '--wait', *argv, '--sns-topic', SNS_TOPIC]
+        calls = sum(stubber.calls for stubber in stubbers.values())
+        writes = account.stack_writes
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                deployer.main()
+            except SystemExit:
+                pass
+        return (time.perf_counter() - start, sum(stubber.calls for stubber in stubbers.values()) - calls,
+                account.stack_writes - writes)
+    
+    def failed_run():
+        inventory = SyntheticInventory(args.resources, args.match_ratio, 'Environment', 'Production')
+        account = SyntheticAccount(inventory, args.stack_seconds)
+        stubbers = install_stubbed_clients(deployer, account, args.latency)
+        deployer._S3_READY_BUCKETS.clear()
+        deployer._S3_UPLOADED_KEYS.clear()
+        account.reject.add('kafka-alarms')
+        return account, stubbers, run(account, stubbers)
+    
+    print(f"Resume: {args.resources} resources/service, {args.latency * 1000:.0f}ms per call, "
+          f"stacks settle after {args.stack_seconds:g}s; kafka-alarms fails once")
+    print(f"{'':<20}{'time':>9}{'API calls':>11}{'stack writes':>14}")
+    account, stubbers, (elapsed, calls, writes) = failed_run()
+    print(f"{'failed run':<20}{elapsed:>8.2f}s{calls:>11}{writes:>14}")
+    elapsed, calls, writes = run(account, stubbers)
+    print(f"{'full rerun':<20}{elapsed:>8.2f}s{calls:>11}{writes:>14}")
+    account, stubbers, _ = failed_run()
+    elapsed, calls, writes = run(account, stubbers, '--resume')
+    print(f"{'--resume':<20}{elapsed:>8.2f}s{calls:>11}{writes:>14}")
+
+
+def bench_reconcile(args):
+    """One OpenSearch domain gets the filter tag: scheduled --mode all rescan vs reconcile from its event"""
+    
+    deployer = load_script('deploy-cloudwatch-alarms.py', 'deploy_cloudwatch_alarms')
+    deployer.WAIT_POLL_INITIAL = deployer.WAIT_POLL_MAX = args.stack_seconds / 2
+    tmp = tempfile.mkdtemp()
+    deployer.DISCOVERY_CACHE_FILE = os.path.join(tmp, 'discovery-cache.json')
+    deployer.RUN_JOURNAL_FILE = os.path.join(tmp, 'run-journal.json')
+    
+    def primed_account():
+        inventory = SyntheticInventory(args.resources, args.match_ratio, 'Environment', 'Production')
+        account = SyntheticAccount(inventory, args.stack_seconds)
+        stubbers = install_stubbed_clients(deployer, account, args.latency)
+        # A fresh account has an empty bucket
+        deployer._S3_READY_BUCKETS.clear()
+        deployer._S3_UPLOADED_KEYS.clear()
+        run(stubbers, '--mode', 'all', '--wait', '--discovery-cache-ttl', '3600', '--refresh-discovery')
+        # An untagged domain gets the filter tag
+        domain = f'opensearch-{args.resources - 1}'
+        inventory.retag(domain, {'Environment': 'Production'})
+        account.stack_writes = 0
+        return account, stubbers, domain
+    
+    def run(stubbers, *argv):
+        sys.argv = ['deploy-cloudwatch-alarms.py', *argv, '--sns-topic', SNS_TOPIC]
+        calls = sum(stubber.calls for stubber in stubbers.values())
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                deployer.main()
+            except SystemExit:
+                pass
+        return time.perf_counter() - start, sum(stubber.calls for stubber in stubbers.values()) - calls
+    
+    print(f"Reconcile: {args.resources} resources/service, {args.latency * 1000:.0f}ms per call, "
+          f"stacks settle after {args.stack_seconds:g}s; one OpenSearch domain tagged")
+    print(f"{'':<20}{'time':>9}{'API calls':>11}{'stack writes':>14}")
+    
+    account, stubbers, domain = primed_account()
+    elapsed, calls = run(stubbers, '--mode', 'all', '--wait')
+    print(f"{'--mode all rescan':<20}{elapsed:>8.2f}s{calls:>11}{account.stack_writes:>14}")
+    
+    account, stubbers, domain = primed_account()
+    events_file = os.path.join(tmp, 'events.jsonl')
+    with open(events_file, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'version': '0', 'detail-type': 'Tag Change on Resource', 'source': 'aws.tag',
+            'account': ACCOUNT_ID, 'region': REGION,
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'resources': [f'arn:aws:es:{REGION}:{ACCOUNT_ID}:domain/{domain}'],
+            'detail': {'changed-tag-keys': ['Environment'], 'service': 'es', 'resource-type': 'domain',
+                       'tags': {'Environment': 'Production'}},
+        }) + '\n')
+    spans = len(deployer.RUN_METRICS.spans)
+    elapsed, calls = run(stubbers, '--mode', 'reconcile', '--events-file', events_file,
+                         '--discovery-cache-ttl', '3600')
+    latency = [span['seconds'] for span in deployer.RUN_METRICS.spans[spans:] if span['phase'] == 'time-to-alarm']
+    print(f"{'reconcile':<20}{elapsed:>8.2f}s{calls:>11}{account.stack_writes:>14}"
+          f"   time to alarm {max(latency):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CloudWatch alarm deployment against stubbed AWS')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    
+    discovery = subparsers.add_parser('discovery', help='Serial vs concurrent tag lookups in discover_resources')
+    discovery.add_argument('--resources', type=int, default=100, help='Resources per service (default: 100)')
+    discovery.add_argument('--match-ratio', type=float, default=0.5,
+                           help='Share of resources carrying the filter tag (default: 0.5)')
+    discovery.add_argument('--latency', type=float, default=0.02, help='Seconds per API call (default: 0.02)')
+    discovery.set_defaults(func=bench_discovery)
+    
+    backends = subparsers.add_parser('discovery-backends',
+                                     help='Per-service discovery vs one Resource Groups Tagging API pass')
+    backends.add_argument('--resources', type=int, default=100, help='Resources per service (default: 100)')
+    backends.add_argument('--match-ratio', type=float, default=0.5,
+                          help='Share of resources carrying the filter tag (default: 0.5)')
+    backends.add_argument('--latency', type=float, default=0.02, help='Seconds per API call (default: 0.02)')
+    backends.set_defaults(func=bench_discovery_backends)
+    
+    suite = subparsers.add_parser('suite', help='Time discovery, generation, submission and wait for a '
+                                                'synthetic fleet and write the results as JSON')
+    suite.add_argument('--resources', type=int, default=50, help='Resources per service (default: 50)')
+    suite.add_argument('--match-ratio', type=float, default=0.5,
+                       help='Share of resources carrying the filter tag (default: 0.5)')
+    suite.add_argument('--latency', type=float, default=0.02, help='Seconds per API call (default: 0.02)')
+    suite.add_argument('--stack-seconds', type=float, default=1.0,
+                       help='Seconds a stack operation stays in progress (default: 1)')
+    suite.add_argument('--max-parallel-stacks', type=int, default=4,
+                       help='Stack deployment workers (default: 4)')
+    suite.add_argument('--output', default='benchmark-results.json',
+                       help='Results file (default: benchmark-results.json)')
+    suite.add_argument('--compare', metavar='RESULTS_JSON',
+                       help='Earlier results file to print per-phase changes against')
+    suite.set_defaults(func=bench_suite)
+    
+    throttling = subparsers.add_parser('throttling',
+                                       help='Resources lost to throttling without vs with the API throttle')
+    throttling.add_argument('--resources', type=int, default=40, help='Resources per service (default: 40)')
+    throttling.add_argument('--match-ratio', type=float, default=0.5,
+                            help='Share of resources carrying the filter tag (default: 0.5)')
+    throttling.add_argument('--latency', type=float, default=0.02, help='Seconds per API call (default: 0.02)')
+    throttling.add_argument('--throttle-ratio', type=float, default=0.1,
+                            help='Share of calls answered with a Throttling error (default: 0.1)')
+    throttling.add_argument('--backoff-base', type=float, default=0.05,
+                            help='First retry backoff in seconds, scaled down from the deployer default '
+                                 '(default: 0.05)')
+    throttling.set_defaults(func=bench_throttling)
+    
+    generation = subparsers.add_parser('generation', help='Template generation: subprocess vs in-process')
+    generation.add_argument('--resources', type=int, default=10, help='Resources per service (default: 10)')
+    generation.add_argument('--repeat', type=int, default=5, help='Runs per service, best is reported (default: 5)')
+    generation.set_defaults(func=bench_generation)
+    
+    large = subparsers.add_parser('generation-large',
+                                  help='Serialization backends and streaming for one very large fleet')
+    large.add_argument('--service', choices=['opensearch', 'kafka', 'rabbitmq', 'waf', 'docdb', 'alb'],
+                       default='waf', help='Service to generate (default: waf, 2 alarms per resource)')
+    large.add_argument('--resources', type=int, default=10000, help='Resources (default: 10000)')
+    large.add_argument('--skip-pure-python', action='store_true',
+                       help='Leave out the slow pure-Python YAML baseline')
+    large.add_argument('--trace-memory', action='store_true',
+                       help='Also measure peak memory in a second, traced pass (several times slower)')
+    large.set_defaults(func=bench_generation_large)
+    
+    template_size = subparsers.add_parser('template-size',
+                                          help='Template bytes per format and a compaction equivalence check')
+    template_size.add_argument('--resources', type=int, default=10, help='Resources per service (default: 10)')
+    template_size.set_defaults(func=bench_template_size)
+    
+    consolidation = subparsers.add_parser('consolidation',
+                                          help='Alarm count and template size with and without --consolidate')
+    consolidation.add_argument('--resources', type=int, default=200, help='Resources per service (default: 200)')
+    consolidation.set_defaults(func=bench_consolidation)
+    
+    fleet_change = subparsers.add_parser('fleet-change',
+                                         help='Alarm resources changed by a one-resource change')
+    fleet_change.add_argument('--service', choices=['opensearch', 'kafka', 'rabbitmq', 'waf', 'docdb', 'alb'],
+                              default='opensearch', help='Service (default: opensearch)')
+    fleet_change.add_argument('--resources', type=int, default=500, help='Resources in the fleet (default: 500)')
+    fleet_change.set_defaults(func=bench_fleet_change)
+    
+    lint = subparsers.add_parser('lint', help='Offline template linter time on every template')
+    lint.add_argument('--resources', type=int, default=200, help='Resources per service (default: 200)')
+    lint.add_argument('--repeat', type=int, default=5, help='Runs per template (default: 5)')
+    lint.set_defaults(func=bench_lint)
+    
+    resume = subparsers.add_parser('resume', help='Full rerun vs --resume after one stack failed')
+    resume.add_argument('--resources', type=int, default=50, help='Resources per service (default: 50)')
+    resume.add_argument('--match-ratio', type=float, default=0.5,
+                        help='Share of resources carrying the filter tag (default: 0.5)')
+    resume.add_argument('--latency', type=float, default=0.02, help='Seconds per API call (default: 0.02)')
+    resume.add_argument('--stack-seconds', type=float, default=1.0,
+                        help='Seconds a stack operation stays in progress (default: 1)')
+    resume.set_defaults(func=bench_resume)
+    
+    tag_split = subparsers.add_parser('tag-split', help='Tag-based template change: single stack vs per-service stacks')
+    tag_split.set_defaults(func=bench_tag_split)
+    
+    reconcile = subparsers.add_parser('reconcile', help='Full rescan vs event-driven reconcile for one new resource')
+    reconcile.add_argument('--resources', type=int, default=50, help='Resources per service (default: 50)')
+    reconcile.add_argument('--match-ratio', type=float, default=0.5,
+                           help='Share of resources carrying the filter tag (default: 0.5)')
+    reconcile.add_argument('--latency', type=float, default=0.02, help='Seconds per API call (default: 0.02)')
+    reconcile.add_argument('--stack-seconds', type=float, default=1.0,
+                           help='Seconds a stack operation stays in progress (default: 1)')
+    reconcile.set_defaults(func=bench_reconcile)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
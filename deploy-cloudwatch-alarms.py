@@ -9,29 +9,795 @@ Resource-Based Services (4): OpenSearch, Kafka, RabbitMQ, WAF
 
 import boto3
 import yaml
+from botocore.config import Config
+from botocore.exceptions import ClientError
 import sys
-import subprocess
 import os
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+import re
+import json
+import math
+import random
+import hashlib
+import importlib.util
+import threading
+import time
+import copy
+import datetime
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, Dict, Optional
+from dataclasses import dataclass, field
 
 # Service configuration
 TAG_BASED_SERVICES = ['ec2', 'rds-mysql', 'rds-postgres', 'redis', 'efs']
 RESOURCE_BASED_SERVICES = ['opensearch', 'kafka', 'rabbitmq', 'waf', 'docdb', 'alb']
 EKS_EC2_ALARM_COUNT = 11  # Number of alarms in cloudformation-eks-ec2-alarms.yaml
+# cloudformation-tag-based-alarms.yaml is deployed as one stack per metric
+# namespace: stack suffix -> (namespace, MonitoredServices output)
+TAG_BASED_STACKS = {
+    'ec2': ('AWS/EC2', 'EC2'),
+    'rds': ('AWS/RDS', 'RDS-MySQL, RDS-PostgreSQL'),
+    'redis': ('AWS/ElastiCache', 'ElastiCache-Redis'),
+    'efs': ('AWS/EFS', 'EFS'),
+}
+DEFAULT_MAX_PARALLEL_STACKS = 4
+MAX_STACK_RESOURCES = 500  # CloudFormation resource limit per stack
+MAX_TEMPLATE_BODY_BYTES = 51200  # Larger templates must be passed via S3
+LINT_PROBLEMS_SHOWN = 10  # Lint problems printed before a template is rejected
+
+# Stack tag holding the hash of the deployed template and parameters. A stack
+# whose last operation succeeded with the same hash is skipped locally.
+TEMPLATE_HASH_TAG = 'cloudwatch-alarms:template-hash'
+# Stack tag marking a resource-based shard stack, "<service>/<index>". Only
+# stacks carrying it are ever deleted as empty shards.
+SHARD_TAG = 'cloudwatch-alarms:shard'
+UNCHANGED_SKIP_STATUSES = ('CREATE_COMPLETE', 'UPDATE_COMPLETE')
+
+# --wait polling: one describe_stacks pass per round for all in-flight stacks
+DEFAULT_WAIT_TIMEOUT = 3600
+WAIT_POLL_INITIAL = 5
+WAIT_POLL_MAX = 30
+WAIT_BATCH_THRESHOLD = 5  # Above this, list all stacks instead of one call each
+# --engine direct: PutMetricAlarm/DeleteAlarms instead of CloudFormation
+ENGINES = ['cloudformation', 'direct']
+DEFAULT_DIRECT_RATE = 3.0  # PutMetricAlarm/DeleteAlarms default quota is 3 requests/second
+DIRECT_WORKERS = 4
+DELETE_ALARMS_BATCH = 100  # DeleteAlarms accepts at most 100 names
+# --consolidate: GROUP BY alarms over all resources (see generate-resource-alarms.py)
+CONSOLIDATE_MODES = ['dimension', 'tag']
+# Stack refactor statuses that are neither in progress nor final
+REFACTOR_PENDING_STATUSES = {'AVAILABLE', 'UNAVAILABLE'}
+# Refactors cannot leave a stack without resources
+REFACTOR_PLACEHOLDER = {'Placeholder': {'Type': 'AWS::CloudFormation::WaitConditionHandle'}}
+SUCCESS_STACK_STATUSES = {'CREATE_COMPLETE': 'created', 'UPDATE_COMPLETE': 'updated',
+                          'DELETE_COMPLETE': 'deleted'}
+
+# Concurrent per-resource tag lookups during discovery, kept under each API's
+# request quota (Kafka returns tags with the listing and needs none)
+TAG_LOOKUP_CONCURRENCY = {
+    'eks': 8,
+    'opensearch': 8,
+    'rabbitmq': 4,
+    'waf': 4,
+    'docdb': 8,
+    'alb': 10,
+}
+
+# Resource Groups Tagging API resource types for the single-pass backend.
+# DocDB clusters are listed as rds:cluster, the same set the docdb API returns.
+TAGGING_API_RESOURCE_TYPES = {
+    'eks': 'eks:cluster',
+    'opensearch': 'es:domain',
+    'kafka': 'kafka:cluster',
+    'rabbitmq': 'mq:broker',
+    'waf': 'wafv2',
+    'docdb': 'rds:cluster',
+    'alb': 'elasticloadbalancing:loadbalancer',
+}
+DISCOVERY_BACKENDS = ['per-service', 'tagging-api']
+DISCOVERY_CACHE_FILE = os.path.join('.alarm-cache', 'discovery-cache.json')
+
+# Run journal for --resume: discovered IDs, template hashes and stack outcomes
+RUN_JOURNAL_FILE = os.path.join('.alarm-cache', 'run-journal.json')
+RUN_JOURNAL_VERSION = 1
+# Journaled outcomes a resumed run trusts without calling AWS, once settled
+RESUMABLE_STATUSES = ('created', 'updated', 'no-change')
+
+# --mode reconcile: redeploy only the stacks that resource events touch
+DEFAULT_DEBOUNCE_SECONDS = 30.0
+RECONCILE_MAX_DELAY = 300.0  # Flush a service this long after its first event even if events keep coming
+RECONCILE_RETRY_DELAY = 60.0  # Retry a flush whose discovery failed after this long
+SQS_WAIT_SECONDS = 20  # Long-poll limit for receive_message
+FOLLOW_POLL_INTERVAL = 0.5  # --events-file --follow: seconds between checks for appended lines
+SQS_BATCH = 10  # receive_message / delete_message_batch maximum
+# CloudTrail event sources of the APIs that create, delete or tag alarmed resources
+CLOUDTRAIL_EVENT_SOURCES = {
+    'eks.amazonaws.com': 'eks',
+    'es.amazonaws.com': 'opensearch',
+    'kafka.amazonaws.com': 'kafka',
+    'mq.amazonaws.com': 'rabbitmq',
+    'wafv2.amazonaws.com': 'waf',
+    'rds.amazonaws.com': 'docdb',
+    'elasticloadbalancing.amazonaws.com': 'alb',
+}
+
+DEFAULT_MAX_PARALLEL_TARGETS = 4
+ASSUME_ROLE_SESSION_NAME = 'cloudwatch-alarms-deploy'
+
+# One client per (service, region) is shared by every worker thread, so the
+# connection pool must cover the widest fan-out (tag lookups x stacks).
+# API_THROTTLE is the only retry layer: botocore makes a single attempt and
+# API_THROTTLE's needs-retry hook retries throttling and transient errors.
+CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'mode': 'standard', 'total_max_attempts': 1},
+)
+
+# Sustained requests per second per account and region for the APIs that
+# parallel runs hit hardest. Conservative defaults, override with --api-rate.
+API_RATE_LIMITS = {
+    'cloudformation.CreateStack': 2.0,
+    'cloudformation.UpdateStack': 2.0,
+    'cloudformation.DeleteStack': 2.0,
+    'cloudformation.DescribeStacks': 10.0,
+    'eks.DescribeCluster': 20.0,
+    'opensearch.ListTags': 20.0,
+    'mq.DescribeBroker': 10.0,
+    'wafv2.ListTagsForResource': 10.0,
+    'docdb.ListTagsForResource': 20.0,
+    'elbv2.DescribeTags': 20.0,
+}
+THROTTLING_ERROR_CODES = {'Throttling', 'ThrottlingException', 'ThrottledException',
+                          'TooManyRequestsException', 'RequestLimitExceeded', 'SlowDown'}
+# --profile / --metrics-out: API latency histogram buckets (Prometheus defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PREFIX = 'cloudwatch_alarms'
+THROTTLE_MAX_RETRIES = 8
+TRANSIENT_MAX_RETRIES = 2  # Same as botocore's standard mode (3 attempts)
+TRANSIENT_ERROR_CODES = {'RequestTimeout', 'RequestTimeoutException', 'PriorRequestNotComplete',
+                         'InternalError', 'InternalFailure', 'ServiceUnavailable'}
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+THROTTLE_BACKOFF_BASE = 0.5
+THROTTLE_BACKOFF_MAX = 20.0
 
 @dataclass
 class DeploymentResult:
     service: str
     stack_name: str
-    status: str  # 'created', 'updated', 'failed', 'no-change'
+    status: str  # 'created', 'updated', 'failed', 'no-change', 'deleted', 'dry-run', 'resumed'
     alarm_count: int
     resource_count: int
     error_message: Optional[str] = None
+    duration_seconds: float = 0.0
+    submitted_at: float = 0.0  # time.monotonic() when the stack operation was initiated
+    completion_seconds: Optional[float] = None  # Submission to final status, set by --wait
+    engine: str = 'cloudformation'  # 'direct' results have no stack to wait on
+
+
+class ClientFactory:
+    """Builds and reuses boto3 clients for one set of credentials, i.e. one account.
+    
+    Each (service, region) client is created once and shared across threads
+    (botocore clients are thread-safe once built). Every API call made through
+    them is counted per operation in api_calls.
+    """
+    
+    def __init__(self, session: Optional[boto3.session.Session] = None, account_id: Optional[str] = None,
+                 config: Config = CLIENT_CONFIG):
+        self.session = session or boto3.session.Session()
+        self.config = config
+        self.account_id = account_id
+        self.api_calls = {}
+        self._clients = {}
+        # boto3 sessions are not thread-safe while they build clients
+        self._lock = threading.Lock()
+    
+    def client(self, service_name: str, region: Optional[str] = None):
+        with self._lock:
+            key = (service_name, region)
+            if key not in self._clients:
+                client = self.session.client(service_name, region_name=region, config=self.config)
+                client.meta.events.register_first('before-call.*.*', self._before_call)
+                client.meta.events.register('after-call.*.*', self._after_call)
+                client.meta.events.register('after-call-error.*.*', self._after_call_error)
+                API_THROTTLE.instrument(client, scope=id(self))
+                self._clients[key] = client
+            return self._clients[key]
+    
+    def _before_call(self, model, context, **kwargs):
+        name = f'{model.service_model.service_name}.{model.name}'
+        context['metrics_operation'] = name
+        context['metrics_started'] = time.monotonic()
+        with self._lock:
+            self.api_calls[name] = self.api_calls.get(name, 0) + 1
+    
+    def _after_call(self, http_response, parsed, context, **kwargs):
+        if 'metrics_started' in context:
+            RUN_METRICS.observe_api(context['metrics_operation'], time.monotonic() - context['metrics_started'],
+                                    retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+                                    error=http_response.status_code >= 300)
+    
+    def _after_call_error(self, context, **kwargs):
+        if 'metrics_started' in context:
+            RUN_METRICS.observe_api(context['metrics_operation'], time.monotonic() - context['metrics_started'],
+                                    error=True)
+
+
+@lru_cache(maxsize=None)
+def _default_clients() -> ClientFactory:
+    """Client factory for the ambient credentials"""
+    
+    return ClientFactory()
+
+
+def _new_client(service_name: str, region: Optional[str] = None, clients: Optional[ClientFactory] = None):
+    """Shared boto3 client from the given factory (ambient credentials by default)"""
+    
+    return (clients or _default_clients()).client(service_name, region)
+
+
+def get_account_id(region: Optional[str] = None, clients: Optional[ClientFactory] = None) -> str:
+    """Account ID behind a client factory, looked up once per run"""
+    
+    factory = clients or _default_clients()
+    if factory.account_id is None:
+        factory.account_id = _new_client('sts', region, clients).get_caller_identity()['Account']
+    return factory.account_id
+
+
+def assume_role_clients(account_id: str, role_name: str, region: str,
+                        base: Optional[ClientFactory] = None) -> ClientFactory:
+    """Client factory for a role assumed in another account.
+    
+    The temporary credentials last one hour, which bounds a single target's run.
+    """
+    
+    base = base or _default_clients()
+    partition = base.session.get_partition_for_region(region)
+    credentials = base.client('sts', region).assume_role(
+        RoleArn=f'arn:{partition}:iam::{account_id}:role/{role_name}',
+        RoleSessionName=ASSUME_ROLE_SESSION_NAME
+    )['Credentials']
+    return ClientFactory(boto3.session.Session(
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken']
+    ), account_id=account_id)
+
+
+class StackScheduler:
+    """Run independent stack deployments on a bounded worker pool.
+    
+    Results are returned in submission order regardless of completion order,
+    so the summary reads the same as a serial run. With max_parallel=1 each
+    deployment runs inline when submitted (the original serial path).
+    """
+    
+    def __init__(self, max_parallel: int = DEFAULT_MAX_PARALLEL_STACKS):
+        self.max_parallel = max(1, max_parallel)
+        self._executor = None
+        if self.max_parallel > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_parallel,
+                                                thread_name_prefix='stack')
+        self._pending = []
+    
+    def submit(self, fn: Callable[..., DeploymentResult], *args, **kwargs):
+        """Schedule a deploy function that returns a DeploymentResult"""
+        
+        if self._executor is None:
+            self._pending.append(_timed_deploy(fn, *args, **kwargs))
+        else:
+            self._pending.append(self._executor.submit(_timed_deploy, fn, *args, **kwargs))
+    
+    def results(self) -> List[DeploymentResult]:
+        """Wait for every submitted deployment and return results in order"""
+        
+        results = [p if isinstance(p, DeploymentResult) else p.result() for p in self._pending]
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        return results
+
+
+def _timed_deploy(fn: Callable[..., DeploymentResult], *args, **kwargs) -> DeploymentResult:
+    start = time.monotonic()
+    result = fn(*args, **kwargs)
+    result.submitted_at = time.monotonic()
+    result.duration_seconds = result.submitted_at - start
+    return result
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` acquisitions per second, shared by threads"""
+    
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> float:
+        """Block until a token is available and return the seconds waited"""
+        
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ApiThrottle:
+    """Paces AWS calls per operation and retries the ones AWS throttles.
+    
+    Every attempt made by an instrumented client first takes a token from the
+    bucket for its operation (one bucket per account and region, at the rate
+    in `rates`; operations without a rate pass straight through). A call
+    rejected with a throttling error is retried with capped exponential
+    backoff and full jitter instead of surfacing as a failed lookup or stack;
+    transient errors get botocore's usual two retries. Clients are expected
+    to have botocore's own retries off (CLIENT_CONFIG), so every retry goes
+    through here. Time spent waiting on either is recorded per operation in
+    stats.
+    """
+    
+    def __init__(self, rates: Optional[Dict[str, float]] = None, max_retries: int = THROTTLE_MAX_RETRIES,
+                 backoff_base: float = THROTTLE_BACKOFF_BASE, backoff_max: float = THROTTLE_BACKOFF_MAX):
+        self.rates = dict(API_RATE_LIMITS if rates is None else rates)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+    
+    def _limiter(self, operation: str, scope) -> Optional[RateLimiter]:
+        rate = self.rates.get(operation)
+        if not rate:
+            return None
+        with self._lock:
+            key = (scope, operation)
+            if key not in self._limiters:
+                self._limiters[key] = RateLimiter(rate)
+            return self._limiters[key]
+    
+    def _record(self, operation: str, **counts):
+        with self._lock:
+            stats = self.stats.setdefault(operation, {'calls': 0, 'rate_wait': 0.0,
+                                                      'throttled': 0, 'backoff_wait': 0.0})
+            for name, value in counts.items():
+                stats[name] += value
+    
+    def _attempt(self, operation: str, scope):
+        limiter = self._limiter(operation, scope)
+        self._record(operation, calls=1, rate_wait=limiter.acquire() if limiter else 0.0)
+    
+    def _retry_delay(self, operation: str, scope, response, caught_exception, request_dict) -> Optional[float]:
+        """needs-retry: back off and take a fresh token, returning 0 to retry or None to give up"""
+        
+        context = request_dict['context']
+        code = (response[1].get('Error', {}).get('Code') if response else None)
+        if code in THROTTLING_ERROR_CODES:
+            kind, limit = 'throttle_retries', self.max_retries
+        elif caught_exception is not None or code in TRANSIENT_ERROR_CODES or (
+                response and response[0].status_code in TRANSIENT_STATUS_CODES):
+            kind, limit = 'transient_retries', TRANSIENT_MAX_RETRIES
+        else:
+            return None
+        attempt = context.get(kind, 0)
+        if attempt >= limit:
+            return None
+        context[kind] = attempt + 1
+        
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if kind == 'throttle_retries':
+            self._record(operation, throttled=1, backoff_wait=delay)
+        time.sleep(delay)
+        self._attempt(operation, scope)
+        return 0
+    
+    def instrument(self, client, scope=None):
+        """Hook the throttle into a client's before-call and needs-retry events"""
+        
+        service = client.meta.service_model.service_name
+        scope = (scope, client.meta.region_name)
+        
+        def before_call(model, **kwargs):
+            self._attempt(f'{service}.{model.name}', scope)
+        
+        def needs_retry(operation, response=None, caught_exception=None, request_dict=None, **kwargs):
+            return self._retry_delay(f'{service}.{operation.name}', scope, response, caught_exception, request_dict)
+        
+        client.meta.events.register_first('before-call.*.*', before_call)
+        client.meta.events.register_first('needs-retry.*.*', needs_retry)
+        return client
+
+
+API_THROTTLE = ApiThrottle()
+
+
+class RunMetrics:
+    """Timing spans per phase and service, and latency per AWS operation.
+    
+    Spans cover discovery, template generation, stack deployment, waiting and
+    whole targets. API calls made through ClientFactory clients are recorded
+    with a latency histogram, error count and retries (made by the API
+    throttle). Exported for --profile and --metrics-out.
+    """
+    
+    def __init__(self):
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.spans = []
+        self.api = {}
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def span(self, phase: str, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_span(phase, start, time.monotonic() - start, **labels)
+    
+    def add_span(self, phase: str, start: float, seconds: float, **labels):
+        with self._lock:
+            self.spans.append({'phase': phase, **labels,
+                               'start': round(start - self.started, 4), 'seconds': round(seconds, 4)})
+    
+    def observe_api(self, operation: str, seconds: float, retries: int = 0, error: bool = False):
+        with self._lock:
+            stats = self.api.setdefault(operation, {'calls': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0,
+                                                    'max_seconds': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS)})
+            stats['calls'] += 1
+            stats['errors'] += error
+            stats['retries'] += retries
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+    
+    def phase_totals(self) -> Dict[tuple, Dict[str, float]]:
+        """Total seconds and span count per (phase, service)"""
+        
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                total = totals.setdefault((span['phase'], span.get('service', '')), {'seconds': 0.0, 'count': 0})
+                total['seconds'] += span['seconds']
+                total['count'] += 1
+        return totals
+    
+    def _api_with_throttle(self) -> Dict[str, dict]:
+        with self._lock:
+            api = {op: dict(stats, buckets=list(stats['buckets'])) for op, stats in self.api.items()}
+        for operation, throttle in API_THROTTLE.stats.items():
+            if operation in api:
+                api[operation]['rate_limit_wait_seconds'] = round(throttle['rate_wait'], 4)
+                api[operation]['backoff_seconds'] = round(throttle['backoff_wait'], 4)
+        return api
+    
+    def to_json(self, results: List[DeploymentResult]) -> dict:
+        statuses = {}
+        for r in results:
+            statuses[r.status] = statuses.get(r.status, 0) + 1
+        return {
+            'started_at': self.started_at,
+            'duration_seconds': round(time.monotonic() - self.started, 4),
+            'stacks': statuses,
+            'alarms': sum(r.alarm_count for r in results if r.status != 'failed'),
+            'phases': [{'phase': phase, 'service': service, 'seconds': round(total['seconds'], 4),
+                        'count': total['count']}
+                       for (phase, service), total in sorted(self.phase_totals().items())],
+            'api': {op: dict(stats, bucket_bounds=list(LATENCY_BUCKETS))
+                    for op, stats in sorted(self._api_with_throttle().items())},
+            'spans': list(self.spans),
+        }
+    
+    def to_prometheus(self, results: List[DeploymentResult]) -> str:
+        """Render the run in the Prometheus text format for node_exporter's textfile collector"""
+        
+        m = METRICS_PREFIX
+        run = self.to_json(results)
+        lines = [
+            f'# HELP {m}_last_run_timestamp_seconds Start time of the last deployment run',
+            f'# TYPE {m}_last_run_timestamp_seconds gauge',
+            f'{m}_last_run_timestamp_seconds {self.started_at:.3f}',
+            f'# HELP {m}_run_duration_seconds Wall-clock duration of the last deployment run',
+            f'# TYPE {m}_run_duration_seconds gauge',
+            f'{m}_run_duration_seconds {run["duration_seconds"]}',
+            f'# HELP {m}_stacks Stacks by final status in the last run',
+            f'# TYPE {m}_stacks gauge',
+        ]
+        lines += [f'{m}_stacks{{status="{status}"}} {count}' for status, count in sorted(run['stacks'].items())]
+        lines += [
+            f'# HELP {m}_alarms Alarms deployed in the last run',
+            f'# TYPE {m}_alarms gauge',
+            f'{m}_alarms {run["alarms"]}',
+            f'# HELP {m}_phase_seconds Time spent per phase and service in the last run',
+            f'# TYPE {m}_phase_seconds summary',
+        ]
+        for phase in run['phases']:
+            labels = f'phase="{phase["phase"]}",service="{phase["service"]}"'
+            lines.append(f'{m}_phase_seconds_sum{{{labels}}} {phase["seconds"]}')
+            lines.append(f'{m}_phase_seconds_count{{{labels}}} {phase["count"]}')
+        lines += [
+            f'# HELP {m}_api_call_duration_seconds AWS API call latency by service and operation',
+            f'# TYPE {m}_api_call_duration_seconds histogram',
+        ]
+        for operation, stats in run['api'].items():
+            service, _, name = operation.partition('.')
+            labels = f'service="{service}",operation="{name}"'
+            for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                lines.append(f'{m}_api_call_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{m}_api_call_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["calls"]}')
+            lines.append(f'{m}_api_call_duration_seconds_sum{{{labels}}} {stats["seconds"]:.4f}')
+            lines.append(f'{m}_api_call_duration_seconds_count{{{labels}}} {stats["calls"]}')
+        for metric, key, help_text in (('api_errors', 'errors', 'AWS API calls that returned an error'),
+                                       ('api_retries', 'retries', 'AWS API call retries')):
+            lines += [f'# HELP {m}_{metric} {help_text} in the last run', f'# TYPE {m}_{metric} gauge']
+            for operation, stats in run['api'].items():
+                service, _, name = operation.partition('.')
+                lines.append(f'{m}_{metric}{{service="{service}",operation="{name}"}} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+    
+    def write(self, path: str, results: List[DeploymentResult]):
+        """Write the run as a Prometheus textfile (.prom) or JSON (anything else), atomically"""
+        
+        if path.endswith('.prom'):
+            body = self.to_prometheus(results)
+        else:
+            body = json.dumps(self.to_json(results), indent=2)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    
+    def print_profile(self):
+        """Time per phase and service, then the slowest API operations"""
+        
+        print("\n⏱️  Profile")
+        for (phase, service), total in sorted(self.phase_totals().items(), key=lambda item: -item[1]['seconds']):
+            print(f"  {phase:<12} {service or '-':<16} {total['seconds']:>8.2f}s  ({total['count']} span(s))")
+        api = self._api_with_throttle()
+        if api:
+            print(f"  {'API operation':<42}{'calls':>7}{'errors':>8}{'retries':>8}{'avg':>9}{'max':>9}")
+            for operation, stats in sorted(api.items(), key=lambda item: -item[1]['seconds'])[:15]:
+                print(f"  {operation:<42}{stats['calls']:>7}{stats['errors']:>8}{stats['retries']:>8}"
+                      f"{stats['seconds'] / stats['calls'] * 1000:>7.0f}ms{stats['max_seconds'] * 1000:>7.0f}ms")
+
+
+RUN_METRICS = RunMetrics()
+
+
+class RunJournal:
+    """Checkpoint of a run, written after each phase, discovery and stack submission.
+    
+    Per target it holds the discovered resource IDs, the completed phases and
+    every stack's template hash and outcome. A stack's outcome is settled once
+    it is known to have finished: unchanged at submission, or complete after
+    --wait. With resume, discovery reuses the journaled IDs and a stack whose
+    settled, successful outcome has the same template hash is skipped without
+    calling AWS; failed, unsettled and unstarted stacks are deployed as usual.
+    Until open() is called the journal records nothing.
+    """
+    
+    def __init__(self):
+        self.path = None
+        self.resume = False
+        self.stats = {'resumed_discoveries': 0, 'resumed_stacks': 0}
+        self._data = {}
+        self._lock = threading.Lock()
+    
+    def open(self, path: str, run: Dict, resume: bool = False):
+        """Start journaling to path; with resume, continue the journal there if it is for the same run.
+        
+        Raises ValueError if the journal at path belongs to a run with other options.
+        """
+        
+        self.stats = {'resumed_discoveries': 0, 'resumed_stacks': 0}
+        previous = None
+        if resume and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"   Warning: Ignoring unreadable run journal {path}: {e}")
+        if previous is not None and previous.get('version') == RUN_JOURNAL_VERSION:
+            if previous['run'] != run:
+                changed = sorted(key for key in set(run) | set(previous['run'])
+                                 if run.get(key) != previous['run'].get(key))
+                raise ValueError(f"Run journal {path} is for a run with different {', '.join(changed)}")
+            self._data = previous
+            print(f"♻️  Resuming the run journaled at {time.ctime(previous['started'])} ({path})")
+        else:
+            if resume:
+                print(f"   No run journal to resume at {path}, starting a full run")
+            self._data = {'version': RUN_JOURNAL_VERSION, 'run': run, 'started': time.time(), 'targets': {}}
+        self.path = path
+        self.resume = previous is not None and self._data is previous
+        self._save()
+    
+    def _target(self, label: str) -> Dict:
+        return self._data['targets'].setdefault(label, {'phases': [], 'discovered': {}, 'stacks': {}})
+    
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+    
+    def has_discovered(self, label: str, service: str) -> bool:
+        """Whether the resumed run already discovered service, without counting a reuse"""
+        
+        if not self.resume:
+            return False
+        with self._lock:
+            return service in self._data['targets'].get(label, {}).get('discovered', {})
+    
+    def discovered(self, label: str, service: str) -> Optional[List[str]]:
+        """Resource IDs the resumed run already discovered for service, if any"""
+        
+        if not self.resume:
+            return None
+        with self._lock:
+            ids = self._data['targets'].get(label, {}).get('discovered', {}).get(service)
+            if ids is not None:
+                self.stats['resumed_discoveries'] += 1
+                return list(ids)
+            return None
+    
+    def record_discovery(self, label: str, service: str, resource_ids: List[str]):
+        if self.path is None:
+            return
+        with self._lock:
+            self._target(label)['discovered'][service] = list(resource_ids)
+            self._save()
+    
+    def record_phase(self, label: str, phase: str):
+        if self.path is None:
+            return
+        with self._lock:
+            phases = self._target(label)['phases']
+            if phase not in phases:
+                phases.append(phase)
+                self._save()
+    
+    def completed(self, label: str, stack_name: str, content_hash: str) -> Optional[Dict]:
+        """The journaled outcome if the resumed run already finished this exact template, else None"""
+        
+        if not self.resume:
+            return None
+        with self._lock:
+            entry = self._data['targets'].get(label, {}).get('stacks', {}).get(stack_name)
+            if (entry and entry.get('settled') and entry.get('hash') == content_hash
+                    and entry['status'] in RESUMABLE_STATUSES):
+                self.stats['resumed_stacks'] += 1
+                return dict(entry)
+            return None
+    
+    def record_stack(self, label: str, result: DeploymentResult, content_hash: Optional[str] = None,
+                     settled: bool = False):
+        """Record one stack's outcome, keeping its template hash unless a new one is given"""
+        
+        if self.path is None or result.status == 'resumed':
+            return
+        with self._lock:
+            stacks = self._target(label)['stacks']
+            entry = stacks.get(result.stack_name, {})
+            stacks[result.stack_name] = {
+                'service': result.service,
+                'status': result.status,
+                'hash': content_hash or entry.get('hash'),
+                'settled': settled,
+                'alarm_count': result.alarm_count,
+                'resource_count': result.resource_count,
+                'error': result.error_message,
+                'time': time.time(),
+            }
+            self._save()
+    
+    def record_results(self, label: str, results: List[DeploymentResult], waited: bool = False):
+        """Record every result of a target, after submission or, with waited, after --wait"""
+        
+        for result in results:
+            settled = (result.status == 'no-change'
+                       or (waited and result.completion_seconds is not None and result.status != 'failed'))
+            self.record_stack(label, result, settled=settled)
+
+
+RUN_JOURNAL = RunJournal()
+
+
+class DiscoveryCache:
+    """On-disk cache of discovered resources and their tags.
+    
+    Entries are keyed by (account, region, service, tag filter). An entry
+    younger than the TTL is returned without calling AWS. In incremental mode
+    an expired entry still lets discovery re-list the service but reuse the
+    cached tags of resource IDs it has already seen, so only new resources
+    cost a tag lookup.
+    """
+    
+    def __init__(self, path: str, account_id: str, ttl: float = 0, incremental: bool = False,
+                 refresh: bool = False):
+        self.path = path
+        self.account_id = account_id
+        self.ttl = ttl
+        self.incremental = incremental
+        self.refresh = refresh
+        self.stats = {'hits': 0, 'misses': 0, 'tags_reused': 0, 'tags_fetched': 0}
+        self._lock = threading.Lock()
+        self._entries = {}
+        if not refresh and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"   Warning: Ignoring unreadable discovery cache {path}: {e}")
+    
+    def _key(self, region: str, service: str, tag_key: str, tag_value: str) -> str:
+        return f'{self.account_id}|{region}|{service}|{tag_key}={tag_value}'
+    
+    def lookup(self, region: str, service: str, tag_key: str, tag_value: str) -> Optional[List[str]]:
+        """Return cached resource IDs if the entry is within the TTL"""
+        
+        with self._lock:
+            entry = self._entries.get(self._key(region, service, tag_key, tag_value))
+            if entry and not self.refresh and time.time() - entry['timestamp'] < self.ttl:
+                self.stats['hits'] += 1
+                return list(entry['resources'])
+            self.stats['misses'] += 1
+            return None
+    
+    def known_tags(self, region: str, service: str, tag_key: str, tag_value: str) -> Optional[Dict[str, Dict]]:
+        """Cached tags per resource ID for an incremental refresh, if enabled"""
+        
+        if not self.incremental or self.refresh:
+            return None
+        with self._lock:
+            entry = self._entries.get(self._key(region, service, tag_key, tag_value))
+            return dict(entry['tags']) if entry else {}
+    
+    def store(self, region: str, service: str, tag_key: str, tag_value: str,
+              resources: List[str], tags: Dict[str, Dict]):
+        """Record a fresh discovery result and persist the cache"""
+        
+        with self._lock:
+            self._entries[self._key(region, service, tag_key, tag_value)] = {
+                'timestamp': time.time(),
+                'resources': resources,
+                'tags': tags,
+            }
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+    
+    def count_tags(self, reused: int, fetched: int):
+        with self._lock:
+            self.stats['tags_reused'] += reused
+            self.stats['tags_fetched'] += fetched
+    
+    def for_account(self, account_id: str) -> 'DiscoveryCache':
+        """View of this cache keyed for another account, sharing its entries and stats"""
+        
+        scoped = copy.copy(self)
+        scoped.account_id = account_id
+        return scoped
 
 
-def validate_prerequisites():
-    """Validate all prerequisites before deployment"""
+def validate_prerequisites() -> str:
+    """Validate all prerequisites before deployment and return the account ID"""
     
     print("🔍 Validating prerequisites...")
     errors = []
@@ -44,10 +810,10 @@ def validate_prerequisites():
         errors.append("boto3 not installed. Run: pip install boto3")
     
     # Check AWS credentials
+    account_id = None
     try:
-        sts = boto3.client('sts')
-        identity = sts.get_caller_identity()
-        print(f"   ✓ AWS credentials configured (Account: {identity['Account']})")
+        account_id = get_account_id()
+        print(f"   ✓ AWS credentials configured (Account: {account_id})")
     except Exception as e:
         errors.append(f"AWS credentials not configured: {e}")
     
@@ -72,24 +838,26 @@ def validate_prerequisites():
         sys.exit(1)
     
     print("   ✓ All prerequisites met\n")
+    return account_id
 
 
-def upload_template_to_s3(template_body: str, template_name: str, region: str) -> str:
-    """Upload large template to S3 and return URL"""
-    
-    s3 = boto3.client('s3', region_name=region)
-    sts = boto3.client('sts', region_name=region)
-    account_id = sts.get_caller_identity()['Account']
-    
-    # Create bucket name
-    bucket_name = f'cloudformation-templates-{account_id}-{region}'
+# Buckets confirmed (or created) and template objects known to exist in this
+# run, so each bucket is checked once and identical templates upload once
+_S3_READY_BUCKETS = set()
+_S3_UPLOADED_KEYS = set()
+_S3_LOCK = threading.Lock()
+
+
+def _ensure_template_bucket(s3, bucket_name: str, region: str):
+    """Create the template bucket if needed, checking each bucket once per run"""
     
-    try:
-        # Create bucket if it doesn't exist
+    with _S3_LOCK:
+        if bucket_name in _S3_READY_BUCKETS:
+            return
         try:
             s3.head_bucket(Bucket=bucket_name)
             print(f"   Using existing S3 bucket: {bucket_name}")
-        except:
+        except ClientError:
             print(f"   Creating S3 bucket: {bucket_name}")
             if region == 'us-east-1':
                 s3.create_bucket(Bucket=bucket_name)
@@ -104,19 +872,48 @@ def upload_template_to_s3(template_body: str, template_name: str, region: str) -
                 Bucket=bucket_name,
                 VersioningConfiguration={'Status': 'Enabled'}
             )
+        _S3_READY_BUCKETS.add(bucket_name)
+
+
+def upload_template_to_s3(template_body: str, template_name: str, region: str,
+                          clients: Optional[ClientFactory] = None) -> str:
+    """Upload large template to S3 and return URL.
+    
+    Objects are keyed by the template's content hash, so a template that is
+    already in the bucket is not written again.
+    """
+    
+    s3 = _new_client('s3', region, clients)
+    account_id = get_account_id(region, clients)
+    
+    # Create bucket name
+    bucket_name = f'cloudformation-templates-{account_id}-{region}'
+    body = template_body.encode('utf-8')
+    stem, extension = os.path.splitext(template_name)
+    key = f'templates/{stem}-{hashlib.sha256(body).hexdigest()[:16]}{extension}'
+    template_url = f'https://{bucket_name}.s3.{region}.amazonaws.com/{key}'
+    
+    try:
+        _ensure_template_bucket(s3, bucket_name, region)
         
-        # Upload template
-        key = f'templates/{template_name}'
-        print(f"   Uploading template to S3: s3://{bucket_name}/{key}")
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=key,
-            Body=template_body.encode('utf-8'),
-            ContentType='text/yaml'
-        )
+        if (bucket_name, key) in _S3_UPLOADED_KEYS:
+            return template_url
+        try:
+            s3.head_object(Bucket=bucket_name, Key=key)
+            print(f"   Template already in S3: s3://{bucket_name}/{key}")
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+            print(f"   Uploading template to S3: s3://{bucket_name}/{key}")
+            s3.put_object(
+                Bucket=bucket_name,
+                Key=key,
+                Body=body,
+                ContentType='application/json' if extension == '.json' else 'text/yaml'
+            )
+        with _S3_LOCK:
+            _S3_UPLOADED_KEYS.add((bucket_name, key))
         
-        # Return URL
-        template_url = f'https://{bucket_name}.s3.{region}.amazonaws.com/{key}'
         return template_url
     
     except Exception as e:
@@ -124,476 +921,1906 @@ def upload_template_to_s3(template_body: str, template_name: str, region: str) -
         raise
 
 
-def deploy_tag_based_alarms(tag_key: str, tag_value: str, sns_topic: str, 
-                            region: str, stack_name: str = None) -> DeploymentResult:
-    """Deploy unified tag-based alarms stack"""
+def template_hash(template_body: str, parameters: List[Dict[str, str]]) -> str:
+    """Content hash of a rendered template plus its parameter values"""
+    
+    digest = hashlib.sha256(template_body.encode('utf-8'))
+    for parameter in sorted(parameters, key=lambda p: p['ParameterKey']):
+        digest.update(f"\0{parameter['ParameterKey']}={parameter['ParameterValue']}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _template_dict(body) -> dict:
+    """A template body as returned by get_template (JSON comes back parsed) or rendered locally"""
+    
+    if isinstance(body, dict):
+        return body
+    # Rendered templates are compact JSON, which the YAML loader parses ~50x slower
+    if isinstance(body, str) and body.lstrip().startswith('{'):
+        return json.loads(body)
+    return yaml.load(body, Loader=_generator().YAML_LOADER)
+
+
+def lint_or_raise(template: dict, parameters: List[Dict[str, str]], template_size: Optional[int] = None,
+                  max_resources: Optional[int] = MAX_STACK_RESOURCES):
+    """Run the offline template linter, raising ValueError with every problem found"""
+    
+    with RUN_METRICS.span('lint'):
+        problems = _generator().lint_template(template, parameters, template_size, max_resources=max_resources)
+    if problems:
+        for problem in problems[:LINT_PROBLEMS_SHOWN]:
+            print(f"   ✗ {problem}")
+        if len(problems) > LINT_PROBLEMS_SHOWN:
+            print(f"   ... and {len(problems) - LINT_PROBLEMS_SHOWN} more")
+        raise ValueError(f"Template failed lint with {len(problems)} problem(s), first: {problems[0]}")
+
+
+def _wait_for_refactor(cfn, refactor_id: str, status_key: str, success: str, timeout: float = DEFAULT_WAIT_TIMEOUT):
+    """Poll describe_stack_refactor until status_key settles, raising unless it is success"""
+    
+    deadline = time.monotonic() + timeout
+    while True:
+        refactor = cfn.describe_stack_refactor(StackRefactorId=refactor_id)
+        status = refactor.get(status_key, '')
+        if status not in REFACTOR_PENDING_STATUSES and not status.endswith('_IN_PROGRESS'):
+            if status != success:
+                reason = refactor.get(f'{status_key}Reason') or 'no reason given'
+                raise RuntimeError(f"Stack refactor {refactor_id} ended {status}: {reason}")
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Stack refactor {refactor_id} still {status} after {timeout:.0f}s")
+        time.sleep(WAIT_POLL_INITIAL)
+
+
+def _refactor_definition(stack_name: str, template: dict, region: str, clients: Optional[ClientFactory] = None,
+                         parameters: Optional[List[Dict[str, str]]] = None) -> dict:
+    """StackDefinition for create_stack_refactor, through S3 when over the inline limit.
+    
+    Refactor definitions cannot take parameter values, so given parameters
+    become defaults until the stack's next regular update.
+    """
+    
+    if parameters:
+        values = {p['ParameterKey']: p['ParameterValue'] for p in parameters}
+        template = dict(template, Parameters={name: dict(spec, Default=values[name]) if name in values else spec
+                                              for name, spec in template.get('Parameters', {}).items()})
+    body = json.dumps(template, ensure_ascii=False, separators=(',', ':'))
+    if len(body.encode('utf-8')) > MAX_TEMPLATE_BODY_BYTES:
+        return {'StackName': stack_name,
+                'TemplateURL': upload_template_to_s3(body, f'{stack_name}-refactor.json', region, clients)}
+    return {'StackName': stack_name, 'TemplateBody': body}
+
+
+def _run_stack_refactor(cfn, description: str, definitions: List[dict], mappings: List[dict],
+                        create_stacks: bool = False):
+    """Create a stack refactor, wait for it, execute it and wait for the execution"""
+    
+    refactor_args = {'Description': description, 'StackDefinitions': definitions, 'ResourceMappings': mappings}
+    if create_stacks:
+        refactor_args['EnableStackCreation'] = True
+    refactor_id = cfn.create_stack_refactor(**refactor_args)['StackRefactorId']
+    _wait_for_refactor(cfn, refactor_id, 'Status', 'CREATE_COMPLETE')
+    cfn.execute_stack_refactor(StackRefactorId=refactor_id)
+    _wait_for_refactor(cfn, refactor_id, 'ExecutionStatus', 'EXECUTE_COMPLETE')
+
+
+def _mapping(source_stack: str, source_id: str, destination_stack: str, destination_id: str) -> dict:
+    return {'Source': {'StackName': source_stack, 'LogicalResourceId': source_id},
+            'Destination': {'StackName': destination_stack, 'LogicalResourceId': destination_id}}
+
+
+def migrate_logical_ids(cfn, stack_name: str, template_body: str, region: str,
+                        clients: Optional[ClientFactory] = None) -> int:
+    """Rename alarms deployed under older logical IDs to the IDs in template_body.
+    
+    Alarms are matched by AlarmName. An update alone would create each alarm
+    under its new ID, overwriting the same-named alarm, and then delete the
+    old resource, taking the alarm with it. A stack refactor renames the
+    resources in place instead. Returns the number of alarms renamed.
+    """
+    
+    generator = _generator()
+    deployed = _template_dict(cfn.get_template(StackName=stack_name, TemplateStage='Original')['TemplateBody'])
+    current = generator.expand_template(deployed).get('Resources', {})
+    wanted = {resource['Properties']['AlarmName']: name
+              for name, resource in generator.expand_template(_template_dict(template_body))['Resources'].items()}
+    
+    renames = {}
+    for name, resource in current.items():
+        alarm_name = resource.get('Properties', {}).get('AlarmName')
+        new_name = wanted.get(alarm_name) if isinstance(alarm_name, str) else None
+        if new_name and new_name != name and new_name not in current:
+            renames[name] = new_name
+    if not renames:
+        return 0
+    
+    print(f"   Renaming {len(renames)} alarm logical ID(s) with a stack refactor...")
+    refactored = dict(deployed, Resources={renames.get(name, name): resource
+                                           for name, resource in deployed['Resources'].items()})
+    _run_stack_refactor(cfn, f'Rename {len(renames)} alarm logical IDs',
+                        [_refactor_definition(stack_name, refactored, region, clients)],
+                        [_mapping(stack_name, old, stack_name, new) for old, new in renames.items()])
+    print("✓ Logical IDs migrated")
+    return len(renames)
+
+
+def _deploy_stack(service: str, stack_name: str, template_body: str, parameters: List[Dict[str, str]],
+                  region: str, alarm_count: int, resource_count: int,
+                  clients: Optional[ClientFactory] = None, migrate_ids: bool = False,
+                  stack_tags: Optional[Dict[str, str]] = None) -> DeploymentResult:
+    """Create or update a stack, skipping it locally when nothing changed.
+    
+    The template hash is stored as a stack tag. If describe_stacks shows the
+    same hash (and every tag in stack_tags) on a stack whose last operation
+    succeeded, no template is uploaded or submitted. Templates over the inline limit go through S3.
+    With migrate_ids, alarms whose logical IDs changed are renamed with
+    migrate_logical_ids() before the update. Every template is linted first,
+    so a bad one fails here instead of in a CloudFormation rollback. Each
+    submission is written to RUN_JOURNAL, and a stack the resumed run already
+    finished with the same hash is reported as 'resumed' without calling AWS.
+    Errors propagate to the caller.
+    """
+    
+    lint_or_raise(_template_dict(template_body), parameters, len(template_body.encode('utf-8')))
+    content_hash = template_hash(template_body, parameters)
+    
+    def result(status):
+        return DeploymentResult(
+            service=service,
+            stack_name=stack_name,
+            status=status,
+            alarm_count=alarm_count,
+            resource_count=resource_count
+        )
+    
+    label = f'{get_account_id(region, clients)}/{region}' if RUN_JOURNAL.path else None
+    journaled = RUN_JOURNAL.completed(label, stack_name, content_hash)
+    if journaled:
+        print(f"  Already {journaled['status']} by the resumed run (template hash unchanged)")
+        return result('resumed')
+    
+    def submitted(status):
+        # Journal each submission as soon as CloudFormation has accepted it
+        outcome = result(status)
+        RUN_JOURNAL.record_stack(label, outcome, content_hash, settled=status == 'no-change')
+        return outcome
+    
+    cfn = _new_client('cloudformation', region, clients)
+    
+    # Check if stack exists
+    try:
+        stack = cfn.describe_stacks(StackName=stack_name)['Stacks'][0]
+    except cfn.exceptions.ClientError as e:
+        if 'does not exist' not in str(e):
+            raise
+        stack = None
+    
+    tags = {}
+    if stack is not None:
+        tags = {tag['Key']: tag['Value'] for tag in stack.get('Tags', [])}
+        if (tags.get(TEMPLATE_HASH_TAG) == content_hash and stack['StackStatus'] in UNCHANGED_SKIP_STATUSES
+                and all(tags.get(key) == value for key, value in (stack_tags or {}).items())):
+            print("  No changes needed (template hash unchanged)")
+            return submitted('no-change')
+    
+    # Keep any other stack tags, update_stack replaces the whole set
+    tags.update(stack_tags or {})
+    tags[TEMPLATE_HASH_TAG] = content_hash
+    stack_args = {
+        'StackName': stack_name,
+        'Parameters': parameters,
+        'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]
+    }
+    
+    # Use S3 if template is too large (> 51,200 bytes)
+    template_size = len(template_body.encode('utf-8'))
+    if template_size > MAX_TEMPLATE_BODY_BYTES:
+        print(f"   Template size {template_size:,} bytes exceeds 51KB limit, uploading to S3...")
+        extension = 'json' if template_body.startswith('{') else 'yaml'
+        stack_args['TemplateURL'] = upload_template_to_s3(template_body, f'{stack_name}.{extension}', region, clients)
+    else:
+        stack_args['TemplateBody'] = template_body
+    
+    if stack is not None:
+        if migrate_ids:
+            migrate_logical_ids(cfn, stack_name, template_body, region, clients)
+        print("   Stack exists, updating...")
+        try:
+            cfn.update_stack(**stack_args)
+            print("✓ Stack update initiated")
+            return submitted('updated')
+        except cfn.exceptions.ClientError as e:
+            if 'No updates are to be performed' in str(e):
+                print("  No changes needed")
+                return submitted('no-change')
+            raise
+    
+    print("   Creating new stack...")
+    cfn.create_stack(**stack_args)
+    print("✓ Stack creation initiated")
+    return submitted('created')
+
+
+def _alarm_namespace(resource: dict) -> Optional[str]:
+    """Metric namespace an alarm resource watches, from Namespace or its Metrics Insights query"""
+    
+    properties = resource.get('Properties', {})
+    if isinstance(properties.get('Namespace'), str):
+        return properties['Namespace']
+    for metric in properties.get('Metrics', []):
+        expression = metric.get('Expression')
+        if isinstance(expression, dict):
+            expression = expression.get('Fn::Sub')
+        if isinstance(expression, list):
+            expression = expression[0]
+        match = re.search(r'FROM\s+(?:SCHEMA\(\s*)?"([^"]+)"', expression or '')
+        if match:
+            return match.group(1)
+    return None
+
+
+def split_tag_based_template(template: dict) -> Dict[str, dict]:
+    """Split the tag-based template into one child template per TAG_BASED_STACKS entry.
+    
+    Alarms are assigned by metric namespace and keep their logical IDs.
+    Parameters are shared; the AlarmCount and MonitoredServices outputs are
+    rewritten for each child. Services without alarms are left out.
+    """
+    
+    suffixes = {namespace: suffix for suffix, (namespace, _) in TAG_BASED_STACKS.items()}
+    resources = {suffix: {} for suffix in TAG_BASED_STACKS}
+    for name, resource in template['Resources'].items():
+        namespace = _alarm_namespace(resource)
+        if namespace not in suffixes:
+            raise ValueError(f"Tag-based resource {name} has no stack for namespace {namespace}")
+        resources[suffixes[namespace]][name] = resource
+    
+    children = {}
+    for suffix, child_resources in resources.items():
+        if not child_resources:
+            continue
+        monitored = TAG_BASED_STACKS[suffix][1]
+        outputs = dict(template.get('Outputs', {}))
+        if 'MonitoredServices' in outputs:
+            outputs['MonitoredServices'] = dict(outputs['MonitoredServices'], Value=monitored)
+        if 'AlarmCount' in outputs:
+            outputs['AlarmCount'] = dict(outputs['AlarmCount'], Value=len(child_resources))
+        child = dict(template, Resources=child_resources, Outputs=outputs)
+        child['Description'] = f'Tag-Based CloudWatch Alarms for {monitored} ({len(child_resources)} alarms)'
+        if not outputs:
+            del child['Outputs']
+        children[suffix] = child
+    return children
+
+
+def migrate_tag_based_stack(cfn, stack_name: str, children: Dict[str, dict], parameters: List[Dict[str, str]],
+                            region: str, clients: Optional[ClientFactory] = None) -> int:
+    """Move the alarms of a monolithic tag-based stack into its per-service stacks.
+    
+    children maps each new stack name to its template. A stack refactor
+    creates the new stacks holding the existing alarms, so no alarm is
+    deleted and recreated; the old stack is left with a placeholder and then
+    deleted. Returns the number of alarms moved.
+    """
+    
+    # The deployed template is compacted; the moved alarms must not depend on its Mappings
+    deployed = _generator().expand_template(
+        _template_dict(cfn.get_template(StackName=stack_name, TemplateStage='Original')['TemplateBody']))
+    mappings = []
+    definitions = []
+    for child_name, template in children.items():
+        moved = [name for name in template['Resources'] if name in deployed.get('Resources', {})]
+        if not moved:
+            continue
+        # The new stack starts with exactly the alarms it takes over
+        definitions.append(_refactor_definition(
+            child_name, dict(template, Resources={name: deployed['Resources'][name] for name in moved}),
+            region, clients, parameters))
+        mappings.extend(_mapping(stack_name, name, child_name, name) for name in moved)
+    if not mappings:
+        return 0
+    
+    print(f"   Moving {len(mappings)} alarm(s) from {stack_name} into {len(definitions)} stack(s)...")
+    moved_ids = {mapping['Source']['LogicalResourceId'] for mapping in mappings}
+    remaining = {name: resource for name, resource in deployed['Resources'].items() if name not in moved_ids}
+    # A stack cannot be left empty
+    source = dict(deployed, Resources=remaining or REFACTOR_PLACEHOLDER)
+    source.pop('Outputs', None)
+    definitions.insert(0, _refactor_definition(stack_name, source, region, clients, parameters))
+    
+    _run_stack_refactor(cfn, f'Split {stack_name} into per-service stacks', definitions, mappings,
+                        create_stacks=True)
+    if not remaining:
+        cfn.delete_stack(StackName=stack_name)
+        print(f"✓ Alarms moved, deleting {stack_name}")
+    else:
+        print(f"✓ Alarms moved, {len(remaining)} resource(s) left in {stack_name}")
+    return len(mappings)
+
+
+def plan_tag_based_stacks(tag_key: str, tag_value: str, sns_topic: str, region: str, stack_name: str = None,
+                          clients: Optional[ClientFactory] = None) -> List[tuple]:
+    """Split the tag-based template into per-service stacks, migrating a monolithic stack first.
+    
+    Child stacks are named <stack_name>-<service>. If the old single stack
+    still exists and none of the child stacks do, its alarms are moved into
+    them with migrate_tag_based_stack(). Returns (stack_name, template)
+    pairs for deploy_tag_based_alarms().
+    """
+    
+    if not stack_name:
+        stack_name = f'tag-based-alarms-{tag_value.lower()}'
+    
+    with RUN_METRICS.span('generation', service='tag-based'):
+        generator = _generator()
+        with open('cloudformation-tag-based-alarms.yaml', 'r', encoding='utf-8', errors='ignore') as f:
+            template = yaml.load(f, Loader=generator.YAML_LOADER)
+        children = {f'{stack_name}-{suffix}': child for suffix, child in split_tag_based_template(template).items()}
+    
+    cfn = _new_client('cloudformation', region, clients)
+    
+    def exists(name):
+        try:
+            return cfn.describe_stacks(StackName=name)['Stacks'][0]['StackStatus'] != 'DELETE_COMPLETE'
+        except cfn.exceptions.ClientError as e:
+            if 'does not exist' not in str(e):
+                raise
+            return False
+    
+    if exists(stack_name) and not any(exists(name) for name in children):
+        migrate_tag_based_stack(cfn, stack_name, children, _tag_based_parameters(tag_key, tag_value, sns_topic),
+                                region, clients)
+    return list(children.items())
+
+
+def _tag_based_parameters(tag_key: str, tag_value: str, sns_topic: str) -> List[Dict[str, str]]:
+    return [
+        {'ParameterKey': 'TagKey', 'ParameterValue': tag_key},
+        {'ParameterKey': 'TagValue', 'ParameterValue': tag_value},
+        {'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}
+    ]
+
+
+def deploy_tag_based_alarms(stack_name: str, template: dict, tag_key: str, tag_value: str, sns_topic: str,
+                            region: str, clients: Optional[ClientFactory] = None) -> DeploymentResult:
+    """Deploy one per-service tag-based alarms stack from plan_tag_based_stacks()"""
+    
+    service = f"tag-based-{stack_name.rsplit('-', 1)[1]}"
+    print(f"📦 Deploying {service} alarms...")
+    print(f"   Stack: {stack_name}")
+    print(f"   Tag Filter: {tag_key}={tag_value}")
+    
+    try:
+        # Send the template as compact JSON, which fits the inline limit
+        with RUN_METRICS.span('generation', service=service):
+            template_body = _generator().render_compact(template)
+        alarm_count = sum(1 for resource in template['Resources'].values()
+                          if resource.get('Type') == 'AWS::CloudWatch::Alarm')
+        print(f"   Template size: {len(template_body.encode('utf-8')):,} bytes, {alarm_count} alarm(s)")
+        
+        return _deploy_stack(service, stack_name, template_body, _tag_based_parameters(tag_key, tag_value, sns_topic),
+                             region, alarm_count=alarm_count, resource_count=1, clients=clients)
+    
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return DeploymentResult(
+            service=service,
+            stack_name=stack_name,
+            status='failed',
+            alarm_count=0,
+            resource_count=0,
+            error_message=str(e)
+        )
+
+
+def _bounded_map(fn: Callable, items: Iterable, max_workers: int, name: str) -> Iterator:
+    """Yield fn(item) for each item in input order, consuming items lazily.
+    
+    At most 2 * max_workers calls are in flight, so a long listing is never
+    held in memory and results start flowing before the listing finishes.
+    """
+    
+    if max_workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name) as executor:
+        window = deque()
+        for item in items:
+            window.append(executor.submit(fn, item))
+            if len(window) >= max_workers * 2:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def _filter_by_tags(service: str, candidates: Iterable[tuple], get_tags: Callable[[str], Dict[str, str]],
+                    tag_key: str, tag_value: str, known_tags: Optional[Dict[str, Dict]] = None,
+                    seen_tags: Optional[Dict[str, Dict]] = None) -> Iterator[str]:
+    """Look up tags for (resource_id, lookup_key, label) candidates concurrently.
+    
+    Matching resource IDs are yielded in listing order. A failed lookup prints
+    a warning naming the resource and skips it, exactly like the serial loop.
+    Resources present in known_tags reuse those tags instead of a lookup, and
+    every resource's tags are recorded in seen_tags when it is given.
+    """
+    
+    def check(candidate):
+        resource_id, lookup_key, label = candidate
+        if known_tags is not None and resource_id in known_tags:
+            tags = known_tags[resource_id]
+        else:
+            try:
+                tags = get_tags(lookup_key)
+            except Exception as e:
+                print(f"   Warning: Could not get tags for {label}: {e}")
+                return None
+        if seen_tags is not None:
+            seen_tags[resource_id] = tags
+        return resource_id if tags.get(tag_key) == tag_value else None
+    
+    workers = TAG_LOOKUP_CONCURRENCY.get(service, 1)
+    for resource_id in _bounded_map(check, candidates, workers, f'tags-{service}'):
+        if resource_id is not None:
+            yield resource_id
+
+
+def _paginate(client, operation: str, result_key: str, **kwargs) -> Iterator[dict]:
+    """Yield every item of a paginated listing as its page arrives"""
+    
+    for page in client.get_paginator(operation).paginate(**kwargs):
+        yield from page.get(result_key, [])
+
+
+def _iter_web_acls(client) -> Iterator[dict]:
+    """wafv2 has no botocore paginator for ListWebACLs, so follow NextMarker"""
+    
+    kwargs = {'Scope': 'REGIONAL', 'Limit': 100}
+    while True:
+        response = client.list_web_acls(**kwargs)
+        yield from response.get('WebACLs', [])
+        if not response.get('NextMarker'):
+            return
+        kwargs['NextMarker'] = response['NextMarker']
+
+
+def iter_resources(service: str, region: str, tag_key: str, tag_value: str,
+                   known_tags: Optional[Dict[str, Dict]] = None,
+                   seen_tags: Optional[Dict[str, Dict]] = None,
+                   clients: Optional[ClientFactory] = None) -> Iterator[str]:
+    """Yield IDs of a service's resources matching the tag filter.
+    
+    Listings are paginated and consumed lazily: tag lookups for the first page
+    run while later pages are still being fetched. Listing errors propagate to
+    the caller; per-resource tag lookup errors are warned about and skipped.
+    known_tags and seen_tags are passed through to _filter_by_tags.
+    """
+    
+    if service == 'eks':
+        # Discover EKS clusters with the business tag
+        client = _new_client('eks', region, clients)
+        
+        def get_tags(cluster_name):
+            cluster_info = client.describe_cluster(name=cluster_name)
+            return cluster_info.get('cluster', {}).get('tags', {})
+        
+        yield from _filter_by_tags(
+            service,
+            ((name, name, f'EKS cluster {name}') for name in _paginate(client, 'list_clusters', 'clusters')),
+            get_tags, tag_key, tag_value, known_tags, seen_tags
+        )
+    
+    elif service == 'opensearch':
+        client = _new_client('opensearch', region, clients)
+        account_id = get_account_id(region, clients)
+        
+        # ListDomainNames is not paginated, it returns every domain at once
+        response = client.list_domain_names()
+        all_domains = [domain['DomainName'] for domain in response['DomainNames']]
+        
+        def get_tags(domain_arn):
+            tags_response = client.list_tags(ARN=domain_arn)
+            return {tag['Key']: tag['Value'] for tag in tags_response.get('TagList', [])}
+        
+        yield from _filter_by_tags(
+            service,
+            ((name, f'arn:aws:es:{region}:{account_id}:domain/{name}', name) for name in all_domains),
+            get_tags, tag_key, tag_value, known_tags, seen_tags
+        )
+    
+    elif service == 'kafka':
+        client = _new_client('kafka', region, clients)
+        
+        # Tags come back with the listing, no per-cluster lookup needed
+        for cluster in _paginate(client, 'list_clusters', 'ClusterInfoList'):
+            tags = cluster.get('Tags', {})
+            if seen_tags is not None:
+                seen_tags[cluster['ClusterName']] = tags
+            if tags.get(tag_key) == tag_value:
+                yield cluster['ClusterName']
+    
+    elif service == 'rabbitmq':
+        client = _new_client('mq', region, clients)
+        
+        # Need to describe each broker for tags
+        def get_tags(broker_id):
+            return client.describe_broker(BrokerId=broker_id).get('Tags', {})
+        
+        yield from _filter_by_tags(
+            service,
+            ((b['BrokerId'], b['BrokerId'], b['BrokerId'])
+             for b in _paginate(client, 'list_brokers', 'BrokerSummaries')),
+            get_tags, tag_key, tag_value, known_tags, seen_tags
+        )
+    
+    elif service == 'waf':
+        client = _new_client('wafv2', region, clients)
+        
+        def get_tags(acl_arn):
+            tags_response = client.list_tags_for_resource(ResourceARN=acl_arn)
+            tag_list = tags_response.get('TagInfoForResource', {}).get('TagList', [])
+            return {tag['Key']: tag['Value'] for tag in tag_list}
+        
+        # Just the name, not tuple
+        yield from _filter_by_tags(
+            service,
+            ((acl['Name'], acl['ARN'], acl['Name']) for acl in _iter_web_acls(client)),
+            get_tags, tag_key, tag_value, known_tags, seen_tags
+        )
+    
+    elif service == 'docdb':
+        client = _new_client('docdb', region, clients)
+        
+        def get_tags(cluster_arn):
+            tags_response = client.list_tags_for_resource(ResourceName=cluster_arn)
+            return {tag['Key']: tag['Value'] for tag in tags_response.get('TagList', [])}
+        
+        yield from _filter_by_tags(
+            service,
+            ((c['DBClusterIdentifier'], c['DBClusterArn'], c['DBClusterIdentifier'])
+             for c in _paginate(client, 'describe_db_clusters', 'DBClusters')),
+            get_tags, tag_key, tag_value, known_tags, seen_tags
+        )
+    
+    elif service == 'alb':
+        client = _new_client('elbv2', region, clients)
+        
+        def get_tags(lb_arn):
+            tags_response = client.describe_tags(ResourceArns=[lb_arn])
+            if not tags_response['TagDescriptions']:
+                return {}
+            return {tag['Key']: tag['Value'] for tag in tags_response['TagDescriptions'][0].get('Tags', [])}
+        
+        # Application load balancers only; the LoadBalancer dimension
+        # format is app/name/id, taken from the ARN
+        yield from _filter_by_tags(
+            service,
+            ((lb['LoadBalancerArn'].split(':loadbalancer/')[1], lb['LoadBalancerArn'], lb['LoadBalancerName'])
+             for lb in _paginate(client, 'describe_load_balancers', 'LoadBalancers')
+             if lb['Type'] == 'application'),
+            get_tags, tag_key, tag_value, known_tags, seen_tags
+        )
+    
+    else:
+        raise ValueError(f"Unsupported service: {service}")
+
+
+def discover_resources(service: str, region: str, tag_key: str, tag_value: str,
+                       cache: Optional[DiscoveryCache] = None,
+                       clients: Optional[ClientFactory] = None) -> Optional[List[str]]:
+    """Discover resources of a service type filtered by tags.
+    
+    Returns None if the listing failed, which callers must not mistake for
+    a service with no resources.
+    """
+    
+    print(f"🔍 Discovering {service} resources with tag {tag_key}={tag_value} in {region}...")
+    
+    try:
+        if cache is not None:
+            cached = cache.lookup(region, service, tag_key, tag_value)
+            if cached is not None:
+                print(f"   Found {len(cached)} {service} resource(s) with tag {tag_key}={tag_value} (cached)")
+                return cached
+        
+        known_tags = cache.known_tags(region, service, tag_key, tag_value) if cache is not None else None
+        seen_tags = {}
+        resources = list(iter_resources(service, region, tag_key, tag_value, known_tags, seen_tags, clients))
+        
+        if cache is not None:
+            reused = len(seen_tags.keys() & known_tags.keys()) if known_tags else 0
+            cache.count_tags(reused, len(seen_tags) - reused)
+            cache.store(region, service, tag_key, tag_value, resources, seen_tags)
+        
+        print(f"   Found {len(resources)} {service} resource(s) with tag {tag_key}={tag_value}")
+        return resources
+    
+    except Exception as e:
+        print(f"✗ Error discovering resources: {e}")
+        return None
+
+
+def resource_id_from_arn(service: str, arn: str) -> Optional[str]:
+    """Map a tagged resource ARN to the dimension value its alarms use.
+    
+    Returns None for ARNs of the same AWS service that are not alarmed here,
+    e.g. EKS node groups, global WAF ACLs or network load balancers.
+    """
+    
+    resource = arn.split(':', 5)[5]
+    
+    if service in ('eks', 'opensearch'):
+        # cluster/NAME, domain/NAME
+        kind, _, name = resource.partition('/')
+        return name if kind in ('cluster', 'domain') and '/' not in name else None
+    if service == 'kafka':
+        # cluster/NAME/UUID -> ClusterName
+        parts = resource.split('/')
+        return parts[1] if parts[0] == 'cluster' and len(parts) == 3 else None
+    if service == 'rabbitmq':
+        # broker:NAME:BROKER_ID -> BrokerId
+        parts = resource.split(':')
+        return parts[2] if parts[0] == 'broker' and len(parts) == 3 else None
+    if service == 'waf':
+        # regional/webacl/NAME/ID -> WebACL name
+        parts = resource.split('/')
+        return parts[2] if parts[:2] == ['regional', 'webacl'] and len(parts) == 4 else None
+    if service == 'docdb':
+        # cluster:ID -> DBClusterIdentifier
+        kind, _, cluster_id = resource.partition(':')
+        return cluster_id if kind == 'cluster' else None
+    if service == 'alb':
+        # loadbalancer/app/NAME/ID -> app/NAME/ID
+        kind, _, lb_name = resource.partition('/')
+        return lb_name if kind == 'loadbalancer' and lb_name.startswith('app/') else None
+    raise ValueError(f"Unsupported service: {service}")
+
+
+def discover_resources_tagging_api(services: List[str], region: str, tag_key: str, tag_value: str,
+                                   cache: Optional[DiscoveryCache] = None,
+                                   clients: Optional[ClientFactory] = None) -> Dict[str, Optional[List[str]]]:
+    """Discover resources for several services in one tag-filtered GetResources pass.
+    
+    Services with a cache entry within the TTL are left out of the pass, and
+    the rest are stored under the same keys discover_resources() uses. If the
+    pass fails every uncached service maps to None, as in discover_resources().
+    """
+    
+    cached = {}
+    if cache is not None:
+        for service in services:
+            resource_ids = cache.lookup(region, service, tag_key, tag_value)
+            if resource_ids is not None:
+                cached[service] = resource_ids
+                print(f"   Found {len(resource_ids)} {service} resource(s) with tag {tag_key}={tag_value} (cached)")
+    services = [service for service in services if service not in cached]
+    if not services:
+        return cached
+    
+    print(f"🔍 Discovering {', '.join(services)} resources with tag {tag_key}={tag_value} "
+          f"in {region} (Resource Groups Tagging API)...")
+    
+    # Several services share an ARN namespace, so route by resource type prefix
+    service_by_arn_prefix = {}
+    for service in services:
+        arn_service = TAGGING_API_RESOURCE_TYPES[service].split(':')[0]
+        service_by_arn_prefix.setdefault(arn_service, []).append(service)
+    
+    discovered = {service: [] for service in services}
+    seen_tags = {service: {} for service in services}
+    try:
+        client = _new_client('resourcegroupstaggingapi', region, clients)
+        paginator = client.get_paginator('get_resources')
+        pages = paginator.paginate(
+            TagFilters=[{'Key': tag_key, 'Values': [tag_value]}],
+            ResourceTypeFilters=sorted({TAGGING_API_RESOURCE_TYPES[s] for s in services})
+        )
+        for page in pages:
+            for mapping in page.get('ResourceTagMappingList', []):
+                arn = mapping['ResourceARN']
+                for service in service_by_arn_prefix.get(arn.split(':')[2], []):
+                    resource_id = resource_id_from_arn(service, arn)
+                    if resource_id is not None:
+                        discovered[service].append(resource_id)
+                        seen_tags[service][resource_id] = {tag['Key']: tag['Value']
+                                                           for tag in mapping.get('Tags', [])}
+    except Exception as e:
+        print(f"✗ Error discovering resources: {e}")
+        return {**cached, **{service: None for service in services}}
+    
+    for service in services:
+        if cache is not None:
+            cache.count_tags(0, len(seen_tags[service]))
+            cache.store(region, service, tag_key, tag_value, discovered[service], seen_tags[service])
+        print(f"   Found {len(discovered[service])} {service} resource(s) with tag {tag_key}={tag_value}")
+    return {**cached, **discovered}
+
+
+@lru_cache(maxsize=None)
+def _generator():
+    """Import generate-resource-alarms.py (hyphenated, so not importable by name)"""
+    
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate-resource-alarms.py')
+    spec = importlib.util.spec_from_file_location('generate_resource_alarms', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_resource_based_template(service: str, resource_ids: List[str], tag_value: str,
+                                     consolidate: Optional[str] = None, tag_key: Optional[str] = None) -> str:
+    """Generate CloudFormation template for resource-based alarms"""
+    
+    print(f"🔧 Generating template for {service}...")
+    
+    # Built in-process from the shared alarm config, no subprocess or temp file
+    try:
+        with RUN_METRICS.span('generation', service=service):
+            generator = _generator()
+            template = generator.build_template(service, resource_ids, tag_value, generator.load_compiled(),
+                                                consolidate, tag_key)
+            template_body = generator.render_compact(template)
+        print("   Template generated successfully")
+        return template_body
+    
+    except Exception as e:
+        print(f"✗ Template generation failed: {e}")
+        raise
+
+
+def deploy_eks_ec2_alarms(eks_cluster_name: str, sns_topic: str, region: str, 
+                          tag_value: str, clients: Optional[ClientFactory] = None) -> DeploymentResult:
+    """Deploy EKS EC2 node alarms for a specific EKS cluster"""
+    
+    stack_name = eks_ec2_stack_name(eks_cluster_name)
+    template_file = 'cloudformation-eks-ec2-alarms.yaml'
+    
+    print(f"📦 Deploying EKS EC2 alarms for cluster: {eks_cluster_name}...")
+    print(f"   Stack: {stack_name}")
+    print(f"   Tag filter: eks:cluster-name={eks_cluster_name}")
+    
+    try:
+        # Read template
+        with open(template_file, 'r', encoding='utf-8', errors='ignore') as f:
+            template_body = f.read()
+        
+        # Build parameters
+        parameters = [
+            {'ParameterKey': 'EKSClusterName', 'ParameterValue': eks_cluster_name},
+            {'ParameterKey': 'BusinessTagValue', 'ParameterValue': tag_value},
+            {'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}
+        ]
+        
+        return _deploy_stack(f'eks-ec2-{eks_cluster_name}', stack_name, template_body, parameters, region,
+                             alarm_count=EKS_EC2_ALARM_COUNT, resource_count=1, clients=clients)
+    
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return DeploymentResult(
+            service=f'eks-ec2-{eks_cluster_name}',
+            stack_name=stack_name,
+            status='failed',
+            alarm_count=0,
+            resource_count=0,
+            error_message=str(e)
+        )
+
+
+def eks_ec2_stack_name(eks_cluster_name: str) -> str:
+    return f'eks-ec2-alarms-{eks_cluster_name}'
+
+
+def delete_eks_ec2_stack(eks_cluster_name: str, region: str,
+                         clients: Optional[ClientFactory] = None) -> DeploymentResult:
+    """Delete the EKS EC2 node alarm stack of a cluster that lost its business tag or was deleted.
+    
+    Only a stack deployed by this tool for that cluster (TEMPLATE_HASH_TAG and
+    a matching EKSClusterName parameter) is deleted; a missing stack is no change.
+    """
+    
+    stack_name = eks_ec2_stack_name(eks_cluster_name)
+    cfn = _new_client('cloudformation', region, clients)
+    result = DeploymentResult(
+        service=f'eks-ec2-{eks_cluster_name}',
+        stack_name=stack_name,
+        status='deleted',
+        alarm_count=0,
+        resource_count=0
+    )
+    
+    try:
+        try:
+            stack = cfn.describe_stacks(StackName=stack_name)['Stacks'][0]
+        except ClientError as e:
+            if 'does not exist' not in str(e):
+                raise
+            result.status = 'no-change'
+            return result
+        tags = {tag['Key']: tag['Value'] for tag in stack.get('Tags', [])}
+        parameters = {p['ParameterKey']: p.get('ParameterValue') for p in stack.get('Parameters', [])}
+        if TEMPLATE_HASH_TAG not in tags or parameters.get('EKSClusterName') != eks_cluster_name:
+            raise ValueError(f"{stack_name} was not deployed for EKS cluster {eks_cluster_name}, not deleting it")
+        print(f"🗑️  Deleting EKS EC2 alarm stack: {stack_name}")
+        cfn.delete_stack(StackName=stack_name)
+        print("✓ Stack deletion initiated")
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        result.status = 'failed'
+        result.error_message = str(e)
+    return result
+
+
+def shard_stack_name(service: str, index: int) -> str:
+    """Stack name for a resource-based shard; shard 0 keeps the unsharded name"""
+    
+    return f'{service}-alarms' if index == 0 else f'{service}-alarms-{index}'
+
+
+def _jump_hash(key: str, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach) of a string key.
+    
+    Going from n to n+1 buckets only moves keys into the new bucket, and
+    removing an empty last bucket moves nothing.
+    """
+    
+    k = int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big')
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        k = (k * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((k >> 33) + 1)))
+    return b
+
+
+def _shard_index(service: str, stack_name: str) -> Optional[int]:
+    """Index of a shard stack name from shard_stack_name(), or None for any other name"""
+    
+    match = re.fullmatch(rf'{re.escape(service)}-alarms(?:-([1-9]\d*))?', stack_name)
+    return int(match.group(1) or 0) if match else None
+
+
+def _existing_shard_indices(service: str, region: str, clients: Optional[ClientFactory] = None) -> Dict[int, bool]:
+    """Shard indices of the service's alarm stacks that currently exist.
+    
+    Maps each index to True for stacks with a matching SHARD_TAG, and to
+    False for shards deployed before the tag existed (named like a shard and
+    carrying TEMPLATE_HASH_TAG). Stacks that merely share the name pattern
+    are ignored.
+    """
+    
+    cfn = _new_client('cloudformation', region, clients)
+    live_statuses = [status for status in cfn.meta.service_model.shape_for('StackStatus').enum
+                     if status != 'DELETE_COMPLETE']
+    
+    indices = {}
+    for summary in _paginate(cfn, 'list_stacks', 'StackSummaries', StackStatusFilter=live_statuses):
+        index = _shard_index(service, summary['StackName'])
+        if index is None:
+            continue
+        stack = cfn.describe_stacks(StackName=summary['StackName'])['Stacks'][0]
+        tags = {tag['Key']: tag['Value'] for tag in stack.get('Tags', [])}
+        if tags.get(SHARD_TAG) == f'{service}/{index}':
+            indices[index] = True
+        elif SHARD_TAG not in tags and TEMPLATE_HASH_TAG in tags:
+            indices[index] = False
+    return indices
+
+
+def move_shard_resources(service: str, shards: List[List[str]], existing: Dict[int, bool], sns_topic: str,
+                         region: str, tag_value: str, clients: Optional[ClientFactory] = None) -> int:
+    """Move alarms whose resources hashed to another shard with a stack refactor.
+    
+    Growing the shard count moves some resources of every existing shard
+    into the new ones. Deploying both sides concurrently would create each
+    moved alarm in its new stack while the old stack still owns the name,
+    so the alarms are moved first, creating new shard stacks as needed.
+    Returns the number of alarms moved.
+    """
+    
+    generator = _generator()
+    config = generator.load_compiled()
+    cfn = _new_client('cloudformation', region, clients)
+    
+    # Where each alarm belongs now, by AlarmName
+    targets = {}
+    skeletons = {}
+    for index, shard in enumerate(shards):
+        if shard:
+            template = generator.build_template(service, shard, tag_value, config)
+            skeletons[index] = dict(template, Resources={})
+            for logical_id, resource in template['Resources'].items():
+                targets[resource['Properties']['AlarmName']] = (index, logical_id)
+    
+    deployed = {}
+    moves = []
+    for index in sorted(existing):
+        stack_name = shard_stack_name(service, index)
+        deployed[index] = generator.expand_template(
+            _template_dict(cfn.get_template(StackName=stack_name, TemplateStage='Original')['TemplateBody']))
+        for logical_id, resource in deployed[index].get('Resources', {}).items():
+            target = targets.get(resource.get('Properties', {}).get('AlarmName'))
+            if target and target[0] != index:
+                moves.append((index, logical_id, *target))
+    if not moves:
+        return 0
+    
+    print(f"   Moving {len(moves)} {service} alarm(s) to their new shard with a stack refactor...")
+    templates = {index: dict(template, Resources=dict(template.get('Resources', {})))
+                 for index, template in deployed.items()}
+    for source, _, destination, _ in moves:
+        templates.setdefault(destination, skeletons[destination])
+    for source, source_id, destination, destination_id in moves:
+        templates[destination]['Resources'][destination_id] = templates[source]['Resources'].pop(source_id)
+    
+    touched = {source for source, *_ in moves} | {destination for _, _, destination, _ in moves}
+    parameters = [{'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}]
+    definitions = []
+    for index in sorted(touched):
+        template = templates[index]
+        template.pop('Outputs', None)
+        if not template['Resources']:
+            template['Resources'] = REFACTOR_PLACEHOLDER
+        definitions.append(_refactor_definition(shard_stack_name(service, index), template, region, clients,
+                                                parameters))
+    mappings = [_mapping(shard_stack_name(service, source), source_id,
+                         shard_stack_name(service, destination), destination_id)
+                for source, source_id, destination, destination_id in moves]
+    
+    _run_stack_refactor(cfn, f'Move {len(moves)} {service} alarms between shards', definitions, mappings,
+                        create_stacks=any(index not in deployed for index in touched))
+    print(f"✓ {len(moves)} alarm(s) moved")
+    return len(moves)
+
+
+def plan_resource_shards(service: str, resource_ids: List[str], region: str,
+                         clients: Optional[ClientFactory] = None, consolidate: Optional[str] = None,
+                         sns_topic: Optional[str] = None, tag_value: Optional[str] = None) -> List[tuple]:
+    """Split a service's resources across stacks under the 500-resource limit.
+    
+    Resources are assigned to shards by a consistent hash of their ID, so one
+    new resource changes only the shard it lands in. The shard count never
+    drops below an existing shard that still has resources; shards whose
+    resources have all gone away are returned with an empty list, meaning
+    their stack should be deleted. Consolidated alarms fit in one stack, so
+    every other shard is deleted. Only stacks tagged with SHARD_TAG are
+    planned for deletion. When the shard count grows and sns_topic and
+    tag_value are given, alarms that change shard are moved first (see
+    move_shard_resources). Returns (stack_name, resource_ids) pairs.
+    """
+    
+    alarms_per_resource = len(_generator().load_compiled()['services'][service]['alarms'])
+    per_shard = MAX_STACK_RESOURCES // alarms_per_resource
+    
+    try:
+        existing = _existing_shard_indices(service, region, clients)
+    except Exception as e:
+        print(f"   Warning: Could not list existing {service} alarm stacks, no shards will be removed: {e}")
+        existing = {}
+    
+    def deletions(indices):
+        for i in sorted(indices):
+            if existing[i]:
+                yield shard_stack_name(service, i), []
+            else:
+                print(f"   Warning: Not deleting {shard_stack_name(service, i)}, it has no {SHARD_TAG} tag")
+    
+    if consolidate:
+        return [(shard_stack_name(service, 0), list(resource_ids))] + list(deletions(i for i in existing if i > 0))
+    
+    count = max(math.ceil(len(resource_ids) / per_shard), max(existing, default=0) + 1)
+    while True:
+        shards = [[] for _ in range(count)]
+        for resource_id in resource_ids:
+            shards[_jump_hash(resource_id, count)].append(resource_id)
+        if all(len(shard) <= per_shard for shard in shards):
+            break
+        count += 1
+    
+    # Dropping an empty last shard moves no resources
+    while len(shards) > 1 and not shards[-1]:
+        shards.pop()
+    
+    if sns_topic and tag_value and existing and any(shard and i not in existing for i, shard in enumerate(shards)):
+        move_shard_resources(service, shards, existing, sns_topic, region, tag_value, clients)
+    
+    plan = [(shard_stack_name(service, i), shard) for i, shard in enumerate(shards) if shard]
+    plan.extend(deletions(i for i in existing if i >= len(shards) or not shards[i]))
+    if len(shards) > 1:
+        print(f"   Sharding {len(resource_ids)} {service} resource(s) across {len(shards)} stacks "
+              f"(up to {per_shard} per stack)")
+    return plan
+
+
+def delete_shard_stack(service: str, stack_name: str, region: str,
+                       clients: Optional[ClientFactory] = None) -> DeploymentResult:
+    """Delete a resource-based shard stack that no longer has any resources.
+    
+    Refuses any stack without this service's SHARD_TAG.
+    """
+    
+    cfn = _new_client('cloudformation', region, clients)
+    print(f"🗑️  Deleting empty {service} shard stack: {stack_name}")
+    
+    try:
+        stack = cfn.describe_stacks(StackName=stack_name)['Stacks'][0]
+        tags = {tag['Key']: tag['Value'] for tag in stack.get('Tags', [])}
+        if tags.get(SHARD_TAG) != f'{service}/{_shard_index(service, stack_name)}':
+            raise ValueError(f"{stack_name} has no {SHARD_TAG} tag for {service}, not deleting it")
+        cfn.delete_stack(StackName=stack_name)
+        print("✓ Stack deletion initiated")
+        return DeploymentResult(
+            service=service,
+            stack_name=stack_name,
+            status='deleted',
+            alarm_count=0,
+            resource_count=0
+        )
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return DeploymentResult(
+            service=service,
+            stack_name=stack_name,
+            status='failed',
+            alarm_count=0,
+            resource_count=0,
+            error_message=str(e)
+        )
+
+
+def deploy_resource_based_alarms(service: str, resource_ids: List[str], 
+                                 sns_topic: str, region: str, tag_value: str,
+                                 stack_name: str = None,
+                                 clients: Optional[ClientFactory] = None,
+                                 consolidate: Optional[str] = None,
+                                 tag_key: Optional[str] = None) -> DeploymentResult:
+    """Deploy resource-based alarms for a service (or one shard of it)"""
+    
+    if not stack_name:
+        stack_name = f'{service}-alarms'
+    
+    print(f"📦 Deploying {service} alarms...")
+    print(f"   Stack: {stack_name}")
+    print(f"   Resources: {len(resource_ids)}")
+    
+    try:
+        # Generate template
+        template_body = generate_resource_based_template(service, resource_ids, tag_value, consolidate, tag_key)
+        
+        # Service config (already loaded by the generator) gives the alarm count
+        generator = _generator()
+        service_config = generator.load_compiled()['services'][service]
+        if consolidate == 'tag':
+            groups = 1
+        elif consolidate == 'dimension':
+            groups = len(generator.dimension_filters(service_config, resource_ids))
+        else:
+            groups = len(resource_ids)
+        alarm_count = groups * len(service_config['alarms'])
+        
+        # Check CloudFormation limit (plan_resource_shards keeps shards under it)
+        if alarm_count > MAX_STACK_RESOURCES:
+            raise ValueError(
+                f"Stack would have {alarm_count} alarms, exceeding CloudFormation's 500 resource limit. "
+                f"Consider splitting resources into multiple stacks or using tag-based alarms if supported."
+            )
+        
+        parameters = [
+            {'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}
+        ]
+        index = _shard_index(service, stack_name)
+        shard_tags = {SHARD_TAG: f'{service}/{index}'} if index is not None else None
+        return _deploy_stack(service, stack_name, template_body, parameters, region,
+                             alarm_count=alarm_count, resource_count=len(resource_ids), clients=clients,
+                             migrate_ids=True, stack_tags=shard_tags)
+    
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return DeploymentResult(
+            service=service,
+            stack_name=stack_name,
+            status='failed',
+            alarm_count=0,
+            resource_count=0,
+            error_message=str(e)
+        )
+
+
+def _alarm_request(properties: dict, sns_topic: str) -> dict:
+    """PutMetricAlarm arguments for a generated AWS::CloudWatch::Alarm resource"""
+    
+    request = dict(properties)
+    request['AlarmActions'] = [sns_topic if action == {'Ref': 'SNSTopicArn'} else action
+                               for action in properties['AlarmActions']]
+    return request
+
+
+def _comparable_alarm(alarm: dict) -> dict:
+    """The alarm fields the direct engine manages, normalized for comparison"""
+    
+    return {
+        'AlarmDescription': alarm.get('AlarmDescription', ''),
+        'Metrics': [{'Id': m['Id'], 'Expression': m.get('Expression'), 'Period': m.get('Period'),
+                     'ReturnData': m.get('ReturnData', True)} for m in alarm.get('Metrics', [])],
+        'Threshold': float(alarm['Threshold']),
+        'ComparisonOperator': alarm['ComparisonOperator'],
+        'EvaluationPeriods': int(alarm['EvaluationPeriods']),
+        'TreatMissingData': alarm.get('TreatMissingData', 'missing'),
+        'AlarmActions': sorted(alarm.get('AlarmActions', [])),
+    }
+
+
+def deploy_resource_based_alarms_direct(service: str, resource_ids: List[str], sns_topic: str,
+                                        region: str, tag_value: str, dry_run: bool = False,
+                                        rate: float = DEFAULT_DIRECT_RATE,
+                                        clients: Optional[ClientFactory] = None,
+                                        consolidate: Optional[str] = None,
+                                        tag_key: Optional[str] = None) -> DeploymentResult:
+    """Reconcile a service's alarms with PutMetricAlarm/DeleteAlarms, no CloudFormation.
+    
+    Existing alarms are read with a paginated describe_alarms on the
+    '<tag_value>-<service>-' name prefix and compared with the generated set.
+    Only new or changed alarms are written, concurrently under a rate limit,
+    and alarms no longer generated are deleted in batches of 100. The engine
+    owns every alarm under the prefix, so do not mix it with the
+    CloudFormation engine for the same service and tag value.
+    """
+    
+    generator = _generator()
+    config = generator.load_compiled()
+    prefix = generator.alarm_name_prefix(config['services'][service], tag_value)
+    
+    print(f"📦 Deploying {service} alarms directly (no CloudFormation)...")
+    print(f"   Alarm prefix: {prefix}")
+    print(f"   Resources: {len(resource_ids)}")
+    
+    def result(status, alarm_count, error_message=None):
+        return DeploymentResult(
+            service=service,
+            stack_name=f'direct:{prefix}*',
+            status=status,
+            alarm_count=alarm_count,
+            resource_count=len(resource_ids) if status != 'failed' else 0,
+            error_message=error_message,
+            engine='direct'
+        )
+    
+    try:
+        cloudwatch = _new_client('cloudwatch', region, clients)
+        template = generator.build_template(service, resource_ids, tag_value, config, consolidate, tag_key)
+        # CloudFormation's per-stack limit does not apply to direct alarms
+        lint_or_raise(template, [{'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}], max_resources=None)
+        desired = {}
+        for resource in template['Resources'].values():
+            request = _alarm_request(resource['Properties'], sns_topic)
+            desired[request['AlarmName']] = request
+        
+        existing = {alarm['AlarmName']: alarm for alarm in _paginate(
+            cloudwatch, 'describe_alarms', 'MetricAlarms', AlarmNamePrefix=prefix, AlarmTypes=['MetricAlarm'])}
+        
+        to_create = [name for name in desired if name not in existing]
+        to_update = [name for name in desired
+                     if name in existing and _comparable_alarm(existing[name]) != _comparable_alarm(desired[name])]
+        to_delete = sorted(name for name in existing if name not in desired)
+        print(f"   Diff: +{len(to_create)} create, ~{len(to_update)} update, -{len(to_delete)} delete, "
+              f"{len(desired) - len(to_create) - len(to_update)} unchanged")
+        
+        if dry_run:
+            for name in to_create:
+                print(f"   + {name}")
+            for name in to_update:
+                before, after = _comparable_alarm(existing[name]), _comparable_alarm(desired[name])
+                changes = ', '.join(f"{key}: {before[key]!r} -> {after[key]!r}"
+                                    for key in after if before[key] != after[key])
+                print(f"   ~ {name} ({changes})")
+            for name in to_delete:
+                print(f"   - {name}")
+            return result('dry-run', len(desired))
+        
+        limiter = RateLimiter(rate)
+        
+        def put(name):
+            limiter.acquire()
+            cloudwatch.put_metric_alarm(**desired[name])
+        
+        with ThreadPoolExecutor(max_workers=DIRECT_WORKERS, thread_name_prefix=f'put-{service}') as executor:
+            list(executor.map(put, to_create + to_update))
+        
+        for start in range(0, len(to_delete), DELETE_ALARMS_BATCH):
+            limiter.acquire()
+            cloudwatch.delete_alarms(AlarmNames=to_delete[start:start + DELETE_ALARMS_BATCH])
+        
+        if not (to_create or to_update or to_delete):
+            print("  No changes needed")
+            return result('no-change', len(desired))
+        print("✓ Alarms applied")
+        return result('created' if not existing else 'updated', len(desired))
+    
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return result('failed', 0, str(e))
+
+
+def _stack_failure_reason(cfn, stack: dict) -> str:
+    """Explain a failed or rolled-back stack using its first failed resource event"""
+    
+    reason = stack.get('StackStatusReason') or stack['StackStatus']
+    try:
+        events = cfn.describe_stack_events(StackName=stack['StackId'])['StackEvents']
+        failures = [event for event in events
+                    if event['ResourceStatus'].endswith('_FAILED')
+                    and 'cancelled' not in event.get('ResourceStatusReason', '')]
+        if failures:
+            event = failures[-1]  # Events are newest first, so this is the first failure
+            reason = f"{event['LogicalResourceId']}: {event.get('ResourceStatusReason', event['ResourceStatus'])}"
+    except Exception:
+        pass
+    return f"{stack['StackStatus']} - {reason}"
+
+
+def wait_for_stacks(results: List[DeploymentResult], region: str,
+                    timeout: float = DEFAULT_WAIT_TIMEOUT,
+                    clients: Optional[ClientFactory] = None) -> None:
+    """Poll every in-flight stack until it settles and record its final status.
+    
+    All stacks are tracked in a single polling loop. With more than a few in
+    flight, each round is one paginated describe_stacks call for the whole
+    region instead of one call per stack. The poll interval backs off with
+    jitter. Each result gets its final status, the failure reason and the
+    time from submission to completion, so waiting on many stacks takes about
+    as long as the slowest one.
+    """
+    
+    pending = {r.stack_name: r for r in results
+               if r.engine == 'cloudformation' and r.status in ('created', 'updated', 'deleted')}
+    if not pending:
+        return
+    
+    cfn = _new_client('cloudformation', region, clients)
+    print(f"\n⏳ Waiting for {len(pending)} stack(s) to complete...")
+    
+    deadline = time.monotonic() + timeout
+    delay = WAIT_POLL_INITIAL
+    while pending:
+        if len(pending) > WAIT_BATCH_THRESHOLD:
+            stacks = {stack['StackName']: stack
+                      for stack in _paginate(cfn, 'describe_stacks', 'Stacks')
+                      if stack['StackName'] in pending}
+        else:
+            stacks = {}
+            for stack_name in pending:
+                try:
+                    stacks[stack_name] = cfn.describe_stacks(StackName=stack_name)['Stacks'][0]
+                except cfn.exceptions.ClientError as e:
+                    if 'does not exist' not in str(e):
+                        raise
+        
+        now = time.monotonic()
+        for stack_name, result in list(pending.items()):
+            stack = stacks.get(stack_name)
+            # A deleted stack disappears from describe_stacks by name
+            status = stack['StackStatus'] if stack else 'DELETE_COMPLETE'
+            if status.endswith('_IN_PROGRESS'):
+                continue
+            
+            result.completion_seconds = now - result.submitted_at
+            if status in SUCCESS_STACK_STATUSES and (stack or result.status == 'deleted'):
+                result.status = SUCCESS_STACK_STATUSES[status]
+                print(f"   ✓ {stack_name}: {status} ({result.completion_seconds:.0f}s)")
+            else:
+                result.status = 'failed'
+                result.error_message = _stack_failure_reason(cfn, stack) if stack else f'{stack_name} no longer exists'
+                print(f"   ✗ {stack_name}: {result.error_message} ({result.completion_seconds:.0f}s)")
+            del pending[stack_name]
+        
+        if not pending:
+            break
+        if now >= deadline:
+            for stack_name, result in pending.items():
+                result.status = 'failed'
+                result.error_message = f'Timed out after {timeout:.0f}s waiting for stack to complete'
+                print(f"   ✗ {stack_name}: {result.error_message}")
+            break
+        
+        time.sleep(min(random.uniform(delay / 2, delay), max(0.0, deadline - now)))
+        delay = min(delay * 1.5, WAIT_POLL_MAX)
+
+
+@dataclass
+class DeploymentTarget:
+    """One account and region that a run deploys to"""
+    account_id: str
+    region: str
+    clients: Optional[ClientFactory] = None
+    results: List[DeploymentResult] = field(default_factory=list)
+    duration_seconds: float = 0.0
+    error_message: Optional[str] = None
+    
+    @property
+    def label(self) -> str:
+        return f'{self.account_id}/{self.region}'
+
+
+def deploy_target(target: DeploymentTarget, args, discovery_cache: Optional[DiscoveryCache] = None):
+    """Run the selected mode against one account and region, collecting results on the target"""
+    
+    region = target.region
+    clients = target.clients
+    sns_topic = args.sns_topic.replace('{account}', target.account_id).replace('{region}', region)
+    if args.mode == 'reconcile':
+        reconcile(target, args)
+        return
+    
+    scheduler = StackScheduler(args.max_parallel_stacks)
+    
+    # The tagging-api backend answers every service from one upfront pass
+    tagged_resources = None
+    if args.discovery_backend == 'tagging-api' and not args.resources:
+        if args.mode == 'resource-based':
+            services = [args.service]
+        elif args.mode == 'tag-based':
+            services = ['eks']
+        else:
+            services = ['eks'] + RESOURCE_BASED_SERVICES
+        # A resumed run that discovered every service already needs no pass
+        if not all(RUN_JOURNAL.has_discovered(target.label, service) for service in services):
+            with RUN_METRICS.span('discovery', service='tagging-api', target=target.label):
+                tagged_resources = discover_resources_tagging_api(services, region, args.tag_key, args.tag_value,
+                                                                  discovery_cache, clients)
+    
+    def discover(service):
+        resource_ids = RUN_JOURNAL.discovered(target.label, service)
+        if resource_ids is not None:
+            print(f"   Reusing {len(resource_ids)} {service} resource(s) from the run journal")
+            return resource_ids
+        if tagged_resources is not None:
+            resource_ids = tagged_resources[service]
+        else:
+            with RUN_METRICS.span('discovery', service=service, target=target.label):
+                resource_ids = discover_resources(service, region, args.tag_key, args.tag_value, discovery_cache,
+                                                  clients)
+        if resource_ids is not None:
+            RUN_JOURNAL.record_discovery(target.label, service, resource_ids)
+        return resource_ids
+    
+    def submit_tag_based(stack_name):
+        # Per-service stacks deploy concurrently; unchanged ones are skipped by their template hash
+        try:
+            children = plan_tag_based_stacks(args.tag_key, args.tag_value, sns_topic, region, stack_name, clients)
+        except Exception as e:
+            print(f"✗ Error: {e}")
+            target.results.append(DeploymentResult(
+                service='tag-based',
+                stack_name=stack_name or f'tag-based-alarms-{args.tag_value.lower()}',
+                status='failed',
+                alarm_count=0,
+                resource_count=0,
+                error_message=str(e)
+            ))
+            return
+        for child_name, template in children:
+            scheduler.submit(
+                deploy_tag_based_alarms,
+                child_name,
+                template,
+                args.tag_key,
+                args.tag_value,
+                sns_topic,
+                region,
+                clients
+            )
+    
+    def submit_resource_based(service, resource_ids):
+        if args.engine == 'direct':
+            scheduler.submit(
+                deploy_resource_based_alarms_direct,
+                service,
+                resource_ids,
+                sns_topic,
+                region,
+                args.tag_value,
+                args.dry_run,
+                args.direct_rate,
+                clients,
+                args.consolidate,
+                args.tag_key
+            )
+            return
+        
+        # Each shard is its own stack and deploys concurrently with the rest
+        try:
+            shards = plan_resource_shards(service, resource_ids, region, clients, args.consolidate, sns_topic,
+                                          args.tag_value)
+        except Exception as e:
+            print(f"✗ Error: {e}")
+            target.results.append(DeploymentResult(
+                service=service,
+                stack_name=shard_stack_name(service, 0),
+                status='failed',
+                alarm_count=0,
+                resource_count=len(resource_ids),
+                error_message=f"Moving alarms between shards failed: {e}"
+            ))
+            return
+        for stack_name, shard_ids in shards:
+            if shard_ids:
+                scheduler.submit(
+                    deploy_resource_based_alarms,
+                    service,
+                    shard_ids,
+                    sns_topic,
+                    region,
+                    args.tag_value,
+                    stack_name,
+                    clients,
+                    args.consolidate,
+                    args.tag_key
+                )
+            else:
+                scheduler.submit(delete_shard_stack, service, stack_name, region, clients)
+    
+    # Deploy based on mode
+    if args.mode == 'tag-based':
+        # Deploy regular tag-based alarms
+        submit_tag_based(args.stack_name)
+        
+        # Also deploy EKS EC2 node alarms (for EC2 instances belonging to EKS clusters)
+        print("\n" + "-" * 60)
+        print("🔍 Checking for EKS clusters with business tag...")
+        eks_clusters = discover('eks')
+        
+        if eks_clusters:
+            print(f"   Found {len(eks_clusters)} EKS cluster(s): {', '.join(eks_clusters)}")
+            for cluster_name in eks_clusters:
+                print(f"\n--- EKS EC2 Nodes: {cluster_name} ---")
+                scheduler.submit(
+                    deploy_eks_ec2_alarms,
+                    cluster_name,
+                    sns_topic,
+                    region,
+                    args.tag_value,
+                    clients
+                )
+        else:
+            print(f"   No EKS clusters found with tag {args.tag_key}={args.tag_value}, skipping EKS EC2 alarms")
+    
+    elif args.mode == 'resource-based':
+        # Get resource IDs via tag-based discovery or manual list
+        if args.resources:
+            # Manual override - use specified resources
+            resource_ids = args.resources
+            print(f"   Using manually specified resources: {', '.join(resource_ids)}")
+        else:
+            # Tag-based discovery (default)
+            resource_ids = discover(args.service)
+        
+        if resource_ids is None:
+            target.error_message = f"Discovery of {args.service} resources failed"
+            return
+        if not resource_ids:
+            print(f"✗ No {args.service} resources found with tag {args.tag_key}={args.tag_value}")
+            target.error_message = f"No {args.service} resources found with tag {args.tag_key}={args.tag_value}"
+            return
+        
+        submit_resource_based(args.service, resource_ids)
+    
+    elif args.mode == 'all':
+        # Stacks are independent: each one is handed to the scheduler as soon
+        # as it is known, so deployments overlap with the discovery that follows
+        print("\n" + "=" * 60)
+        print("PHASE 1: Tag-Based Alarms")
+        print("=" * 60)
+        submit_tag_based(None)
+        RUN_JOURNAL.record_phase(target.label, 'tag-based')
+        
+        # Deploy EKS EC2 alarms
+        print("\n" + "=" * 60)
+        print("PHASE 2: EKS EC2 Node Alarms")
+        print("=" * 60)
+        eks_clusters = discover('eks')
+        
+        if eks_clusters:
+            print(f"   Found {len(eks_clusters)} EKS cluster(s): {', '.join(eks_clusters)}")
+            for cluster_name in eks_clusters:
+                print(f"\n--- EKS Cluster: {cluster_name} ---")
+                scheduler.submit(
+                    deploy_eks_ec2_alarms,
+                    cluster_name,
+                    sns_topic,
+                    region,
+                    args.tag_value,
+                    clients
+                )
+        else:
+            print(f"  No EKS clusters found with tag {args.tag_key}={args.tag_value}, skipping")
+        RUN_JOURNAL.record_phase(target.label, 'eks')
+        
+        # Deploy resource-based for each service
+        print("\n" + "=" * 60)
+        print("PHASE 3: Resource-Based Alarms")
+        print("=" * 60)
+        
+        for service in RESOURCE_BASED_SERVICES:
+            print(f"\n--- {service.upper()} ---")
+            resource_ids = discover(service)
+            
+            if resource_ids:
+                submit_resource_based(service, resource_ids)
+            elif resource_ids is None:
+                print(f"  {service} discovery failed, its stacks are left as they are")
+            else:
+                print(f"  No {service} resources found with tag {args.tag_key}={args.tag_value}, skipping")
+        RUN_JOURNAL.record_phase(target.label, 'resource-based')
+    
+    target.results.extend(scheduler.results())
+    RUN_JOURNAL.record_results(target.label, target.results)
+    RUN_JOURNAL.record_phase(target.label, 'submitted')
+    for r in target.results:
+        if r.submitted_at:
+            RUN_METRICS.add_span('deploy', r.submitted_at - r.duration_seconds, r.duration_seconds,
+                                 service=r.service, stack=r.stack_name, target=target.label)
+    if args.wait:
+        with RUN_METRICS.span('wait', target=target.label):
+            wait_for_stacks(target.results, region, args.wait_timeout, clients)
+        RUN_JOURNAL.record_results(target.label, target.results, waited=True)
+        RUN_JOURNAL.record_phase(target.label, 'wait')
+
+
+def run_targets(targets: List[DeploymentTarget], args, caller_account: str,
+                discovery_cache: Optional[DiscoveryCache] = None):
+    """Deploy to every target, up to --max-parallel-targets at a time.
+    
+    Targets in the current account share the default client factory (one
+    client per service and region); each other account's target gets an
+    assumed-role factory. A failure in one target is recorded on it without
+    stopping the others.
+    """
+    
+    def run(target):
+        start = time.monotonic()
+        try:
+            if target.account_id != caller_account:
+                target.clients = assume_role_clients(target.account_id, args.assume_role_name, target.region)
+            cache = discovery_cache.for_account(target.account_id) if discovery_cache else None
+            deploy_target(target, args, cache)
+        except Exception as e:
+            print(f"✗ {target.label}: {e}")
+            target.error_message = str(e)
+        target.duration_seconds = time.monotonic() - start
+        RUN_METRICS.add_span('target', start, target.duration_seconds, target=target.label)
+    
+    if len(targets) == 1 or args.max_parallel_targets <= 1:
+        for target in targets:
+            run(target)
+        return
+    with ThreadPoolExecutor(max_workers=args.max_parallel_targets, thread_name_prefix='target') as pool:
+        list(pool.map(run, targets))
+
+
+@dataclass
+class ResourceChange:
+    """What one event says about one service's resources"""
+    service: str
+    resource_id: Optional[str]  # None: the event does not say which resource, rediscover the service
+    tagged: Optional[bool]  # Whether the resource now carries the filter tag, if the event says
+    event_time: float  # Epoch seconds the change happened
+
+
+def _service_for_arn(arn: str) -> tuple:
+    """(service, resource ID) for the ARN of an alarmed resource, else (None, None)"""
     
-    cfn = boto3.client('cloudformation', region_name=region)
+    parts = arn.split(':', 5)
+    if len(parts) < 6:
+        return None, None
+    for service, resource_type in TAGGING_API_RESOURCE_TYPES.items():
+        if resource_type.split(':')[0] == parts[2]:
+            resource_id = resource_id_from_arn(service, arn)
+            if resource_id is not None:
+                return service, resource_id
+    return None, None
+
+
+def parse_resource_event(event: dict, tag_key: str, tag_value: str, account_id: str,
+                         region: str) -> List[ResourceChange]:
+    """Map an EventBridge event to the resource changes it implies for this account and region.
     
-    if not stack_name:
-        stack_name = f'tag-based-alarms-{tag_value.lower()}'
+    "Tag Change on Resource" events carry the resource's full tag set, so they
+    add or remove the resource directly. CloudTrail API calls by the alarmed
+    services, and any other event naming an alarmed resource ARN, only say
+    that a service changed; it is rediscovered.
+    """
     
-    template_file = 'cloudformation-tag-based-alarms.yaml'
+    if event.get('account', account_id) != account_id or event.get('region', region) != region:
+        return []
+    try:
+        event_time = datetime.datetime.fromisoformat(event['time'].replace('Z', '+00:00')).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        event_time = time.time()
+    detail = event.get('detail') or {}
     
-    print(f"📦 Deploying tag-based alarms...")
-    print(f"   Stack: {stack_name}")
-    print(f"   Tag Filter: {tag_key}={tag_value}")
+    if event.get('detail-type') == 'Tag Change on Resource':
+        tagged = (detail.get('tags') or {}).get(tag_key) == tag_value
+        changes = []
+        for arn in event.get('resources', []):
+            service, resource_id = _service_for_arn(arn)
+            if service:
+                changes.append(ResourceChange(service, resource_id, tagged, event_time))
+        return changes
     
-    try:
-        # Read template
-        with open(template_file, 'r', encoding='utf-8', errors='ignore') as f:
-            template_body = f.read()
-        
-        # Check template size
-        template_size = len(template_body.encode('utf-8'))
-        print(f"   Template size: {template_size:,} bytes")
-        
-        # Use S3 if template is too large (> 51,200 bytes)
-        use_s3 = template_size > 51200
-        
-        if use_s3:
-            print(f"   Template exceeds 51KB limit, uploading to S3...")
-            template_url = upload_template_to_s3(
-                template_body, 
-                f'{stack_name}.yaml',
-                region
-            )
-        
-        # Build parameters (all required)
-        parameters = [
-            {'ParameterKey': 'TagKey', 'ParameterValue': tag_key},
-            {'ParameterKey': 'TagValue', 'ParameterValue': tag_value},
-            {'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}
-        ]
-        
-        # Prepare stack arguments
-        stack_args = {
-            'StackName': stack_name,
-            'Parameters': parameters
-        }
-        
-        if use_s3:
-            stack_args['TemplateURL'] = template_url
-        else:
-            stack_args['TemplateBody'] = template_body
-        
-        # Check if stack exists
-        try:
-            cfn.describe_stacks(StackName=stack_name)
-            print(f"   Stack exists, updating...")
-            
-            try:
-                cfn.update_stack(**stack_args)
-                print(f"✓ Stack update initiated")
-                return DeploymentResult(
-                    service='tag-based',
-                    stack_name=stack_name,
-                    status='updated',
-                    alarm_count=89,
-                    resource_count=6
-                )
-            except cfn.exceptions.ClientError as e:
-                if 'No updates are to be performed' in str(e):
-                    print(f"  No changes needed")
-                    return DeploymentResult(
-                        service='tag-based',
-                        stack_name=stack_name,
-                        status='no-change',
-                        alarm_count=89,
-                        resource_count=6
-                    )
-                raise
-        
-        except cfn.exceptions.ClientError as e:
-            if 'does not exist' in str(e):
-                print(f"   Creating new stack...")
-                cfn.create_stack(**stack_args)
-                print(f"✓ Stack creation initiated")
-                return DeploymentResult(
-                    service='tag-based',
-                    stack_name=stack_name,
-                    status='created',
-                    alarm_count=89,
-                    resource_count=6
-                )
-            raise
+    if event.get('detail-type') == 'AWS API Call via CloudTrail':
+        service = CLOUDTRAIL_EVENT_SOURCES.get(detail.get('eventSource'))
+        if service is None or detail.get('errorCode') or \
+                detail.get('eventName', '').startswith(('Describe', 'List', 'Get')):
+            return []
+        return [ResourceChange(service, None, None, event_time)]
     
-    except Exception as e:
-        print(f"✗ Error: {e}")
-        return DeploymentResult(
-            service='tag-based',
-            stack_name=stack_name,
-            status='failed',
-            alarm_count=0,
-            resource_count=0,
-            error_message=str(e)
-        )
+    services = {_service_for_arn(arn)[0] for arn in event.get('resources', [])} - {None}
+    return [ResourceChange(service, None, None, event_time) for service in sorted(services)]
 
 
-def discover_resources(service: str, region: str, tag_key: str, tag_value: str) -> List[str]:
-    """Discover resources of a service type filtered by tags"""
+class FileEventSource:
+    """EventBridge events from a JSON-lines file, a local stand-in for the SQS queue.
     
-    print(f"🔍 Discovering {service} resources with tag {tag_key}={tag_value} in {region}...")
+    Without follow the source is exhausted at the end of the file; with it,
+    lines appended later are picked up as they arrive.
+    """
     
-    try:
-        if service == 'eks':
-            # Discover EKS clusters with the business tag
-            client = boto3.client('eks', region_name=region)
-            response = client.list_clusters()
-            all_clusters = response.get('clusters', [])
-            
-            # Filter by tags
-            filtered_clusters = []
-            for cluster_name in all_clusters:
-                try:
-                    cluster_info = client.describe_cluster(name=cluster_name)
-                    tags = cluster_info.get('cluster', {}).get('tags', {})
-                    
-                    if tags.get(tag_key) == tag_value:
-                        filtered_clusters.append(cluster_name)
-                except Exception as e:
-                    print(f"   Warning: Could not get tags for EKS cluster {cluster_name}: {e}")
-            
-            resources = filtered_clusters
-        
-        elif service == 'opensearch':
-            client = boto3.client('opensearch', region_name=region)
-            sts = boto3.client('sts', region_name=region)
-            account_id = sts.get_caller_identity()['Account']
-            
-            response = client.list_domain_names()
-            all_domains = [domain['DomainName'] for domain in response['DomainNames']]
-            
-            # Filter by tags
-            filtered_domains = []
-            for domain_name in all_domains:
-                domain_arn = f'arn:aws:es:{region}:{account_id}:domain/{domain_name}'
-                try:
-                    tags_response = client.list_tags(ARN=domain_arn)
-                    tags = tags_response.get('TagList', [])
-                    
-                    # Check if domain has matching tag
-                    if any(tag['Key'] == tag_key and tag['Value'] == tag_value for tag in tags):
-                        filtered_domains.append(domain_name)
-                except Exception as e:
-                    print(f"   Warning: Could not get tags for {domain_name}: {e}")
-            
-            resources = filtered_domains
-        
-        elif service == 'kafka':
-            client = boto3.client('kafka', region_name=region)
-            response = client.list_clusters()
-            all_clusters = response['ClusterInfoList']
-            
-            # Filter by tags
-            filtered_clusters = []
-            for cluster in all_clusters:
-                tags = cluster.get('Tags', {})
-                if tags.get(tag_key) == tag_value:
-                    filtered_clusters.append(cluster['ClusterName'])
-            
-            resources = filtered_clusters
-        
-        elif service == 'rabbitmq':
-            client = boto3.client('mq', region_name=region)
-            response = client.list_brokers()
-            all_brokers = response['BrokerSummaries']
-            
-            # Filter by tags (need to describe each broker for tags)
-            filtered_brokers = []
-            for broker in all_brokers:
-                try:
-                    broker_details = client.describe_broker(BrokerId=broker['BrokerId'])
-                    tags = broker_details.get('Tags', {})
-                    if tags.get(tag_key) == tag_value:
-                        filtered_brokers.append(broker['BrokerId'])
-                except Exception as e:
-                    print(f"   Warning: Could not get tags for {broker['BrokerId']}: {e}")
-            
-            resources = filtered_brokers
-        
-        elif service == 'waf':
-            client = boto3.client('wafv2', region_name=region)
-            response = client.list_web_acls(Scope='REGIONAL')
-            all_acls = response['WebACLs']
-            
-            # Filter by tags
-            filtered_acls = []
-            for acl in all_acls:
-                try:
-                    acl_arn = acl['ARN']
-                    tags_response = client.list_tags_for_resource(ResourceARN=acl_arn)
-                    tags = {tag['Key']: tag['Value'] for tag in tags_response.get('TagInfoForResource', {}).get('TagList', [])}
-                    
-                    if tags.get(tag_key) == tag_value:
-                        filtered_acls.append(acl['Name'])  # Just the name, not tuple
-                except Exception as e:
-                    print(f"   Warning: Could not get tags for {acl['Name']}: {e}")
-            
-            resources = filtered_acls
-        
-        elif service == 'docdb':
-            client = boto3.client('docdb', region_name=region)
-            response = client.describe_db_clusters()
-            all_clusters = response['DBClusters']
-            
-            # Filter by tags
-            filtered_clusters = []
-            for cluster in all_clusters:
-                try:
-                    cluster_arn = cluster['DBClusterArn']
-                    tags_response = client.list_tags_for_resource(ResourceName=cluster_arn)
-                    tags = {tag['Key']: tag['Value'] for tag in tags_response.get('TagList', [])}
-                    
-                    if tags.get(tag_key) == tag_value:
-                        filtered_clusters.append(cluster['DBClusterIdentifier'])
-                except Exception as e:
-                    print(f"   Warning: Could not get tags for {cluster['DBClusterIdentifier']}: {e}")
-            
-            resources = filtered_clusters
+    def __init__(self, path: str, follow: bool = False):
+        self._file = open(path, 'r', encoding='utf-8')
+        self.follow = follow
+        self.exhausted = False
+    
+    def receive(self, wait: float) -> List[tuple]:
+        """(event, receipt) pairs for the lines available now; waits up to wait seconds when following"""
         
-        elif service == 'alb':
-            client = boto3.client('elbv2', region_name=region)
-            response = client.describe_load_balancers()
-            all_lbs = response['LoadBalancers']
-            
-            # Filter by tags and type (application load balancers only)
-            filtered_lbs = []
-            for lb in all_lbs:
-                if lb['Type'] != 'application':
-                    continue
-                    
+        deadline = time.monotonic() + wait
+        while True:
+            events = self._read()
+            if events or not self.follow:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(FOLLOW_POLL_INTERVAL, remaining))
+        if not events and not self.follow:
+            self.exhausted = True
+        return events
+    
+    def _read(self) -> List[tuple]:
+        events = []
+        while True:
+            position = self._file.tell()
+            line = self._file.readline()
+            if not line:
+                break
+            if self.follow and not line.endswith('\n'):
+                self._file.seek(position)  # Partly written, read it whole next time
+                break
+            if line.strip():
                 try:
-                    lb_arn = lb['LoadBalancerArn']
-                    tags_response = client.describe_tags(ResourceArns=[lb_arn])
-                    tags = {}
-                    if tags_response['TagDescriptions']:
-                        tags = {tag['Key']: tag['Value'] for tag in tags_response['TagDescriptions'][0].get('Tags', [])}
-                    
-                    if tags.get(tag_key) == tag_value:
-                        # Extract LoadBalancer dimension format: app/name/id
-                        lb_name = lb['LoadBalancerArn'].split(':loadbalancer/')[1]
-                        filtered_lbs.append(lb_name)
-                except Exception as e:
-                    print(f"   Warning: Could not get tags for {lb['LoadBalancerName']}: {e}")
-            
-            resources = filtered_lbs
-        
-        else:
-            raise ValueError(f"Unsupported service: {service}")
-        
-        print(f"   Found {len(resources)} {service} resource(s) with tag {tag_key}={tag_value}")
-        return resources
+                    events.append((json.loads(line), None))
+                except ValueError:
+                    print(f"   Warning: Skipping malformed event line: {line.strip()[:80]}")
+        return events
     
-    except Exception as e:
-        print(f"✗ Error discovering resources: {e}")
-        return []
+    def delete(self, receipts: List[str]):
+        pass
 
 
-def generate_resource_based_template(service: str, resource_ids: List[str], tag_value: str) -> str:
-    """Generate CloudFormation template for resource-based alarms"""
+class SqsEventSource:
+    """EventBridge events delivered to an SQS queue, directly or wrapped by SNS.
     
-    print(f"🔧 Generating template for {service}...")
+    Messages are deleted only once the stacks for their changes deployed, so
+    a failed deployment is retried when the message becomes visible again.
+    """
     
-    # Use simple YAML generator (no CDK required)
-    cmd = [
-        'python', 'generate-resource-alarms.py',
-        '--service', service,
-        '--tag-value', tag_value,
-        '--resources'] + resource_ids
+    exhausted = False
     
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        print(f"   Template generated successfully")
-        
-        # Read generated template
-        template_file = f'cloudformation-{service}-alarms-generated.yaml'
-        with open(template_file, 'r', encoding='utf-8', errors='ignore') as f:
-            return f.read()
+    def __init__(self, queue_url: str, region: str, clients: Optional[ClientFactory] = None):
+        self.queue_url = queue_url
+        self.sqs = _new_client('sqs', region, clients)
     
-    except subprocess.CalledProcessError as e:
-        print(f"✗ Template generation failed: {e.stderr}")
-        raise
-    except FileNotFoundError:
-        print(f"✗ Generated template not found")
-        raise
+    def receive(self, wait: float) -> List[tuple]:
+        response = self.sqs.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=SQS_BATCH,
+                                            WaitTimeSeconds=max(0, min(SQS_WAIT_SECONDS, int(wait))))
+        events = []
+        for message in response.get('Messages', []):
+            try:
+                event = json.loads(message['Body'])
+                if 'detail-type' not in event and 'Message' in event:
+                    event = json.loads(event['Message'])
+            except ValueError:
+                print(f"   Warning: Dropping malformed message {message.get('MessageId')}")
+                event = {}
+            events.append((event, message['ReceiptHandle']))
+        return events
+    
+    def delete(self, receipts: List[str]):
+        for start in range(0, len(receipts), SQS_BATCH):
+            self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=[
+                {'Id': str(i), 'ReceiptHandle': receipt}
+                for i, receipt in enumerate(receipts[start:start + SQS_BATCH])])
 
 
-def deploy_eks_ec2_alarms(eks_cluster_name: str, sns_topic: str, region: str, 
-                          tag_value: str) -> DeploymentResult:
-    """Deploy EKS EC2 node alarms for a specific EKS cluster"""
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def reconcile(target: DeploymentTarget, args):
+    """Redeploy only the stacks that resource events affect, until the events run out.
     
-    cfn = boto3.client('cloudformation', region_name=region)
-    stack_name = f'eks-ec2-alarms-{eks_cluster_name}'
-    template_file = 'cloudformation-eks-ec2-alarms.yaml'
+    Events are grouped per service and a service is flushed once it has been
+    quiet for --debounce seconds (or RECONCILE_MAX_DELAY after its first
+    event). A service is discovered on its first flush and when an event does
+    not say which resource changed; tag change events are applied directly.
+    Only shard stacks whose resources changed are redeployed (and EKS EC2
+    stacks of clusters that gained or lost the tag), and each flush waits for
+    its stacks so the time from event to active alarm can be reported. A
+    flush whose discovery or stacks fail keeps its events (and their SQS
+    messages) and is retried after RECONCILE_RETRY_DELAY. Discovery always
+    lists afresh: a cached listing may predate the event being reconciled.
+    """
     
-    print(f"📦 Deploying EKS EC2 alarms for cluster: {eks_cluster_name}...")
-    print(f"   Stack: {stack_name}")
-    print(f"   Tag filter: eks:cluster-name={eks_cluster_name}")
+    region = target.region
+    clients = target.clients
+    sns_topic = args.sns_topic.replace('{account}', target.account_id).replace('{region}', region)
+    if args.events_queue_url:
+        source = SqsEventSource(args.events_queue_url, region, clients)
+    else:
+        source = FileEventSource(args.events_file, args.follow)
     
-    try:
-        # Read template
-        with open(template_file, 'r', encoding='utf-8', errors='ignore') as f:
-            template_body = f.read()
-        
-        # Build parameters
-        parameters = [
-            {'ParameterKey': 'EKSClusterName', 'ParameterValue': eks_cluster_name},
-            {'ParameterKey': 'BusinessTagValue', 'ParameterValue': tag_value},
-            {'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}
-        ]
-        
-        # Check if stack exists
-        try:
-            cfn.describe_stacks(StackName=stack_name)
-            print(f"   Stack exists, updating...")
-            
-            try:
-                cfn.update_stack(
-                    StackName=stack_name,
-                    TemplateBody=template_body,
-                    Parameters=parameters
-                )
-                print(f"✓ Stack update initiated")
-                return DeploymentResult(
-                    service=f'eks-ec2-{eks_cluster_name}',
-                    stack_name=stack_name,
-                    status='updated',
-                    alarm_count=EKS_EC2_ALARM_COUNT,
-                    resource_count=1
-                )
-            except cfn.exceptions.ClientError as e:
-                if 'No updates are to be performed' in str(e):
-                    print(f"  No changes needed")
-                    return DeploymentResult(
-                        service=f'eks-ec2-{eks_cluster_name}',
-                        stack_name=stack_name,
-                        status='no-change',
-                        alarm_count=EKS_EC2_ALARM_COUNT,
-                        resource_count=1
-                    )
-                raise
-        
-        except cfn.exceptions.ClientError as e:
-            if 'does not exist' in str(e):
-                print(f"   Creating new stack...")
-                cfn.create_stack(
-                    StackName=stack_name,
-                    TemplateBody=template_body,
-                    Parameters=parameters
-                )
-                print(f"✓ Stack creation initiated")
-                return DeploymentResult(
-                    service=f'eks-ec2-{eks_cluster_name}',
-                    stack_name=stack_name,
-                    status='created',
-                    alarm_count=EKS_EC2_ALARM_COUNT,
-                    resource_count=1
-                )
-            raise
+    inventory = {}  # service -> {resource_id: None}, in discovery order
+    deployed = {}  # stack name -> resource IDs it was last deployed with (EKS EC2: [cluster name])
+    pending = {}  # service -> changes and receipts waiting for the debounce
+    time_to_alarm = []
+    counts = {'events': 0, 'ignored': 0, 'flushes': 0}
+    deadline = time.monotonic() + args.max_runtime if args.max_runtime else None
     
-    except Exception as e:
-        print(f"✗ Error: {e}")
-        return DeploymentResult(
-            service=f'eks-ec2-{eks_cluster_name}',
-            stack_name=stack_name,
-            status='failed',
-            alarm_count=0,
-            resource_count=0,
-            error_message=str(e)
-        )
-
-
-def deploy_resource_based_alarms(service: str, resource_ids: List[str], 
-                                 sns_topic: str, region: str, tag_value: str) -> DeploymentResult:
-    """Deploy resource-based alarms for a service"""
+    def due_in(batch, now):
+        due = min(batch['last'] + args.debounce, batch['first'] + RECONCILE_MAX_DELAY)
+        return max(due, batch.get('retry_at', 0.0)) - now
     
-    cfn = boto3.client('cloudformation', region_name=region)
-    stack_name = f'{service}-alarms'
+    def retry_later(batch, service, reason):
+        batch['retry_at'] = time.monotonic() + RECONCILE_RETRY_DELAY
+        pending[service] = batch
+        print(f"✗ {service}: {reason}, {len(batch['changes'])} change(s) kept for retry")
     
-    print(f"📦 Deploying {service} alarms...")
-    print(f"   Stack: {stack_name}")
-    print(f"   Resources: {len(resource_ids)}")
+    def flush(service):
+        batch = pending.pop(service)
+        changes = batch['changes']
+        print(f"\n🔄 {service}: {len(changes)} change(s)")
+        with RUN_METRICS.span('reconcile', service=service, target=target.label):
+            previous = inventory.get(service)
+            if previous is None or any(change.resource_id is None for change in changes):
+                discovered = discover_resources(service, region, args.tag_key, args.tag_value, None, clients)
+                if discovered is None:
+                    # Never plan from a failed listing: an empty fleet would delete every shard
+                    retry_later(batch, service, "discovery failed")
+                    return
+                resources = dict.fromkeys(discovered)
+            else:
+                resources = dict(previous)
+            # Tag events may be newer than what discovery sees yet, so apply them on top
+            for change in changes:
+                if change.resource_id is not None:
+                    if change.tagged:
+                        resources[change.resource_id] = None
+                    else:
+                        resources.pop(change.resource_id, None)
+            inventory[service] = resources
+            resource_ids = list(resources)
+            
+            scheduler = StackScheduler(args.max_parallel_stacks)
+            planned = {}
+            if service == 'eks':
+                for cluster_name in resource_ids:
+                    stack_name = eks_ec2_stack_name(cluster_name)
+                    if stack_name not in deployed:
+                        planned[stack_name] = [cluster_name]
+                        scheduler.submit(deploy_eks_ec2_alarms, cluster_name, sns_topic, region, args.tag_value,
+                                         clients)
+                # Clusters this run deployed, plus any an event untagged or deleted
+                gone = {ids[0] for name, ids in deployed.items() if ids and name == eks_ec2_stack_name(ids[0])}
+                gone.update(change.resource_id for change in changes if change.resource_id is not None)
+                gone.difference_update(resources)
+                for cluster_name in sorted(gone):
+                    planned[eks_ec2_stack_name(cluster_name)] = []
+                    scheduler.submit(delete_eks_ec2_stack, cluster_name, region, clients)
+            elif args.engine == 'direct':
+                scheduler.submit(deploy_resource_based_alarms_direct, service, resource_ids, sns_topic, region,
+                                 args.tag_value, False, args.direct_rate, clients, args.consolidate, args.tag_key)
+            else:
+                try:
+                    shards = plan_resource_shards(service, resource_ids, region, clients, args.consolidate,
+                                                  sns_topic, args.tag_value)
+                except Exception as e:
+                    retry_later(batch, service, f"moving alarms between shards failed ({e})")
+                    return
+                for stack_name, shard_ids in shards:
+                    if deployed.get(stack_name) == shard_ids:
+                        continue
+                    planned[stack_name] = shard_ids
+                    if shard_ids:
+                        scheduler.submit(deploy_resource_based_alarms, service, shard_ids, sns_topic, region,
+                                         args.tag_value, stack_name, clients, args.consolidate, args.tag_key)
+                    else:
+                        scheduler.submit(delete_shard_stack, service, stack_name, region, clients)
+            results = scheduler.results()
+            if results:
+                wait_for_stacks(results, region, args.wait_timeout, clients)
+        
+        finished = time.time()
+        counts['flushes'] += 1
+        # Failed attempts are reported only if their batch is still pending at exit
+        target.results.extend(r for r in results if r.status != 'failed')
+        for r in results:
+            if r.status != 'failed' and r.stack_name in planned:
+                if service == 'eks' and not planned[r.stack_name]:
+                    deployed.pop(r.stack_name, None)
+                else:
+                    deployed[r.stack_name] = planned[r.stack_name]
+        failed = [r for r in results if r.status == 'failed']
+        if failed:
+            batch['failed'] = failed
+            retry_later(batch, service, f"{len(failed)} stack(s) failed")
+            return
+        latencies = [finished - change.event_time for change in changes]
+        for latency in latencies:
+            RUN_METRICS.add_span('time-to-alarm', time.monotonic() - latency, latency, service=service,
+                                 target=target.label)
+        time_to_alarm.extend(latencies)
+        source.delete(batch['receipts'])
+        print(f"✓ {service}: {len(resource_ids)} resource(s), {len(results)} stack(s) redeployed, "
+              f"time to alarm {max(latencies):.1f}s")
     
+    print(f"👂 Reconciling from {args.events_queue_url or args.events_file} "
+          f"(debounce {args.debounce:g}s, {len(RESOURCE_BASED_SERVICES) + 1} services)")
     try:
-        # Generate template
-        template_body = generate_resource_based_template(service, resource_ids, tag_value)
-        
-        # Load service config to get alarm count
-        with open('alarm-config-resource-based.yaml', 'r', encoding='utf-8', errors='ignore') as f:
-            config = yaml.safe_load(f)
-        alarm_count = len(resource_ids) * len(config['services'][service]['alarms'])
-        
-        # Check CloudFormation limit
-        if alarm_count > 500:
-            raise ValueError(
-                f"Stack would have {alarm_count} alarms, exceeding CloudFormation's 500 resource limit. "
-                f"Consider splitting resources into multiple stacks or using tag-based alarms if supported."
-            )
-        
-        # Check if stack exists
-        try:
-            cfn.describe_stacks(StackName=stack_name)
-            print(f"   Stack exists, updating...")
+        while True:
+            now = time.monotonic()
+            for service in [s for s, batch in pending.items() if due_in(batch, now) <= 0 or source.exhausted]:
+                flush(service)
+            if source.exhausted or (deadline is not None and now >= deadline):
+                break
             
-            try:
-                cfn.update_stack(
-                    StackName=stack_name,
-                    TemplateBody=template_body,
-                    Parameters=[
-                        {'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}
-                    ]
-                )
-                print(f"✓ Stack update initiated")
-                return DeploymentResult(
-                    service=service,
-                    stack_name=stack_name,
-                    status='updated',
-                    alarm_count=alarm_count,
-                    resource_count=len(resource_ids)
-                )
-            except cfn.exceptions.ClientError as e:
-                if 'No updates are to be performed' in str(e):
-                    print(f"  No changes needed")
-                    return DeploymentResult(
-                        service=service,
-                        stack_name=stack_name,
-                        status='no-change',
-                        alarm_count=alarm_count,
-                        resource_count=len(resource_ids)
-                    )
-                raise
-        
-        except cfn.exceptions.ClientError as e:
-            if 'does not exist' in str(e):
-                print(f"   Creating new stack...")
-                cfn.create_stack(
-                    StackName=stack_name,
-                    TemplateBody=template_body,
-                    Parameters=[
-                        {'ParameterKey': 'SNSTopicArn', 'ParameterValue': sns_topic}
-                    ]
-                )
-                print(f"✓ Stack creation initiated")
-                return DeploymentResult(
-                    service=service,
-                    stack_name=stack_name,
-                    status='created',
-                    alarm_count=alarm_count,
-                    resource_count=len(resource_ids)
-                )
-            raise
+            wait = min([due_in(batch, now) for batch in pending.values()] + [SQS_WAIT_SECONDS])
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            for event, receipt in source.receive(max(wait, 0)):
+                counts['events'] += 1
+                changes = parse_resource_event(event, args.tag_key, args.tag_value, target.account_id, region)
+                if not changes:
+                    counts['ignored'] += 1
+                    if receipt is not None:
+                        source.delete([receipt])
+                    continue
+                received = time.monotonic()
+                for change in changes:
+                    batch = pending.setdefault(change.service, {'changes': [], 'receipts': [],
+                                                                'first': received, 'last': received})
+                    batch['changes'].append(change)
+                    batch['last'] = received
+                    if receipt is not None and receipt not in batch['receipts']:
+                        batch['receipts'].append(receipt)
+    except KeyboardInterrupt:
+        print("\nInterrupted, deploying pending changes...")
+        for service in list(pending):
+            flush(service)
     
-    except Exception as e:
-        print(f"✗ Error: {e}")
-        return DeploymentResult(
-            service=service,
-            stack_name=stack_name,
-            status='failed',
-            alarm_count=0,
-            resource_count=0,
-            error_message=str(e)
-        )
+    if pending:
+        kept = sum(len(batch['changes']) for batch in pending.values())
+        print(f"⚠️  {kept} change(s) for {', '.join(sorted(pending))} not reconciled, their events were not "
+              f"acknowledged")
+        target.error_message = f"Changes not reconciled for {', '.join(sorted(pending))}"
+        for batch in pending.values():
+            target.results.extend(batch.get('failed', []))
+    
+    print(f"\n👂 Reconciled {counts['events']} event(s) ({counts['ignored']} ignored) in {counts['flushes']} "
+          f"flush(es)")
+    if time_to_alarm:
+        print(f"   Time to alarm: p50 {_percentile(time_to_alarm, 0.5):.1f}s, "
+              f"p95 {_percentile(time_to_alarm, 0.95):.1f}s, max {max(time_to_alarm):.1f}s")
 
 
 def main():
@@ -615,12 +2842,18 @@ Examples:
 
   # Deploy everything (tag-based + EKS EC2 + resource-based)
   python deploy-cloudwatch-alarms.py --mode all --tag-key Environment --tag-value Production
+
+  # Deploy everything to two accounts in two regions
+  python deploy-cloudwatch-alarms.py --mode all --regions us-east-1 eu-west-1 \\
+    --accounts 111111111111 222222222222 --assume-role-name CloudWatchAlarmsDeployer \\
+    --sns-topic 'arn:aws:sns:{region}:{account}:alerts'
         """
     )
     
     parser.add_argument('--mode', required=True,
-                        choices=['tag-based', 'resource-based', 'all'],
-                        help='Deployment mode')
+                        choices=['tag-based', 'resource-based', 'all', 'reconcile'],
+                        help='Deployment mode; reconcile runs until its events run out, redeploying '
+                             'only the stacks they affect')
     parser.add_argument('--service',
                         choices=RESOURCE_BASED_SERVICES,
                         help='Service for resource-based mode')
@@ -634,15 +2867,80 @@ Examples:
                         help='Auto-discover all resources for resource-based mode')
     parser.add_argument('--region', default='us-east-1',
                         help='AWS region (default: us-east-1)')
+    parser.add_argument('--regions', nargs='+', metavar='REGION',
+                        help='Deploy to each of these regions (overrides --region)')
+    parser.add_argument('--accounts', nargs='+', metavar='ACCOUNT_ID',
+                        help='Deploy to each of these accounts via --assume-role-name '
+                             '(default: the current account)')
+    parser.add_argument('--assume-role-name',
+                        help='Role assumed in every account listed in --accounts other than the current one')
+    parser.add_argument('--max-parallel-targets', type=int, default=DEFAULT_MAX_PARALLEL_TARGETS,
+                        help=f'Maximum account/region targets deployed concurrently; 1 runs serially '
+                             f'(default: {DEFAULT_MAX_PARALLEL_TARGETS})')
     parser.add_argument('--sns-topic', required=True,
-                        help='SNS topic ARN for notifications (REQUIRED)')
+                        help='SNS topic ARN for notifications (REQUIRED); {account} and {region} '
+                             'are replaced per target')
     parser.add_argument('--stack-name',
-                        help='Custom stack name (optional)')
+                        help='Custom tag-based stack name prefix; stacks are NAME-ec2, NAME-rds, ... (optional)')
+    parser.add_argument('--discovery-backend', choices=DISCOVERY_BACKENDS, default='per-service',
+                        help='per-service lists each service and filters tags client-side; '
+                             'tagging-api makes one Resource Groups Tagging API pass for all '
+                             'services (default: per-service)')
+    parser.add_argument('--discovery-cache-ttl', type=float, default=0, metavar='SECONDS',
+                        help=f'Reuse discovery results cached in {DISCOVERY_CACHE_FILE} for this '
+                             f'long without calling AWS (default: 0, disabled)')
+    parser.add_argument('--incremental-discovery', action='store_true',
+                        help='Re-list resources but only look up tags for resource IDs not already cached')
+    parser.add_argument('--refresh-discovery', action='store_true',
+                        help='Ignore cached discovery results and rewrite the cache')
+    parser.add_argument('--engine', choices=ENGINES, default='cloudformation',
+                        help='How resource-based alarms are deployed: CloudFormation stacks, or direct '
+                             'PutMetricAlarm/DeleteAlarms calls that only apply the diff (default: cloudformation)')
+    parser.add_argument('--direct-rate', type=float, default=DEFAULT_DIRECT_RATE, metavar='PER_SECOND',
+                        help=f'CloudWatch write requests per second for --engine direct '
+                             f'(default: {DEFAULT_DIRECT_RATE:g})')
+    parser.add_argument('--consolidate', choices=CONSOLIDATE_MODES,
+                        help='Resource-based alarms: one Metrics Insights GROUP BY alarm per metric and '
+                             'severity for all of a service\'s resources, selected by OR-ed resource IDs '
+                             '(dimension) or by the --tag-key/--tag-value tag (tag); default: one alarm '
+                             'per resource')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='With --mode resource-based --engine direct, print the alarm diff without applying it')
+    parser.add_argument('--api-rate', action='append', default=[], metavar='SERVICE.Operation=PER_SECOND',
+                        help='Override the request rate for one API, e.g. cloudformation.CreateStack=1; '
+                             '0 removes the limit (repeatable)')
+    parser.add_argument('--wait', action='store_true',
+                        help='Wait for every stack operation to finish and report its final status')
+    parser.add_argument('--wait-timeout', type=float, default=DEFAULT_WAIT_TIMEOUT, metavar='SECONDS',
+                        help=f'Give up waiting after this long (default: {DEFAULT_WAIT_TIMEOUT})')
+    parser.add_argument('--max-parallel-stacks', type=int, default=DEFAULT_MAX_PARALLEL_STACKS,
+                        help=f'Maximum stacks deployed concurrently; 1 runs serially '
+                             f'(default: {DEFAULT_MAX_PARALLEL_STACKS})')
+    parser.add_argument('--events-file', metavar='PATH',
+                        help='Reconcile mode: EventBridge events, one JSON object per line')
+    parser.add_argument('--events-queue-url', metavar='URL',
+                        help='Reconcile mode: SQS queue receiving EventBridge events (tag changes, CloudTrail)')
+    parser.add_argument('--follow', action='store_true',
+                        help='Reconcile mode: keep reading --events-file as lines are appended')
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE_SECONDS, metavar='SECONDS',
+                        help=f'Reconcile mode: redeploy a service once its events have been quiet this long '
+                             f'(default: {DEFAULT_DEBOUNCE_SECONDS:g})')
+    parser.add_argument('--max-runtime', type=float, default=0, metavar='SECONDS',
+                        help='Reconcile mode: stop after this long (default: 0, run until the events run out)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the run in the run journal: reuse its discovery and skip stacks it finished')
+    parser.add_argument('--journal', default=RUN_JOURNAL_FILE, metavar='PATH',
+                        help=f'Run journal written during the run and read by --resume (default: {RUN_JOURNAL_FILE})')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print time per phase and service and the slowest AWS API operations')
+    parser.add_argument('--metrics-out', action='append', default=[], metavar='PATH',
+                        help='Write run metrics to PATH: a Prometheus textfile if it ends in .prom, '
+                             'JSON otherwise (repeatable)')
     
     args = parser.parse_args()
     
     # Validate prerequisites
-    validate_prerequisites()
+    account_id = validate_prerequisites()
     
     # Validation
     if args.mode == 'resource-based':
@@ -654,121 +2952,60 @@ Examples:
         # Manual resource list is optional (for override)
         if args.resources and args.discover_all:
             parser.error("Cannot specify both --resources and --discover-all")
+    if args.mode == 'reconcile' and bool(args.events_file) == bool(args.events_queue_url):
+        parser.error("--mode reconcile needs exactly one of --events-file and --events-queue-url")
+    if args.resume and (args.mode == 'reconcile' or args.dry_run):
+        parser.error("--resume does not apply to --mode reconcile or --dry-run")
+    if args.dry_run and (args.engine != 'direct' or args.mode != 'resource-based'):
+        parser.error("--dry-run is only supported with --mode resource-based --engine direct")
+    for override in args.api_rate:
+        operation, _, rate = override.partition('=')
+        if not re.fullmatch(r'[a-z0-9-]+\.[A-Za-z0-9]+', operation) or not re.fullmatch(r'\d+(\.\d*)?', rate):
+            parser.error(f"Invalid --api-rate {override}, expected SERVICE.Operation=PER_SECOND")
+        API_THROTTLE.rates[operation] = float(rate)
+    
+    regions = list(dict.fromkeys(args.regions or [args.region]))
+    accounts = list(dict.fromkeys(args.accounts or [account_id]))
+    for account in accounts:
+        if not re.fullmatch(r'\d{12}', account):
+            parser.error(f"Invalid account ID: {account}")
+    if any(account != account_id for account in accounts) and not args.assume_role_name:
+        parser.error("--assume-role-name is required to deploy to accounts other than the current one")
+    targets = [DeploymentTarget(account, region) for account in accounts for region in regions]
+    if args.mode == 'reconcile' and len(targets) > 1:
+        parser.error("--mode reconcile runs against a single account and region")
+    multi_target = len(targets) > 1
     
     print("🚀 CloudWatch Alarms Deployment")
     print(f"   Mode: {args.mode}")
-    print(f"   Region: {args.region}")
+    if multi_target:
+        print(f"   Targets: {len(targets)} ({len(accounts)} account(s) x {len(regions)} region(s))")
+        if len(regions) > 1 and '{region}' not in args.sns_topic:
+            print("   Warning: --sns-topic has no {region} placeholder; every region will notify the same topic")
+    else:
+        print(f"   Region: {targets[0].region}")
     print("=" * 60)
     
-    results = []
+    run_start = time.monotonic()
     
-    # Deploy based on mode
-    if args.mode == 'tag-based':
-        # Deploy regular tag-based alarms
-        result = deploy_tag_based_alarms(
-            args.tag_key,
-            args.tag_value,
-            args.sns_topic,
-            args.region,
-            args.stack_name
-        )
-        results.append(result)
-        
-        # Also deploy EKS EC2 node alarms (for EC2 instances belonging to EKS clusters)
-        print("\n" + "-" * 60)
-        print("🔍 Checking for EKS clusters with business tag...")
-        eks_clusters = discover_resources('eks', args.region, args.tag_key, args.tag_value)
-        
-        if eks_clusters:
-            print(f"   Found {len(eks_clusters)} EKS cluster(s): {', '.join(eks_clusters)}")
-            for cluster_name in eks_clusters:
-                print(f"\n--- EKS EC2 Nodes: {cluster_name} ---")
-                result = deploy_eks_ec2_alarms(
-                    cluster_name,
-                    args.sns_topic,
-                    args.region,
-                    args.tag_value
-                )
-                results.append(result)
-        else:
-            print(f"   No EKS clusters found with tag {args.tag_key}={args.tag_value}, skipping EKS EC2 alarms")
+    # Dry runs and reconcile change nothing that a rerun could skip
+    if args.mode != 'reconcile' and not args.dry_run:
+        run = {key: getattr(args, key) for key in ('mode', 'service', 'resources', 'tag_key', 'tag_value', 'sns_topic',
+                                                   'engine', 'consolidate', 'stack_name')}
+        run['targets'] = [target.label for target in targets]
+        try:
+            RUN_JOURNAL.open(args.journal, run, args.resume)
+        except ValueError as e:
+            parser.error(f"{e}; rerun it without --resume")
     
-    elif args.mode == 'resource-based':
-        # Get resource IDs via tag-based discovery or manual list
-        if args.resources:
-            # Manual override - use specified resources
-            resource_ids = args.resources
-            print(f"   Using manually specified resources: {', '.join(resource_ids)}")
-        else:
-            # Tag-based discovery (default)
-            resource_ids = discover_resources(args.service, args.region, args.tag_key, args.tag_value)
-        
-        if not resource_ids:
-            print(f"✗ No {args.service} resources found with tag {args.tag_key}={args.tag_value}")
-            sys.exit(1)
-        
-        result = deploy_resource_based_alarms(
-            args.service,
-            resource_ids,
-            args.sns_topic,
-            args.region,
-            args.tag_value
-        )
-        results.append(result)
+    discovery_cache = None
+    if args.discovery_cache_ttl > 0 or args.incremental_discovery or args.refresh_discovery:
+        discovery_cache = DiscoveryCache(DISCOVERY_CACHE_FILE, account_id, args.discovery_cache_ttl,
+                                         args.incremental_discovery, args.refresh_discovery)
     
-    elif args.mode == 'all':
-        # Deploy tag-based first
-        print("\n" + "=" * 60)
-        print("PHASE 1: Tag-Based Alarms")
-        print("=" * 60)
-        result = deploy_tag_based_alarms(
-            args.tag_key,
-            args.tag_value,
-            args.sns_topic,
-            args.region
-        )
-        results.append(result)
-        
-        # Deploy EKS EC2 alarms
-        print("\n" + "=" * 60)
-        print("PHASE 2: EKS EC2 Node Alarms")
-        print("=" * 60)
-        eks_clusters = discover_resources('eks', args.region, args.tag_key, args.tag_value)
-        
-        if eks_clusters:
-            print(f"   Found {len(eks_clusters)} EKS cluster(s): {', '.join(eks_clusters)}")
-            for cluster_name in eks_clusters:
-                print(f"\n--- EKS Cluster: {cluster_name} ---")
-                result = deploy_eks_ec2_alarms(
-                    cluster_name,
-                    args.sns_topic,
-                    args.region,
-                    args.tag_value
-                )
-                results.append(result)
-        else:
-            print(f"  No EKS clusters found with tag {args.tag_key}={args.tag_value}, skipping")
-        
-        # Deploy resource-based for each service
-        print("\n" + "=" * 60)
-        print("PHASE 3: Resource-Based Alarms")
-        print("=" * 60)
-        
-        for service in RESOURCE_BASED_SERVICES:
-            print(f"\n--- {service.upper()} ---")
-            resource_ids = discover_resources(service, args.region, args.tag_key, args.tag_value)
-            
-            if resource_ids:
-                result = deploy_resource_based_alarms(
-                    service,
-                    resource_ids,
-                    args.sns_topic,
-                    args.region,
-                    args.tag_value
-                )
-                results.append(result)
-            else:
-                print(f"  No {service} resources found with tag {args.tag_key}={args.tag_value}, skipping")
+    run_targets(targets, args, account_id, discovery_cache)
+    results = [r for target in targets for r in target.results]
+    wall_clock = time.monotonic() - run_start
     
     # Print summary
     print("\n" + "=" * 60)
@@ -779,6 +3016,10 @@ Examples:
     updated = sum(1 for r in results if r.status == 'updated')
     no_change = sum(1 for r in results if r.status == 'no-change')
     failed = sum(1 for r in results if r.status == 'failed')
+    deleted = sum(1 for r in results if r.status == 'deleted')
+    dry_run = sum(1 for r in results if r.status == 'dry-run')
+    resumed = sum(1 for r in results if r.status == 'resumed')
+    failed_targets = [t for t in targets if t.error_message]
     
     total_alarms = sum(r.alarm_count for r in results if r.status != 'failed')
     total_stacks = len(results)
@@ -787,19 +3028,87 @@ Examples:
     print(f"✓ Updated: {updated} stack(s)")
     print(f"  No Change: {no_change} stack(s)")
     print(f"✗ Failed: {failed} stack(s)")
+    if deleted:
+        print(f"  Deleted: {deleted} empty shard stack(s)")
+    if dry_run:
+        print(f"  Dry Run: {dry_run} service(s), nothing applied")
+    if resumed:
+        print(f"  Resumed: {resumed} stack(s) already deployed by the journaled run")
     print(f"\nTotal Stacks: {total_stacks}")
     print(f"Total Alarms: {total_alarms}")
     
-    if failed > 0:
+    if multi_target:
+        print("\nPer Target:")
+        for target in targets:
+            target_failed = sum(1 for r in target.results if r.status == 'failed')
+            marker = '✗' if target.error_message or target_failed else '✓'
+            print(f"  {marker} {target.label}: {len(target.results)} stack(s), {target_failed} failed, "
+                  f"{target.duration_seconds:.1f}s")
+    
+    if discovery_cache is not None:
+        stats = discovery_cache.stats
+        print(f"Discovery Cache: {stats['hits']} hit(s), {stats['misses']} miss(es); "
+              f"tags reused for {stats['tags_reused']} resource(s), fetched for {stats['tags_fetched']}")
+    
+    api_calls = {}
+    for factory in [_default_clients()] + [t.clients for t in targets if t.clients is not None]:
+        for operation, count in factory.api_calls.items():
+            api_calls[operation] = api_calls.get(operation, 0) + count
+    if api_calls:
+        busiest = sorted(api_calls.items(), key=lambda item: -item[1])[:5]
+        print(f"API Calls: {sum(api_calls.values())} "
+              f"({', '.join(f'{operation} {count}' for operation, count in busiest)}"
+              f"{', ...' if len(api_calls) > len(busiest) else ''})")
+    
+    throttle_stats = {op: stats for op, stats in API_THROTTLE.stats.items()
+                      if stats['throttled'] or stats['rate_wait'] >= 0.1}
+    if throttle_stats:
+        print("API Waits:")
+        for operation, stats in sorted(throttle_stats.items(),
+                                       key=lambda item: -(item[1]['rate_wait'] + item[1]['backoff_wait'])):
+            print(f"  {operation}: {stats['calls']} call(s), {stats['rate_wait']:.1f}s rate-limited, "
+                  f"{stats['throttled']} throttled ({stats['backoff_wait']:.1f}s backoff)")
+    
+    # Serial stack time is what the same deployments cost back to back
+    serial_time = sum(r.duration_seconds for r in results)
+    speedup = serial_time / wall_clock if wall_clock > 0 else 1.0
+    parallelism = f"--max-parallel-stacks {args.max_parallel_stacks}"
+    if multi_target:
+        parallelism += f", --max-parallel-targets {args.max_parallel_targets}"
+    print(f"\nWall-clock: {wall_clock:.1f}s (serial stack time: {serial_time:.1f}s, "
+          f"{speedup:.1f}x with {parallelism})")
+    
+    if args.wait:
+        waited = [r for r in results if r.completion_seconds is not None]
+        if waited:
+            slowest = max(waited, key=lambda r: r.completion_seconds)
+            print(f"Slowest Stack: {slowest.stack_name} ({slowest.completion_seconds:.0f}s to complete)")
+    
+    if failed > 0 or failed_targets:
         print("\n⚠️  Failed Deployments:")
-        for r in results:
-            if r.status == 'failed':
-                print(f"  - {r.service}: {r.error_message}")
+        for target in targets:
+            prefix = f"{target.label} " if multi_target else ""
+            if target.error_message:
+                print(f"  - {target.label}: {target.error_message}")
+            for r in target.results:
+                if r.status == 'failed':
+                    print(f"  - {prefix}{r.service}: {r.error_message}")
+    
+    if RUN_JOURNAL.resume:
+        stats = RUN_JOURNAL.stats
+        print(f"Run Journal: {stats['resumed_stacks']} stack(s) and {stats['resumed_discoveries']} discovery "
+              f"result(s) reused from {args.journal}")
+    
+    if args.profile:
+        RUN_METRICS.print_profile()
+    for path in args.metrics_out:
+        RUN_METRICS.write(path, results)
+        print(f"📈 Metrics written to {path}")
     
     print("\n✅ Deployment complete!")
     
     # Exit with error code if any failures
-    sys.exit(1 if failed > 0 else 0)
+    sys.exit(1 if failed > 0 or failed_targets else 0)
 
 
 if __name__ == '__main__':
@@ -1,26 +1,85 @@
 #!/usr/bin/env python3
 """
 Simple CloudFormation template generator for resource-based alarms (no CDK required)
+
+Importable as a library: build_template() returns the template as a dict and
+render_template() serializes it as YAML, minified JSON, or compact JSON (the
+smallest equivalent form, for passing templates inline to CloudFormation).
+write_template() streams YAML or JSON straight to a file without building the
+whole template, for very large fleets. With consolidate='dimension' or 'tag',
+one GROUP BY alarm per metric and severity covers every resource instead of
+one alarm per resource. Logical IDs hash the resource and metric, so adding or
+removing a resource leaves every other alarm's ID alone. lint_template()
+checks a template offline against CloudFormation and CloudWatch rules. The
+command line is a thin wrapper around write_template().
 """
+import os
+import re
 import yaml
+import json
+import string
+import hashlib
 import argparse
+from functools import lru_cache
 
-def generate_alarm(service_config, resource_id, alarm_config, alarm_index, tag_value):
-    """Generate alarm using Metrics Insights SQL query"""
+CONFIG_FILE = 'alarm-config-resource-based.yaml'
+COMPILED_CONFIG_CACHE = os.path.join('.alarm-cache', 'compiled-alarm-config.json')
+COMPILED_CONFIG_VERSION = 2  # Bump when compile_alarm() output changes
+SERVICES = ['opensearch', 'kafka', 'rabbitmq', 'waf', 'docdb', 'alb']
+
+# Consolidated alarms: 'dimension' ORs the resource IDs together, 'tag' filters
+# on the resource tag; either way the query is grouped by the resource dimension
+CONSOLIDATE_MODES = ['dimension', 'tag']
+MAX_EXPRESSION_LENGTH = 2048  # Metrics Insights query limit per alarm
+
+# libyaml bindings when PyYAML was built with them: same output, much faster
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_OPTIONS = {'default_flow_style': False, 'allow_unicode': True, 'sort_keys': False}
+YAML_WIDTH = 80  # PyYAML's default line width
+OUTPUT_FORMATS = ['yaml', 'json', 'compact']
+STREAM_CHUNK = 256  # Alarms serialized per write when streaming
+LOGICAL_ID_DIGEST = 16  # Hex digits of the resource/metric hash in logical IDs
+
+# Limits checked by lint_template()
+MAX_STACK_RESOURCES = 500
+MAX_TEMPLATE_PARAMETERS = 200
+MAX_TEMPLATE_BYTES = 1000000  # Via TemplateURL; inline bodies go to S3 above 51,200 bytes
+MAX_LOGICAL_ID_LENGTH = 255
+MAX_ALARM_NAME_LENGTH = 255
+MAX_ALARM_DESCRIPTION_LENGTH = 1024
+MAX_ALARM_ACTIONS = 5
+COMPARISON_OPERATORS = {'GreaterThanOrEqualToThreshold', 'GreaterThanThreshold', 'LessThanThreshold',
+                        'LessThanOrEqualToThreshold', 'LessThanLowerOrGreaterThanUpperThreshold',
+                        'LessThanLowerThreshold', 'GreaterThanUpperThreshold'}
+TREAT_MISSING_DATA = {'breaching', 'notBreaching', 'ignore', 'missing'}
+METRICS_INSIGHTS_FUNCTIONS = {'AVG', 'COUNT', 'MAX', 'MIN', 'SUM'}
+
+# Mapping that holds values factored out by compact_template()
+SHARED_MAPPING = 'Shared'
+MAX_MAPPING_ATTRIBUTES = 200  # CloudFormation limit per mapping key
+
+
+def service_short_name(service_config):
+    """Short service name used in alarm names: MSK (Kafka) -> MSK"""
+    
+    return service_config['name'].split('(')[0].strip().replace(' ', '')
+
+
+def alarm_name_prefix(service_config, tag_value):
+    """Prefix shared by every alarm name generated for a service and tag value"""
+    
+    return f"{tag_value}-{service_short_name(service_config)}-"
+
+
+def compile_alarm(service_config, alarm_config):
+    """Precompute everything about an alarm that does not depend on the resource"""
     
     metric_name = alarm_config['metric']
     severity = alarm_config['severity']
-    threshold = alarm_config['threshold']
-    operator = alarm_config['operator']
-    description = alarm_config['description']
     
     # Create valid CloudFormation resource name (alphanumeric only)
     service_name_clean = service_config['name'].replace(' ', '').replace('(', '').replace(')', '').replace('-', '')
-    resource_name = f"{service_name_clean}{severity}Alarm{alarm_index}"
-    
-    # Use tag-value based naming with resource name included
-    service_short = service_config['name'].split('(')[0].strip().replace(' ', '')  # "MSK" from "MSK (Kafka)"
-    alarm_name = f"{tag_value}-{service_short}-{resource_id}-{metric_name}-{severity}"
     
     # Use Metrics Insights SQL query
     # Quote metric names with dots to avoid syntax errors
@@ -36,45 +95,176 @@ def generate_alarm(service_config, resource_id, alarm_config, alarm_index, tag_v
     else:
         dimension_name_quoted = dimension_name
     
-    expression = f'SELECT max({metric_name_quoted}) FROM "{service_config["namespace"]}" WHERE {dimension_name_quoted} = \'{resource_id}\''
+    # A fleet alarm watches the worst resource: the lowest value for
+    # less-than thresholds, the highest otherwise
+    if alarm_config['operator'].startswith('LessThan'):
+        fleet_select, fleet_order = 'min', 'ASC'
+    else:
+        fleet_select, fleet_order = 'max', 'DESC'
+    
+    return {
+        **alarm_config,
+        'resource_name_prefix': f"{service_name_clean}{severity}Alarm",
+        'alarm_name_suffix': f"-{metric_name}-{severity}",
+        'expression_prefix': f'SELECT max({metric_name_quoted}) FROM "{service_config["namespace"]}" '
+                             f'WHERE {dimension_name_quoted} = \'',
+        'fleet_expression_prefix': f'SELECT {fleet_select}({metric_name_quoted}) '
+                                   f'FROM "{service_config["namespace"]}" WHERE ',
+        'fleet_expression_suffix': f' GROUP BY {dimension_name_quoted} '
+                                   f'ORDER BY {fleet_select.upper()}() {fleet_order}',
+        'dimension_filter_prefix': f"{dimension_name_quoted} = '",
+    }
+
+
+def logical_id(spec, resource_id):
+    """Logical ID of one alarm, derived from service, severity, resource and metric only"""
+    
+    key = f"{spec['resource_name_prefix']}\0{resource_id}\0{spec['metric']}"
+    return f"{spec['resource_name_prefix']}{hashlib.sha256(key.encode('utf-8')).hexdigest()[:LOGICAL_ID_DIGEST]}"
+
+
+def _alarm_from_spec(spec, name_prefix, resource_id):
+    """Fill a compiled alarm spec in for one resource"""
     
     alarm = {
         'Type': 'AWS::CloudWatch::Alarm',
         'Properties': {
-            'AlarmName': alarm_name,
-            'AlarmDescription': description,
+            'AlarmName': f"{name_prefix}{resource_id}{spec['alarm_name_suffix']}",
+            'AlarmDescription': spec['description'],
             'Metrics': [{
                 'Id': 'm1',
                 'ReturnData': True,
-                'Expression': expression,
+                'Expression': f"{spec['expression_prefix']}{resource_id}'",
                 'Period': 300
             }],
-            'Threshold': threshold,
-            'ComparisonOperator': operator,
+            'Threshold': spec['threshold'],
+            'ComparisonOperator': spec['operator'],
             'EvaluationPeriods': 2,
             'TreatMissingData': 'notBreaching',
             'AlarmActions': [{'Ref': 'SNSTopicArn'}]
         }
     }
     
+    return logical_id(spec, resource_id), alarm
+
+
+def _fleet_alarm_from_spec(spec, name_prefix, label, where, resource_count):
+    """Fill a compiled alarm spec in for a group of resources selected by a WHERE clause.
+    
+    resource_count is None when the group is a tag query, whose template
+    must not change as resources are tagged and untagged.
+    """
+    
+    resource_name, alarm = _alarm_from_spec(spec, name_prefix, label)
+    properties = alarm['Properties']
+    if resource_count is not None:
+        properties['AlarmDescription'] = f"{spec['description']} ({resource_count} resources)"
+    properties['Metrics'][0]['Expression'] = (f"{spec['fleet_expression_prefix']}{where}"
+                                              f"{spec['fleet_expression_suffix']}")
     return resource_name, alarm
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Generate resource-based alarm template')
-    parser.add_argument('--service', required=True, choices=['opensearch', 'kafka', 'rabbitmq', 'waf', 'docdb', 'alb'])
-    parser.add_argument('--tag-value', required=True, help='Tag value for alarm naming')
-    parser.add_argument('--resources', nargs='+', required=True, help='Resource IDs')
-    args = parser.parse_args()
+def _tag_filter(tag_key, tag_value):
+    key = tag_key if tag_key.replace('_', '').isalnum() else f'"{tag_key}"'
+    return f"tag.{key} = '{tag_value}'"
+
+
+def dimension_filters(service_config, resource_ids):
+    """OR-ed dimension filters covering resource_ids, each short enough for every alarm's query"""
+    
+    specs = service_config['alarms']
+    budget = MAX_EXPRESSION_LENGTH - max(
+        len(spec['fleet_expression_prefix']) + len(spec['fleet_expression_suffix']) for spec in specs)
+    filter_prefix = specs[0]['dimension_filter_prefix']
     
-    # Load service configuration
-    with open('alarm-config-resource-based.yaml', 'r', encoding='utf-8', errors='ignore') as f:
-        config = yaml.safe_load(f)
+    filters, current, length = [], [], 0
+    for resource_id in resource_ids:
+        condition = f"{filter_prefix}{resource_id}'"
+        added = len(condition) + (4 if current else 0)  # ' OR '
+        if current and length + added > budget:
+            filters.append(' OR '.join(current))
+            current, length = [], 0
+            added = len(condition)
+        current.append(condition)
+        length += added
+    if current:
+        filters.append(' OR '.join(current))
+    return filters
+
+
+def generate_alarm(service_config, resource_id, alarm_config, alarm_index, tag_value):
+    """Generate alarm using Metrics Insights SQL query (alarm_index no longer affects the logical ID)"""
+    
+    # Use tag-value based naming with resource name included
+    return _alarm_from_spec(compile_alarm(service_config, alarm_config),
+                            alarm_name_prefix(service_config, tag_value), resource_id)
+
+
+@lru_cache(maxsize=None)
+def load_config(config_file=CONFIG_FILE):
+    """Load the resource-based alarm configuration (parsed once per process)"""
+    
+    with open(config_file, 'r', encoding='utf-8', errors='ignore') as f:
+        return yaml.load(f, Loader=YAML_LOADER)
+
+
+def compile_config(config):
+    """Compile a loaded configuration into per-service alarm specs.
     
-    service_config = config['services'][args.service]
+    Compiled services keep every raw key, so they can be used wherever the
+    plain configuration is expected.
+    """
     
-    # Build template
-    template = {
+    if config.get('compiled') == COMPILED_CONFIG_VERSION:
+        return config
+    return {
+        'compiled': COMPILED_CONFIG_VERSION,
+        'services': {
+            service: {**service_config,
+                      'alarms': [compile_alarm(service_config, alarm) for alarm in service_config['alarms']]}
+            for service, service_config in config['services'].items()
+        }
+    }
+
+
+@lru_cache(maxsize=None)
+def load_compiled(config_file=CONFIG_FILE, cache_file=COMPILED_CONFIG_CACHE):
+    """Compiled alarm configuration, cached on disk by the config file's hash.
+    
+    A cache written for the same file content is read back as JSON, skipping
+    both the YAML parse and the compilation.
+    """
+    
+    with open(config_file, 'rb') as f:
+        source_hash = hashlib.sha256(f.read()).hexdigest()
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('source_hash') == source_hash and cached.get('compiled') == COMPILED_CONFIG_VERSION:
+            return cached
+    except (OSError, ValueError):
+        pass
+    
+    compiled = {**compile_config(load_config(config_file)), 'source_hash': source_hash}
+    try:
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(compiled, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # A read-only checkout still works, it just compiles every run
+    return compiled
+
+
+def template_header(service, config=None):
+    """Every template section except Resources"""
+    
+    if config is None:
+        config = load_compiled()
+    service_config = config['services'][service]
+    
+    return {
         'AWSTemplateFormatVersion': '2010-09-09',
         'Description': f'{service_config["name"]} CloudWatch Alarms',
         'Parameters': {
@@ -84,26 +274,556 @@ def main():
                 'AllowedPattern': 'arn:aws:sns:[a-z0-9-]+:[0-9]{12}:.+',
                 'ConstraintDescription': 'Must be a valid SNS Topic ARN'
             }
-        },
-        'Resources': {}
+        }
     }
+
+
+def iter_alarms(service, resource_ids, tag_value, config=None, consolidate=None, tag_key=None):
+    """Yield (logical ID, alarm resource) for every alarm of every resource.
+    
+    With consolidate='dimension', each metric and severity gets one alarm per
+    group of resource IDs that fits in a query; with consolidate='tag', one
+    alarm over every resource tagged tag_key=tag_value.
+    """
+    
+    config = load_compiled() if config is None else compile_config(config)
+    service_config = config['services'][service]
+    name_prefix = alarm_name_prefix(service_config, tag_value)
+    
+    if consolidate == 'tag':
+        if not tag_key:
+            raise ValueError("consolidate='tag' needs a tag_key")
+        groups = [('fleet', _tag_filter(tag_key, tag_value), None)]
+    elif consolidate == 'dimension':
+        filters = dimension_filters(service_config, resource_ids)
+        groups = [(f'fleet-{i + 1}', where, where.count(' OR ') + 1) for i, where in enumerate(filters)]
+    elif consolidate is not None:
+        raise ValueError(f"Unknown consolidate mode {consolidate!r}, expected one of {CONSOLIDATE_MODES}")
+    if consolidate is not None:
+        for label, where, resource_count in groups:
+            for spec in service_config['alarms']:
+                yield _fleet_alarm_from_spec(spec, name_prefix, label, where, resource_count)
+        return
     
     # Generate alarms for each resource
-    alarm_index = 0
-    for resource_id in args.resources:
-        for alarm_config in service_config['alarms']:
-            resource_name, alarm = generate_alarm(service_config, resource_id, alarm_config, alarm_index, args.tag_value)
-            template['Resources'][resource_name] = alarm
-            alarm_index += 1
+    for resource_id in resource_ids:
+        for spec in service_config['alarms']:
+            yield _alarm_from_spec(spec, name_prefix, resource_id)
+
+
+def build_template(service, resource_ids, tag_value, config=None, consolidate=None, tag_key=None):
+    """Build the CloudFormation template for a service's resources as a dict"""
+    
+    template = template_header(service, config)
+    template['Resources'] = dict(iter_alarms(service, resource_ids, tag_value, config, consolidate, tag_key))
+    return template
+
+
+def _yaml(value, width=YAML_WIDTH):
+    return yaml.dump(value, Dumper=YAML_DUMPER, width=width, **YAML_OPTIONS)
+
+
+def render_template(template, output_format='yaml'):
+    """Serialize a template as YAML, minified JSON, or compact JSON"""
+    
+    if output_format == 'json':
+        return _minified(template)
+    if output_format == 'compact':
+        return render_compact(template)
+    return _yaml(template)
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _indented(body):
+    return ''.join(f'  {line}' if line.strip() else line for line in body.splitlines(True))
+
+
+def write_template(stream, service, resource_ids, tag_value, output_format='yaml', config=None,
+                   consolidate=None, tag_key=None):
+    """Write a template to a text stream and return its alarm count.
+    
+    YAML and JSON are streamed a chunk of alarms at a time, so memory stays
+    flat however many resources there are; the output is identical to
+    render_template(). Compact JSON has to see every value before it can
+    factor them, so it is built in memory.
+    """
+    
+    if output_format == 'compact':
+        template = build_template(service, resource_ids, tag_value, config, consolidate, tag_key)
+        stream.write(render_compact(template))
+        return len(template['Resources'])
+    
+    header = template_header(service, config)
+    alarms = iter_alarms(service, resource_ids, tag_value, config, consolidate, tag_key)
+    
+    count = 0
+    if output_format == 'json':
+        stream.write(_minified(header)[:-1] + ',"Resources":{')
+        for resource_name, alarm in alarms:
+            stream.write(('' if count == 0 else ',') + _minified(resource_name) + ':' + _minified(alarm))
+            count += 1
+        stream.write('}}')
+        return count
+    
+    stream.write(_yaml(header))
+    for chunk in _chunks(alarms, STREAM_CHUNK):
+        if count == 0:
+            stream.write('Resources:\n')
+        # Dumped two columns narrower, then indented under Resources, so lines
+        # wrap exactly where a single dump of the whole template wraps them
+        stream.write(_indented(_yaml(dict(chunk), width=YAML_WIDTH - 2)))
+        count += len(chunk)
+    if count == 0:
+        stream.write('Resources: {}\n')
+    return count
+
+
+def _minified(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def _short_name(index):
+    """Alphanumeric mapping key: a..z, A..Z, 0..9, then two characters and up"""
+    
+    alphabet = string.ascii_letters + string.digits
+    name = alphabet[index % 52]
+    index //= 52
+    while index:
+        index -= 1
+        name += alphabet[index % len(alphabet)]
+        index //= len(alphabet)
+    return name
+
+
+def _factorable_strings(value):
+    """Plain string values that may be replaced by Fn::FindInMap.
+    
+    Intrinsic functions are left alone: their arguments (a Fn::Sub template,
+    a Ref target) must stay literal.
+    """
+    
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            yield from _factorable_strings(item)
+    elif isinstance(value, dict) and not any(k == 'Ref' or k.startswith('Fn::') for k in value):
+        for item in value.values():
+            yield from _factorable_strings(item)
+
+
+def _replace_strings(value, refs):
+    if isinstance(value, str):
+        return refs.get(value, value)
+    if isinstance(value, list):
+        return [_replace_strings(item, refs) for item in value]
+    if isinstance(value, dict) and not any(k == 'Ref' or k.startswith('Fn::') for k in value):
+        return {k: _replace_strings(v, refs) for k, v in value.items()}
+    return value
+
+
+def compact_template(template):
+    """Copy of a template with repeated strings written once, in a Mapping.
+    
+    Each string property value that repeats is moved into the Shared mapping
+    and referenced with Fn::FindInMap, but only where that makes the minified
+    JSON smaller. Values inside intrinsic functions and short values (a
+    FindInMap reference costs about 30 bytes) stay inline.
+    """
+    
+    counts = {}
+    for resource in template.get('Resources', {}).values():
+        for value in _factorable_strings(resource.get('Properties', {})):
+            counts[value] = counts.get(value, 0) + 1
+    
+    # Most valuable first, so they get the shortest keys
+    candidates = sorted(counts, key=lambda v: -counts[v] * len(_minified(v).encode('utf-8')))
+    shared, refs = {}, {}
+    for value in candidates:
+        index = len(refs)
+        group, key = f'G{index // MAX_MAPPING_ATTRIBUTES}', _short_name(index % MAX_MAPPING_ATTRIBUTES)
+        ref = {'Fn::FindInMap': [SHARED_MAPPING, group, key]}
+        inline = len(_minified(value).encode('utf-8'))
+        saving = counts[value] * (inline - len(_minified(ref))) - (inline + len(_minified(key)) + 2)
+        if saving <= 0:
+            continue
+        shared.setdefault(group, {})[key] = value
+        refs[value] = ref
+    
+    if not refs:
+        return template
+    compacted = dict(template)
+    compacted['Mappings'] = {**template.get('Mappings', {}), SHARED_MAPPING: shared}
+    compacted['Resources'] = {
+        name: {**resource, 'Properties': _replace_strings(resource['Properties'], refs)}
+        if 'Properties' in resource else resource
+        for name, resource in template['Resources'].items()
+    }
+    return compacted
+
+
+def expand_template(template):
+    """Inverse of compact_template(): resolve Shared FindInMap references"""
+    
+    shared = template.get('Mappings', {}).get(SHARED_MAPPING)
+    if shared is None:
+        return template
+    
+    def resolve(value):
+        if isinstance(value, list):
+            return [resolve(item) for item in value]
+        if isinstance(value, dict):
+            if list(value) == ['Fn::FindInMap'] and value['Fn::FindInMap'][0] == SHARED_MAPPING:
+                _, group, key = value['Fn::FindInMap']
+                return shared[group][key]
+            return {k: resolve(v) for k, v in value.items()}
+        return value
+    
+    expanded = {section: resolve(content) for section, content in template.items() if section != 'Mappings'}
+    mappings = {k: v for k, v in template['Mappings'].items() if k != SHARED_MAPPING}
+    if mappings:
+        expanded['Mappings'] = mappings
+    return expanded
+
+
+def render_compact(template):
+    """Serialize a template as minified JSON with repeated values factored out"""
+    
+    return _minified(compact_template(template))
+
+
+_SQL_TOKEN = re.compile(r"""\s*(?:(?P<string>'(?:[^'\\]|\\.)*')|(?P<quoted>"(?:[^"\\]|\\.)*")"""
+                        r"""|(?P<name>[A-Za-z_][A-Za-z0-9_]*)|(?P<number>\d+)|(?P<op>!=|[=(),.*/:-])|(?P<bad>\S))""")
+_SQL_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_SUB_VARIABLE = re.compile(r'\$\{([^!}][^}]*)\}')
+_LOGICAL_ID = re.compile(r'[A-Za-z0-9]+')
+_METRIC_ID = re.compile(r'[a-z][A-Za-z0-9_]*')
+
+
+@lru_cache(maxsize=4096)
+def _sql_problem(skeleton):
+    """First problem in a Metrics Insights query whose string literals are emptied, or None.
+    
+    Every resource's query for the same metric has the same skeleton, so a
+    fleet of thousands of alarms parses only a handful of distinct queries.
+    """
+    
+    tokens = []
+    for match in _SQL_TOKEN.finditer(skeleton):
+        kind = match.lastgroup
+        if kind == 'bad':
+            return f"unterminated {match.group(kind)}" if match.group(kind) in '\'"' else \
+                f"unexpected {match.group(kind)!r}"
+        tokens.append((kind, match.group(kind)))
+    position = 0
+    
+    def peek(offset=0):
+        return tokens[position + offset] if position + offset < len(tokens) else (None, '')
+    
+    def keyword(*words):
+        nonlocal position
+        kind, text = peek()
+        if kind == 'name' and text.upper() in words:
+            position += 1
+            return text.upper()
+        return None
+    
+    def expect(text, what):
+        nonlocal position
+        if peek()[1] != text:
+            raise ValueError(f"expected {what}, found {peek()[1] or 'end of query'!r}")
+        position += 1
+    
+    def identifier(what, dotted=False):
+        nonlocal position
+        kind, text = peek()
+        if kind not in ('name', 'quoted'):
+            raise ValueError(f"expected {what}, found {text or 'end of query'!r}")
+        position += 1
+        if kind == 'name' and peek()[1] == '.' and dotted and text.lower() == 'tag':
+            position += 1
+            return identifier(f'tag key after {text}.')
+        if kind == 'name' and peek()[1] in ('.', '/', ':', '-'):
+            name = text
+            while peek()[0] in ('name', 'number', 'op') and peek()[1] not in ('=', '!=', '(', ')', ','):
+                name += peek()[1]
+                position += 1
+            raise ValueError(f"{what} {name} must be double-quoted")
+        return text
+    
+    def condition():
+        nonlocal position
+        while True:
+            if peek()[1] == '(':
+                position += 1
+                condition()
+                expect(')', "')'")
+            else:
+                identifier('dimension', dotted=True)
+                if peek()[1] not in ('=', '!='):
+                    raise ValueError(f"expected = or != after dimension, found {peek()[1] or 'end of query'!r}")
+                position += 1
+                if peek()[0] != 'string':
+                    raise ValueError(f"expected a 'quoted' value, found {peek()[1] or 'end of query'!r}")
+                position += 1
+            if not keyword('AND', 'OR'):
+                return
+    
+    def function():
+        name = keyword(*METRICS_INSIGHTS_FUNCTIONS)
+        if not name:
+            raise ValueError(f"expected one of {', '.join(sorted(METRICS_INSIGHTS_FUNCTIONS))}, "
+                             f"found {peek()[1] or 'end of query'!r}")
+        return name
+    
+    try:
+        if not keyword('SELECT'):
+            raise ValueError("query must start with SELECT")
+        function()
+        expect('(', "'('")
+        if peek()[1] == '*':
+            position += 1
+        else:
+            identifier('metric name')
+        expect(')', "')'")
+        if not keyword('FROM'):
+            raise ValueError(f"expected FROM, found {peek()[1] or 'end of query'!r}")
+        if keyword('SCHEMA'):
+            expect('(', "'('")
+            identifier('namespace')
+            while peek()[1] == ',':
+                position += 1
+                identifier('schema dimension')
+            expect(')', "')'")
+        else:
+            identifier('namespace')
+        if keyword('WHERE'):
+            condition()
+        if keyword('GROUP'):
+            if not keyword('BY'):
+                raise ValueError("expected BY after GROUP")
+            identifier('GROUP BY key', dotted=True)
+            while peek()[1] == ',':
+                position += 1
+                identifier('GROUP BY key', dotted=True)
+        if keyword('ORDER'):
+            if not keyword('BY'):
+                raise ValueError("expected BY after ORDER")
+            function()
+            expect('(', "'('")
+            expect(')', "')'")
+            keyword('ASC', 'DESC')
+        if keyword('LIMIT'):
+            if peek()[0] != 'number':
+                raise ValueError("expected a number after LIMIT")
+            position += 1
+        if position < len(tokens):
+            raise ValueError(f"unexpected {peek()[1]!r}")
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def _substituted(value, values):
+    """A string or Fn::Sub with known parameter values filled in; None if it cannot be resolved"""
+    
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict) and list(value) == ['Fn::Sub']:
+        body = value['Fn::Sub']
+        variables = dict(values)
+        if isinstance(body, list):
+            body, extra = body
+            variables.update({k: v for k, v in extra.items() if isinstance(v, str)})
+        if isinstance(body, str):
+            return _SUB_VARIABLE.sub(lambda m: variables.get(m.group(1), m.group(0)), body)
+    return None
+
+
+def _references(value):
+    """Names referenced by Ref or Fn::Sub in a property value"""
+    
+    if isinstance(value, dict):
+        if list(value) == ['Ref']:
+            return [value['Ref']]
+        if list(value) == ['Fn::Sub']:
+            body = value['Fn::Sub']
+            if isinstance(body, list):
+                return [name for name in _SUB_VARIABLE.findall(body[0]) if name not in body[1]]
+            return _SUB_VARIABLE.findall(body)
+    if isinstance(value, list):
+        return [name for item in value for name in _references(item)]
+    return []
+
+
+def lint_template(template, parameters=None, template_size=None, resources=None,
+                  max_resources=MAX_STACK_RESOURCES):
+    """Check a rendered template for mistakes CloudFormation would only report after a rollback.
+    
+    Covers Metrics Insights query syntax and quoting, alarm name length and
+    uniqueness, logical IDs, resource, parameter and size limits, unresolved
+    references, and (when parameters, a list of ParameterKey/ParameterValue
+    pairs, are given) parameters that are missing or unknown. resources, an
+    iterable of (logical ID, resource), replaces template['Resources'] so a
+    streamed fleet can be checked without building it; max_resources=None
+    skips the per-stack resource limit for alarms not deployed as a stack.
+    Returns the problems
+    found, as messages; an empty list means the template passed.
+    """
+    
+    template = expand_template(template)
+    problems = []
+    declared = template.get('Parameters') or {}
+    values = {}
+    if parameters is not None:
+        values = {p['ParameterKey']: p['ParameterValue'] for p in parameters}
+        problems += [f"Parameter {name} is passed but not declared" for name in values if name not in declared]
+        problems += [f"Parameter {name} has no default and is not passed" for name, spec in declared.items()
+                     if name not in values and 'Default' not in spec]
+    if len(declared) > MAX_TEMPLATE_PARAMETERS:
+        problems.append(f"{len(declared)} parameters, over the {MAX_TEMPLATE_PARAMETERS} limit")
+    if template_size is not None and template_size > MAX_TEMPLATE_BYTES:
+        problems.append(f"Template is {template_size:,} bytes, over the {MAX_TEMPLATE_BYTES:,} byte limit")
+    
+    if resources is None:
+        resources = (template.get('Resources') or {}).items()
+    resource_names = set()
+    references = []
+    alarm_names = {}
+    count = 0
+    for name, resource in resources:
+        count += 1
+        resource_names.add(name)
+        if len(name) > MAX_LOGICAL_ID_LENGTH or not _LOGICAL_ID.fullmatch(name):
+            problems.append(f"{name}: logical ID must be alphanumeric and at most {MAX_LOGICAL_ID_LENGTH} characters")
+        if resource.get('Type') != 'AWS::CloudWatch::Alarm':
+            continue
+        properties = resource.get('Properties') or {}
+        
+        alarm_name = _substituted(properties.get('AlarmName'), values)
+        if alarm_name is not None:
+            if len(alarm_name) > MAX_ALARM_NAME_LENGTH and (parameters is not None or '${' not in alarm_name):
+                problems.append(f"{name}: AlarmName is {len(alarm_name)} characters, "
+                                f"over the {MAX_ALARM_NAME_LENGTH} limit: {alarm_name[:60]}...")
+            if alarm_name in alarm_names:
+                problems.append(f"{name}: AlarmName {alarm_name} duplicates {alarm_names[alarm_name]}")
+            alarm_names[alarm_name] = name
+        description = properties.get('AlarmDescription')
+        if isinstance(description, str) and len(description) > MAX_ALARM_DESCRIPTION_LENGTH:
+            problems.append(f"{name}: AlarmDescription is over {MAX_ALARM_DESCRIPTION_LENGTH} characters")
+        if properties.get('ComparisonOperator') not in COMPARISON_OPERATORS:
+            problems.append(f"{name}: unknown ComparisonOperator {properties.get('ComparisonOperator')!r}")
+        if properties.get('TreatMissingData', 'missing') not in TREAT_MISSING_DATA:
+            problems.append(f"{name}: unknown TreatMissingData {properties.get('TreatMissingData')!r}")
+        evaluation_periods = properties.get('EvaluationPeriods')
+        if not isinstance(evaluation_periods, int) or evaluation_periods < 1:
+            problems.append(f"{name}: EvaluationPeriods must be a positive integer")
+        if 'ThresholdMetricId' not in properties and (
+                isinstance(properties.get('Threshold'), bool) or
+                not isinstance(properties.get('Threshold'), (int, float))):
+            problems.append(f"{name}: Threshold must be a number")
+        if len(properties.get('AlarmActions') or []) > MAX_ALARM_ACTIONS:
+            problems.append(f"{name}: more than {MAX_ALARM_ACTIONS} AlarmActions")
+        for key in ('AlarmName', 'AlarmActions', 'OKActions', 'InsufficientDataActions'):
+            references += [(name, key, ref) for ref in _references(properties.get(key))]
+        
+        metrics = properties.get('Metrics')
+        if metrics is None:
+            if not properties.get('MetricName') or not properties.get('Namespace'):
+                problems.append(f"{name}: needs Metrics or MetricName and Namespace")
+            continue
+        if sum(1 for metric in metrics if metric.get('ReturnData', True)) != 1:
+            problems.append(f"{name}: exactly one entry in Metrics must have ReturnData true")
+        metric_ids = set()
+        for metric in metrics:
+            metric_id = metric.get('Id', '')
+            if not _METRIC_ID.fullmatch(metric_id) or metric_id in metric_ids:
+                problems.append(f"{name}: metric Id {metric_id!r} must be unique and start with a lowercase letter")
+            metric_ids.add(metric_id)
+            period = metric.get('Period', 60)
+            if 'Expression' in metric and (not isinstance(period, int) or
+                                           (period not in (10, 20, 30) and period % 60)):
+                problems.append(f"{name}: Period {period!r} must be 10, 20, 30 or a multiple of 60")
+            references += [(name, 'Expression', ref) for ref in _references(metric.get('Expression'))]
+            expression = _substituted(metric.get('Expression'), values)
+            if expression is None or not expression.lstrip().upper().startswith('SELECT'):
+                continue
+            if len(expression) > MAX_EXPRESSION_LENGTH:
+                problems.append(f"{name}: Metrics Insights query is {len(expression)} characters, "
+                                f"over the {MAX_EXPRESSION_LENGTH} limit")
+            # Unresolved ${Param} placeholders stand in for quoted values or plain names
+            skeleton = _SUB_VARIABLE.sub('Param', expression) if '${' in expression else expression
+            problem = _sql_problem(_SQL_LITERAL.sub("''", skeleton))
+            if problem:
+                problems.append(f"{name}: Metrics Insights query: {problem}: {expression[:80]}")
+    
+    problems += [f"{name}: {key} references undefined {ref}" for name, key, ref in references
+                 if ref not in declared and ref not in resource_names and not ref.startswith('AWS::')]
+    if count == 0:
+        problems.append("Template has no resources")
+    if max_resources is not None and count > max_resources:
+        problems.append(f"{count} resources, over the {max_resources} per-stack limit")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate resource-based alarm template')
+    parser.add_argument('--service', required=True, choices=SERVICES)
+    parser.add_argument('--tag-value', required=True, help='Tag value for alarm naming')
+    resources = parser.add_mutually_exclusive_group(required=True)
+    resources.add_argument('--resources', nargs='+', help='Resource IDs')
+    resources.add_argument('--resources-file', help='File with one resource ID per line')
+    parser.add_argument('--config', default=CONFIG_FILE, help=f'Alarm configuration (default: {CONFIG_FILE})')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='yaml',
+                        help='yaml, minified json, or compact json with repeated values factored out '
+                             'as the deployer sends it (default: yaml)')
+    parser.add_argument('--consolidate', choices=CONSOLIDATE_MODES,
+                        help='One GROUP BY alarm per metric and severity for all resources, selected by '
+                             'OR-ed dimension values or by the --tag-key tag (default: one alarm per resource)')
+    parser.add_argument('--tag-key', help='Tag key for --consolidate tag')
+    parser.add_argument('--output', help='Output file (default: cloudformation-<service>-alarms-generated.yaml, '
+                                         'or .json for the JSON formats)')
+    args = parser.parse_args()
+    if args.consolidate == 'tag' and not args.tag_key:
+        parser.error("--consolidate tag requires --tag-key")
+    
+    resource_ids = args.resources
+    if args.resources_file:
+        with open(args.resources_file, 'r', encoding='utf-8') as f:
+            resource_ids = [line.strip() for line in f if line.strip()]
     
     # Write template
-    output_file = f'cloudformation-{args.service}-alarms-generated.yaml'
+    extension = 'yaml' if args.format == 'yaml' else 'json'
+    output_file = args.output or f'cloudformation-{args.service}-alarms-generated.{extension}'
+    config = load_compiled(args.config)
     with open(output_file, 'w', encoding='utf-8') as f:
-        yaml.dump(template, f, default_flow_style=False, allow_unicode=True, sort_keys=False)
+        alarm_count = write_template(f, args.service, resource_ids, args.tag_value, args.format,
+                                     config, args.consolidate, args.tag_key)
+    size = os.path.getsize(output_file)
+    problems = lint_template(template_header(args.service, config), template_size=size,
+                             resources=iter_alarms(args.service, resource_ids, args.tag_value, config,
+                                                   args.consolidate, args.tag_key))
     
     print(f"Generated {output_file}")
-    print(f"   Resources: {len(args.resources)}")
-    print(f"   Alarms: {alarm_index}")
+    print(f"   Resources: {len(resource_ids)}")
+    print(f"   Alarms: {alarm_count}")
+    print(f"   Size: {size:,} bytes")
+    if problems:
+        print(f"✗ Lint: {len(problems)} problem(s)")
+        for problem in problems:
+            print(f"   {problem}")
+        raise SystemExit(1)
+    print("   Lint: passed")
 
 
 if __name__ == '__main__':